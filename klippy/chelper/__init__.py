@@ -21,7 +21,8 @@ SOURCE_FILES = [
     'itersolve.c', 'trapq.c', 'pollreactor.c', 'msgblock.c', 'trdispatch.c',
     'kin_cartesian.c', 'kin_corexy.c', 'kin_corexz.c', 'kin_delta.c',
     'kin_deltesian.c', 'kin_polar.c', 'kin_rotary_delta.c', 'kin_winch.c',
-    'kin_extruder.c', 'kin_shaper.c', 'kin_idex.c', 'kin_generic.c'
+    'kin_extruder.c', 'kin_shaper.c', 'kin_idex.c', 'kin_generic.c',
+    'lookahead.c', 'stepgen.c', 'bulkqueue.c'
 ]
 DEST_LIB = "c_helper.so"
 OTHER_FILES = [
@@ -35,6 +36,10 @@ defs_stepcompress = """
         int64_t start_position;
         int step_count, interval, add;
     };
+    struct stepcompress_stats {
+        uint64_t step_count, queue_step_count, solver_iterations;
+        double solve_time, compress_time;
+    };
 
     struct stepcompress *stepcompress_alloc(uint32_t oid);
     void stepcompress_fill(struct stepcompress *sc, uint32_t max_error
@@ -56,6 +61,8 @@ defs_stepcompress = """
         , uint64_t start_clock, uint64_t end_clock);
     void stepcompress_set_stepper_kinematics(struct stepcompress *sc
         , struct stepper_kinematics *sk);
+    void stepcompress_get_stats(struct stepcompress *sc
+        , struct stepcompress_stats *stats);
     struct stepper_kinematics *stepcompress_get_stepper_kinematics(
         struct stepcompress *sc);
 """
@@ -72,6 +79,15 @@ defs_steppersync = """
     int steppersync_flush(struct steppersync *ss, uint64_t move_clock);
 """
 
+defs_stepgen = """
+    struct stepgen_pool *stepgen_pool_alloc(int num_threads);
+    void stepgen_pool_free(struct stepgen_pool *sp);
+    void stepgen_pool_generate_steps(struct stepgen_pool *sp
+        , struct steppersync **ss_list, uint64_t *flush_clocks
+        , int32_t *results, double *gen_times, int ss_num
+        , double gen_steps_time);
+"""
+
 defs_itersolve = """
     double itersolve_check_active(struct stepper_kinematics *sk
         , double flush_time);
@@ -111,6 +127,18 @@ defs_trapq = """
         , double start_time, double end_time);
 """
 
+defs_lookahead = """
+    struct lookahead *lookahead_alloc(void);
+    void lookahead_free(struct lookahead *la);
+    void lookahead_reset(struct lookahead *la);
+    int lookahead_add_move(struct lookahead *la, double max_start_v2
+        , double delta_v2, double max_smoothed_v2, double smooth_delta_v2
+        , double max_cruise_v2);
+    int lookahead_flush(struct lookahead *la, int lazy);
+    void lookahead_pop_moves(struct lookahead *la, double *junctions
+        , int count);
+"""
+
 defs_kin_cartesian = """
     struct stepper_kinematics *cartesian_stepper_alloc(char axis);
 """
@@ -222,6 +250,21 @@ defs_trdispatch = """
         , uint64_t expire_ticks, uint64_t min_extend_ticks);
 """
 
+defs_bulkqueue = """
+    struct bulkqueue_data {
+        uint8_t *data;
+        uint16_t *sequences, *lengths;
+        int data_len, msg_count;
+    };
+
+    struct bulkqueue *bulkqueue_alloc(struct serialqueue *sq
+        , uint32_t data_msgtag, uint32_t oid);
+    void bulkqueue_start(struct bulkqueue *bq);
+    void bulkqueue_stop(struct bulkqueue *bq);
+    void bulkqueue_pull(struct bulkqueue *bq, struct bulkqueue_data *bd);
+    void bulkqueue_free(struct bulkqueue *bq);
+"""
+
 defs_pyhelper = """
     void set_python_logging_callback(void (*func)(const char *));
     double get_monotonic(void);
@@ -238,7 +281,7 @@ defs_all = [
     defs_kin_cartesian, defs_kin_corexy, defs_kin_corexz, defs_kin_delta,
     defs_kin_deltesian, defs_kin_polar, defs_kin_rotary_delta, defs_kin_winch,
     defs_kin_extruder, defs_kin_shaper, defs_kin_idex,
-    defs_kin_generic_cartesian,
+    defs_kin_generic_cartesian, defs_lookahead, defs_stepgen, defs_bulkqueue,
 ]
 
 # Update filenames to an absolute path
@@ -0,0 +1,187 @@
+// Storage of bulk sensor data messages
+//
+// Copyright (C) 2026  agent <agent@local>
+//
+// This file may be distributed under the terms of the GNU GPLv3 license.
+
+// The "sensor_bulk_data" messages of a sensor are parsed in the
+// serialqueue background thread and their contents are appended to a
+// contiguous buffer.  The host code periodically takes all the
+// accumulated data at once instead of parsing each message in Python.
+
+#include <pthread.h> // pthread_mutex_lock
+#include <stddef.h> // offsetof
+#include <stdlib.h> // malloc
+#include <string.h> // memset
+#include "compiler.h" // ARRAY_SIZE
+#include "msgblock.h" // msgblock_parse_int
+#include "pyhelper.h" // errorf
+#include "serialqueue.h" // serialqueue_add_fastreader
+
+struct bulkqueue_buffer {
+    uint8_t *data;
+    uint16_t *sequences, *lengths;
+    int data_len, data_size, msg_count, msg_size;
+};
+
+struct bulkqueue {
+    struct fastreader fr;
+    struct serialqueue *sq;
+    int is_active;
+
+    pthread_mutex_t lock; // protects variables below
+    struct bulkqueue_buffer bufs[2];
+    int fill_buf;
+};
+
+struct bulkqueue_data {
+    uint8_t *data;
+    uint16_t *sequences, *lengths;
+    int data_len, msg_count;
+};
+
+// Add a message to a buffer (growing the buffer if needed)
+static int
+buffer_append(struct bulkqueue_buffer *b, uint16_t sequence
+              , uint8_t *data, int len)
+{
+    if (b->msg_count >= b->msg_size) {
+        int new_size = b->msg_size ? b->msg_size * 2 : 64;
+        uint16_t *seqs = realloc(b->sequences, new_size * sizeof(*seqs));
+        if (!seqs)
+            return -1;
+        b->sequences = seqs;
+        uint16_t *lens = realloc(b->lengths, new_size * sizeof(*lens));
+        if (!lens)
+            return -1;
+        b->lengths = lens;
+        b->msg_size = new_size;
+    }
+    if (b->data_len + len > b->data_size) {
+        int new_size = b->data_size ? b->data_size * 2 : 64 * MESSAGE_MAX;
+        uint8_t *new_data = realloc(b->data, new_size);
+        if (!new_data)
+            return -1;
+        b->data = new_data;
+        b->data_size = new_size;
+    }
+    memcpy(&b->data[b->data_len], data, len);
+    b->data_len += len;
+    b->sequences[b->msg_count] = sequence;
+    b->lengths[b->msg_count] = len;
+    b->msg_count++;
+    return 0;
+}
+
+// Handle a sensor_bulk_data message (callback from serialqueue fastreader)
+static void
+handle_bulk_data(struct fastreader *fr, uint8_t *data, int len)
+{
+    struct bulkqueue *bq = container_of(fr, struct bulkqueue, fr);
+
+    // Parse: sensor_bulk_data oid=%c sequence=%hu data=%*s
+    uint8_t *p = &data[MESSAGE_HEADER_SIZE + fr->prefix_len];
+    uint8_t *end = &data[len - MESSAGE_TRAILER_SIZE];
+    if (p >= end)
+        return;
+    uint16_t sequence = msgblock_parse_int(&p);
+    if (p >= end)
+        return;
+    int data_len = *p++;
+    if (p + data_len != end)
+        return;
+
+    // Store message
+    pthread_mutex_lock(&bq->lock);
+    int ret = buffer_append(&bq->bufs[bq->fill_buf], sequence, p, data_len);
+    pthread_mutex_unlock(&bq->lock);
+    if (ret)
+        errorf("bulkqueue: unable to store message");
+}
+
+// Create a new 'struct bulkqueue' object
+struct bulkqueue * __visible
+bulkqueue_alloc(struct serialqueue *sq, uint32_t data_msgtag, uint32_t oid)
+{
+    struct bulkqueue *bq = malloc(sizeof(*bq));
+    memset(bq, 0, sizeof(*bq));
+    int ret = pthread_mutex_init(&bq->lock, NULL);
+    if (ret) {
+        report_errno("bulkqueue_alloc", ret);
+        free(bq);
+        return NULL;
+    }
+    bq->sq = sq;
+
+    // Setup fastreader to match sensor_bulk_data messages
+    uint32_t data_prefix[] = {data_msgtag, oid};
+    struct queue_message *dummy = message_alloc_and_encode(
+        data_prefix, ARRAY_SIZE(data_prefix));
+    memcpy(bq->fr.prefix, dummy->msg, dummy->len);
+    bq->fr.prefix_len = dummy->len;
+    free(dummy);
+    bq->fr.func = handle_bulk_data;
+    bq->fr.is_exclusive = 1;
+
+    return bq;
+}
+
+// Start storing messages (any previously stored data is discarded)
+void __visible
+bulkqueue_start(struct bulkqueue *bq)
+{
+    pthread_mutex_lock(&bq->lock);
+    int i;
+    for (i=0; i<ARRAY_SIZE(bq->bufs); i++)
+        bq->bufs[i].data_len = bq->bufs[i].msg_count = 0;
+    pthread_mutex_unlock(&bq->lock);
+    if (!bq->is_active) {
+        serialqueue_add_fastreader(bq->sq, &bq->fr);
+        bq->is_active = 1;
+    }
+}
+
+// Stop storing messages (messages are then delivered to the host code)
+void __visible
+bulkqueue_stop(struct bulkqueue *bq)
+{
+    if (!bq->is_active)
+        return;
+    serialqueue_rm_fastreader(bq->sq, &bq->fr);
+    bq->is_active = 0;
+}
+
+// Return all the messages stored since the last call.  The returned
+// pointers remain valid until the next call to bulkqueue_pull().
+void __visible
+bulkqueue_pull(struct bulkqueue *bq, struct bulkqueue_data *bd)
+{
+    pthread_mutex_lock(&bq->lock);
+    struct bulkqueue_buffer *b = &bq->bufs[bq->fill_buf];
+    bq->fill_buf = !bq->fill_buf;
+    struct bulkqueue_buffer *next = &bq->bufs[bq->fill_buf];
+    next->data_len = next->msg_count = 0;
+    pthread_mutex_unlock(&bq->lock);
+
+    bd->data = b->data;
+    bd->sequences = b->sequences;
+    bd->lengths = b->lengths;
+    bd->data_len = b->data_len;
+    bd->msg_count = b->msg_count;
+}
+
+// Free memory associated with a 'struct bulkqueue' object (it must be
+// stopped or its serialqueue must already have been freed)
+void __visible
+bulkqueue_free(struct bulkqueue *bq)
+{
+    if (!bq)
+        return;
+    int i;
+    for (i=0; i<ARRAY_SIZE(bq->bufs); i++) {
+        free(bq->bufs[i].data);
+        free(bq->bufs[i].sequences);
+        free(bq->bufs[i].lengths);
+    }
+    free(bq);
+}
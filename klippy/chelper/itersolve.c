@@ -70,6 +70,7 @@ itersolve_gen_steps_range(struct stepper_kinematics *sk, struct stepcompress *sc
         old_guess = guess;
         guess.time = next_time;
         guess.position = calc_position_cb(sk, m, next_time);
+        sk->solver_iterations++;
         guess_dist = guess.position - target;
         if (fabs(guess_dist) > .000000001) {
             // Guess does not look close enough - update bounds
@@ -0,0 +1,182 @@
+// Lookahead queue junction velocity planning
+//
+// Copyright (C) 2026  agent <agent@local>
+//
+// This file may be distributed under the terms of the GNU GPLv3 license.
+
+#include <stdlib.h> // realloc
+#include <string.h> // memset
+#include "compiler.h" // __visible
+#include "pyhelper.h" // errorf
+
+// The move parameters needed for lookahead (see toolhead.py Move class)
+struct lookahead_move {
+    double max_start_v2, delta_v2, max_smoothed_v2, smooth_delta_v2;
+    double max_cruise_v2;
+    // Planned junction velocities
+    double start_v2, cruise_v2, end_v2;
+    // Temporary storage for moves with delayed calculations
+    double delayed_start_v2, delayed_end_v2;
+};
+
+struct lookahead {
+    struct lookahead_move *moves;
+    int move_count, move_alloc;
+};
+
+// Allocate a new 'lookahead' object
+struct lookahead * __visible
+lookahead_alloc(void)
+{
+    struct lookahead *la = malloc(sizeof(*la));
+    memset(la, 0, sizeof(*la));
+    return la;
+}
+
+// Free memory associated with a 'lookahead' object
+void __visible
+lookahead_free(struct lookahead *la)
+{
+    free(la->moves);
+    free(la);
+}
+
+// Remove all queued moves
+void __visible
+lookahead_reset(struct lookahead *la)
+{
+    la->move_count = 0;
+}
+
+// Add a move to the end of the queue
+int __visible
+lookahead_add_move(struct lookahead *la, double max_start_v2, double delta_v2
+                   , double max_smoothed_v2, double smooth_delta_v2
+                   , double max_cruise_v2)
+{
+    if (la->move_count >= la->move_alloc) {
+        int new_alloc = la->move_alloc ? la->move_alloc * 2 : 1024;
+        struct lookahead_move *new_moves = realloc(
+            la->moves, new_alloc * sizeof(*new_moves));
+        if (!new_moves) {
+            errorf("lookahead_add_move: out of memory");
+            return -1;
+        }
+        la->moves = new_moves;
+        la->move_alloc = new_alloc;
+    }
+    struct lookahead_move *m = &la->moves[la->move_count++];
+    memset(m, 0, sizeof(*m));
+    m->max_start_v2 = max_start_v2;
+    m->delta_v2 = delta_v2;
+    m->max_smoothed_v2 = max_smoothed_v2;
+    m->smooth_delta_v2 = smooth_delta_v2;
+    m->max_cruise_v2 = max_cruise_v2;
+    return 0;
+}
+
+// Return the minimum of two values (matches Python's min() semantics)
+static inline double
+pymin(double a, double b)
+{
+    return b < a ? b : a;
+}
+
+static void
+set_junction(struct lookahead_move *m, double start_v2, double cruise_v2
+             , double end_v2)
+{
+    m->start_v2 = start_v2;
+    m->cruise_v2 = cruise_v2;
+    m->end_v2 = end_v2;
+}
+
+// Determine junction velocities of queued moves.  This mirrors the
+// Python LookAheadQueue.flush() code - the calculations (and the order
+// of operations) must remain identical.  Returns the number of moves
+// that may be flushed.
+int __visible
+lookahead_flush(struct lookahead *la, int lazy)
+{
+    struct lookahead_move *moves = la->moves;
+    int update_flush_count = lazy;
+    int flush_count = la->move_count;
+    // Traverse queue from last to first move and determine maximum
+    // junction speed assuming the robot comes to a complete stop
+    // after the last move.
+    int delayed_count = 0;
+    double next_end_v2 = 0., next_smoothed_v2 = 0., peak_cruise_v2 = 0.;
+    int i;
+    for (i = flush_count - 1; i >= 0; i--) {
+        struct lookahead_move *m = &moves[i];
+        double reachable_start_v2 = next_end_v2 + m->delta_v2;
+        double start_v2 = pymin(m->max_start_v2, reachable_start_v2);
+        double reachable_smoothed_v2 = next_smoothed_v2 + m->smooth_delta_v2;
+        double smoothed_v2 = pymin(m->max_smoothed_v2, reachable_smoothed_v2);
+        if (smoothed_v2 < reachable_smoothed_v2) {
+            // It's possible for this move to accelerate
+            if (smoothed_v2 + m->smooth_delta_v2 > next_smoothed_v2
+                || delayed_count) {
+                // This move can decelerate or this is a full accel
+                // move after a full decel move
+                if (update_flush_count && peak_cruise_v2) {
+                    flush_count = i;
+                    update_flush_count = 0;
+                }
+                peak_cruise_v2 = pymin(m->max_cruise_v2, (
+                    smoothed_v2 + reachable_smoothed_v2) * .5);
+                if (delayed_count) {
+                    // Propagate peak_cruise_v2 to any delayed moves
+                    if (!update_flush_count && i < flush_count) {
+                        double mc_v2 = peak_cruise_v2;
+                        int j;
+                        for (j = i + 1; j <= i + delayed_count; j++) {
+                            struct lookahead_move *dm = &moves[j];
+                            double ms_v2 = dm->delayed_start_v2;
+                            double me_v2 = dm->delayed_end_v2;
+                            mc_v2 = pymin(mc_v2, ms_v2);
+                            set_junction(dm, pymin(ms_v2, mc_v2), mc_v2
+                                         , pymin(me_v2, mc_v2));
+                        }
+                    }
+                    delayed_count = 0;
+                }
+            }
+            if (!update_flush_count && i < flush_count) {
+                double cruise_v2 = pymin(pymin(
+                    (start_v2 + reachable_start_v2) * .5, m->max_cruise_v2)
+                                         , peak_cruise_v2);
+                set_junction(m, pymin(start_v2, cruise_v2), cruise_v2
+                             , pymin(next_end_v2, cruise_v2));
+            }
+        } else {
+            // Delay calculating this move until peak_cruise_v2 is known
+            m->delayed_start_v2 = start_v2;
+            m->delayed_end_v2 = next_end_v2;
+            delayed_count++;
+        }
+        next_end_v2 = start_v2;
+        next_smoothed_v2 = smoothed_v2;
+    }
+    if (update_flush_count)
+        return 0;
+    return flush_count;
+}
+
+// Remove moves from the start of the queue, storing their junction
+// velocities (start_v2, cruise_v2, end_v2 triplets) in 'junctions'
+void __visible
+lookahead_pop_moves(struct lookahead *la, double *junctions, int count)
+{
+    if (count > la->move_count)
+        count = la->move_count;
+    int i;
+    for (i = 0; i < count; i++) {
+        struct lookahead_move *m = &la->moves[i];
+        *junctions++ = m->start_v2;
+        *junctions++ = m->cruise_v2;
+        *junctions++ = m->end_v2;
+    }
+    la->move_count -= count;
+    memmove(la->moves, &la->moves[count], la->move_count * sizeof(*la->moves));
+}
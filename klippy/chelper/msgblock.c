@@ -101,6 +101,13 @@ parse_int(uint8_t **pp)
     return v;
 }
 
+// Parse a "variable length quantity" integer (and advance the pointer)
+uint32_t
+msgblock_parse_int(uint8_t **pp)
+{
+    return parse_int(pp);
+}
+
 // Parse the VLQ contents of a message
 int
 msgblock_decode(uint32_t *data, int data_len, uint8_t *msg, int msg_len)
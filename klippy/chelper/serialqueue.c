@@ -255,6 +255,17 @@ handle_message(struct serialqueue *sq, double eventtime, int len)
         must_wake = 1;
     }
 
+    // Check fast readers
+    struct fastreader *fr, *match_fr = NULL;
+    list_for_each_entry(fr, &sq->fast_readers, node) {
+        if (len < fr->prefix_len + MESSAGE_MIN
+            || memcmp(&sq->input_buf[MESSAGE_HEADER_SIZE]
+                      , fr->prefix, fr->prefix_len) != 0)
+            continue;
+        match_fr = fr;
+        break;
+    }
+
     // Process message
     if (len == MESSAGE_MIN) {
         // Ack/nak message
@@ -263,7 +274,7 @@ handle_message(struct serialqueue *sq, double eventtime, int len)
         else if (rseq > sq->ignore_nak_seq && !list_empty(&sq->sent_queue))
             // Duplicate Ack is a Nak - do fast retransmit
             pollreactor_update_timer(sq->pr, SQPT_RETRANSMIT, PR_NOW);
-    } else {
+    } else if (!match_fr || !match_fr->is_exclusive) {
         // Data message - add to receive queue
         struct queue_message *qm = message_fill(sq->input_buf, len);
         qm->sent_time = (rseq > sq->retransmit_seq
@@ -274,19 +285,13 @@ handle_message(struct serialqueue *sq, double eventtime, int len)
         must_wake = 1;
     }
 
-    // Check fast readers
-    struct fastreader *fr;
-    list_for_each_entry(fr, &sq->fast_readers, node) {
-        if (len < fr->prefix_len + MESSAGE_MIN
-            || memcmp(&sq->input_buf[MESSAGE_HEADER_SIZE]
-                      , fr->prefix, fr->prefix_len) != 0)
-            continue;
+    if (match_fr) {
         // Release main lock and invoke callback
         pthread_mutex_lock(&sq->fast_reader_dispatch_lock);
         if (must_wake)
             check_wake_receive(sq);
         pthread_mutex_unlock(&sq->lock);
-        fr->func(fr, sq->input_buf, len);
+        match_fr->func(match_fr, sq->input_buf, len);
         pthread_mutex_unlock(&sq->fast_reader_dispatch_lock);
         return;
     }
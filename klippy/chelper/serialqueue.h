@@ -14,6 +14,7 @@ typedef void (*fastreader_cb)(struct fastreader *fr, uint8_t *data, int len);
 struct fastreader {
     struct list_node node;
     fastreader_cb func;
+    int is_exclusive; // if set, matching messages are not sent to host code
     int prefix_len;
     uint8_t prefix[MESSAGE_MAX];
 };
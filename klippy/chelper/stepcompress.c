@@ -49,6 +49,8 @@ struct stepcompress {
     struct list_head history_list;
     // Itersolve reference
     struct stepper_kinematics *sk;
+    // Profiling
+    struct stepcompress_stats stats;
 };
 
 struct step_move {
@@ -362,6 +364,8 @@ add_move(struct stepcompress *sc, uint64_t first_clock, struct step_move *move)
         qm->req_clock = first_clock;
     list_add_tail(&qm->node, &sc->msg_queue);
     sc->last_step_clock = last_clock;
+    sc->stats.step_count += move->count;
+    sc->stats.queue_step_count++;
 
     // Create and store move in history tracking
     struct history_steps *hs = malloc(sizeof(*hs));
@@ -381,11 +385,14 @@ queue_flush(struct stepcompress *sc, uint64_t move_clock)
 {
     if (sc->queue_pos >= sc->queue_next)
         return 0;
+    double start_time = get_monotonic();
     while (sc->last_step_clock < move_clock) {
         struct step_move move = compress_bisect_add(sc);
         int ret = check_line(sc, move);
-        if (ret)
+        if (ret) {
+            sc->stats.compress_time += get_monotonic() - start_time;
             return ret;
+        }
 
         add_move(sc, sc->last_step_clock + move.interval, &move);
 
@@ -396,6 +403,7 @@ queue_flush(struct stepcompress *sc, uint64_t move_clock)
         sc->queue_pos += move.count;
     }
     calc_last_step_print_time(sc);
+    sc->stats.compress_time += get_monotonic() - start_time;
     return 0;
 }
 
@@ -681,15 +689,30 @@ stepcompress_get_stepper_kinematics(struct stepcompress *sc)
     return sc->sk;
 }
 
+// Report step generation profiling information
+void __visible
+stepcompress_get_stats(struct stepcompress *sc
+                       , struct stepcompress_stats *stats)
+{
+    *stats = sc->stats;
+}
+
 // Generate steps (via itersolve) and flush
 int32_t
 stepcompress_generate_steps(struct stepcompress *sc, double gen_steps_time
                             , uint64_t flush_clock)
 {
-    if (!sc->sk)
+    struct stepper_kinematics *sk = sc->sk;
+    if (!sk)
         return 0;
     // Generate steps
-    int32_t ret = itersolve_generate_steps(sc->sk, sc, gen_steps_time);
+    double start_time = get_monotonic();
+    double compress_time = sc->stats.compress_time;
+    uint64_t solver_iterations = sk->solver_iterations;
+    int32_t ret = itersolve_generate_steps(sk, sc, gen_steps_time);
+    sc->stats.solver_iterations += sk->solver_iterations - solver_iterations;
+    sc->stats.solve_time += (get_monotonic() - start_time
+                             - (sc->stats.compress_time - compress_time));
     if (ret)
         return ret;
     // Flush steps
@@ -11,6 +11,11 @@ struct pull_history_steps {
     int step_count, interval, add;
 };
 
+struct stepcompress_stats {
+    uint64_t step_count, queue_step_count, solver_iterations;
+    double solve_time, compress_time;
+};
+
 struct stepcompress *stepcompress_alloc(uint32_t oid);
 void stepcompress_fill(struct stepcompress *sc, uint32_t max_error
                        , int32_t queue_step_msgtag
@@ -43,6 +48,8 @@ void stepcompress_set_stepper_kinematics(struct stepcompress *sc
                                          , struct stepper_kinematics *sk);
 struct stepper_kinematics *stepcompress_get_stepper_kinematics(
     struct stepcompress *sc);
+void stepcompress_get_stats(struct stepcompress *sc
+                           , struct stepcompress_stats *stats);
 int32_t stepcompress_generate_steps(struct stepcompress *sc
                                     , double gen_steps_time
                                     , uint64_t flush_clock);
@@ -0,0 +1,159 @@
+// Parallel step generation across multiple steppersync objects
+//
+// Copyright (C) 2026  agent <agent@local>
+//
+// This file may be distributed under the terms of the GNU GPLv3 license.
+
+// Step generation for each mcu (each steppersync object) is
+// independent - the stepper_kinematics objects only read from the
+// trapq objects during step generation.  This code uses a pool of
+// worker threads so that steps for several mcus can be generated
+// concurrently on multi-core hosts.  The calling thread also
+// participates in step generation and does not return until all
+// requested steppersync objects have been processed.
+
+#include <pthread.h> // pthread_create
+#include <stdlib.h> // malloc
+#include <string.h> // memset
+#include "compiler.h" // __visible
+#include "pyhelper.h" // get_monotonic
+#include "steppersync.h" // steppersync_generate_steps
+
+struct stepgen_pool {
+    pthread_mutex_t lock; // protects variables below
+    pthread_cond_t cond, done_cond;
+    pthread_t *threads;
+    int num_threads, exit_request;
+    // Current step generation request
+    struct steppersync **ss_list;
+    uint64_t *flush_clocks;
+    int32_t *results;
+    double *gen_times;
+    double gen_steps_time;
+    int ss_num, next_ss, completed;
+};
+
+// Generate steps for the next pending steppersync (if any).  Must be
+// called with the lock held - the lock is released during generation.
+static int
+run_next(struct stepgen_pool *sp)
+{
+    if (sp->next_ss >= sp->ss_num)
+        return 0;
+    int i = sp->next_ss++;
+    pthread_mutex_unlock(&sp->lock);
+    double start_time = get_monotonic();
+    int32_t ret = steppersync_generate_steps(sp->ss_list[i], sp->gen_steps_time
+                                             , sp->flush_clocks[i]);
+    double gen_time = get_monotonic() - start_time;
+    pthread_mutex_lock(&sp->lock);
+    sp->results[i] = ret;
+    sp->gen_times[i] = gen_time;
+    sp->completed++;
+    if (sp->completed >= sp->ss_num)
+        pthread_cond_signal(&sp->done_cond);
+    return 1;
+}
+
+// Main code for each worker thread
+static void *
+worker_thread(void *data)
+{
+    struct stepgen_pool *sp = data;
+    char name[16] = "klippy_stepgen";
+    set_thread_name(name);
+    pthread_mutex_lock(&sp->lock);
+    for (;;) {
+        if (sp->exit_request)
+            break;
+        if (!run_next(sp))
+            pthread_cond_wait(&sp->cond, &sp->lock);
+    }
+    pthread_mutex_unlock(&sp->lock);
+    return NULL;
+}
+
+// Allocate a new 'stepgen_pool' object with the given number of
+// worker threads
+struct stepgen_pool * __visible
+stepgen_pool_alloc(int num_threads)
+{
+    struct stepgen_pool *sp = malloc(sizeof(*sp));
+    memset(sp, 0, sizeof(*sp));
+    int ret = pthread_mutex_init(&sp->lock, NULL);
+    if (ret)
+        goto fail;
+    ret = pthread_cond_init(&sp->cond, NULL);
+    if (ret)
+        goto fail;
+    ret = pthread_cond_init(&sp->done_cond, NULL);
+    if (ret)
+        goto fail;
+    sp->threads = malloc(sizeof(*sp->threads) * num_threads);
+    int i;
+    for (i=0; i<num_threads; i++) {
+        ret = pthread_create(&sp->threads[i], NULL, worker_thread, sp);
+        if (ret) {
+            // Continue with fewer worker threads
+            report_errno("pthread_create", ret);
+            break;
+        }
+        sp->num_threads++;
+    }
+    return sp;
+
+fail:
+    report_errno("stepgen_pool_alloc", ret);
+    free(sp);
+    return NULL;
+}
+
+// Stop all worker threads and free memory associated with a
+// 'stepgen_pool' object
+void __visible
+stepgen_pool_free(struct stepgen_pool *sp)
+{
+    if (!sp)
+        return;
+    pthread_mutex_lock(&sp->lock);
+    sp->exit_request = 1;
+    pthread_cond_broadcast(&sp->cond);
+    pthread_mutex_unlock(&sp->lock);
+    int i;
+    for (i=0; i<sp->num_threads; i++) {
+        int ret = pthread_join(sp->threads[i], NULL);
+        if (ret)
+            report_errno("pthread_join", ret);
+    }
+    free(sp->threads);
+    free(sp);
+}
+
+// Generate steps for all the given steppersync objects.  The result
+// code and the time spent generating steps for each steppersync are
+// stored in 'results' and 'gen_times'.
+void __visible
+stepgen_pool_generate_steps(struct stepgen_pool *sp
+                            , struct steppersync **ss_list
+                            , uint64_t *flush_clocks, int32_t *results
+                            , double *gen_times, int ss_num
+                            , double gen_steps_time)
+{
+    pthread_mutex_lock(&sp->lock);
+    sp->ss_list = ss_list;
+    sp->flush_clocks = flush_clocks;
+    sp->results = results;
+    sp->gen_times = gen_times;
+    sp->gen_steps_time = gen_steps_time;
+    sp->ss_num = ss_num;
+    sp->next_ss = sp->completed = 0;
+    if (ss_num > 1)
+        pthread_cond_broadcast(&sp->cond);
+    // Generate steps in this thread too
+    while (run_next(sp))
+        ;
+    while (sp->completed < sp->ss_num)
+        pthread_cond_wait(&sp->done_cond, &sp->lock);
+    sp->ss_num = sp->next_ss = sp->completed = 0;
+    pthread_mutex_unlock(&sp->lock);
+}
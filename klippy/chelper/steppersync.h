@@ -4,6 +4,7 @@
 #include <stdint.h> // uint64_t
 
 struct serialqueue;
+struct stepcompress;
 struct steppersync *steppersync_alloc(
     struct serialqueue *sq, struct stepcompress **sc_list, int sc_num
     , int move_num);
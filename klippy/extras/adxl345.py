@@ -3,7 +3,8 @@
 # Copyright (C) 2020-2023  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, time, collections, multiprocessing, os
+import logging, time, collections, os, array
+import bisect, itertools
 from . import bus, bulk_sensor
 
 # ADXL345 registers
@@ -30,6 +31,9 @@ SCALE_Z  = 0.003906 * FREEFALL_ACCEL # 1 / 256 (at 3.3V) mg/LSB
 Accel_Measurement = collections.namedtuple(
     'Accel_Measurement', ('time', 'accel_x', 'accel_y', 'accel_z'))
 
+# Number of samples to format at a time when writing to a file
+WRITE_CHUNK_SAMPLES = 1000
+
 # Helper class to obtain measurements
 class AccelQueryHelper:
     def __init__(self, printer):
@@ -37,54 +41,66 @@ class AccelQueryHelper:
         self.is_finished = False
         print_time = printer.lookup_object('toolhead').get_last_move_time()
         self.request_start_time = self.request_end_time = print_time
-        self.msgs = []
-        self.samples = []
+        # Samples are stored as (time, x, y, z) values in a flat array
+        self.data = array.array('d')
+        self.num_batches = 0
+        self.stream_cb = None
+        self.stream_end_time = 9999999999999999.
+        self.stream_count = 0
+        self.keep_samples = True
+    def set_stream_callback(self, cb, keep_samples=False):
+        # Pass samples to 'cb' as they arrive (optionally without
+        # storing the samples)
+        self.stream_cb = cb
+        self.keep_samples = keep_samples
     def finish_measurements(self):
         toolhead = self.printer.lookup_object('toolhead')
-        self.request_end_time = toolhead.get_last_move_time()
+        self.request_end_time = self.stream_end_time = (
+            toolhead.get_last_move_time())
         toolhead.wait_moves()
         self.is_finished = True
+    def _stream_batch(self, msg):
+        data = msg['data']
+        if not data:
+            return
+        start_time = self.request_start_time
+        end_time = self.stream_end_time
+        if data[0][0] < start_time or data[-1][0] > end_time:
+            data = [s for s in data if start_time <= s[0] <= end_time]
+            if not data:
+                return
+        self.stream_count += len(data)
+        self.stream_cb(data)
     def handle_batch(self, msg):
         if self.is_finished:
             return False
-        if len(self.msgs) >= 10000:
+        if self.stream_cb is not None:
+            self._stream_batch(msg)
+            if not self.keep_samples or self.num_batches >= 10000:
+                return True
+        if self.num_batches >= 10000:
             # Avoid filling up memory with too many samples
             return False
-        self.msgs.append(msg)
+        self.num_batches += 1
+        self.data.extend(itertools.chain.from_iterable(msg['data']))
         return True
+    def _get_sample_range(self):
+        # Find the samples in the requested time range (samples are
+        # stored in time order)
+        times = self.data[::4]
+        start = bisect.bisect_left(times, self.request_start_time)
+        end = bisect.bisect_right(times, self.request_end_time, start)
+        return start, end
     def has_valid_samples(self):
-        for msg in self.msgs:
-            data = msg['data']
-            first_sample_time = data[0][0]
-            last_sample_time = data[-1][0]
-            if (first_sample_time > self.request_end_time
-                    or last_sample_time < self.request_start_time):
-                continue
-            # The time intervals [first_sample_time, last_sample_time]
-            # and [request_start_time, request_end_time] have non-zero
-            # intersection. It is still theoretically possible that none
-            # of the samples from msgs fall into the time interval
-            # [request_start_time, request_end_time] if it is too narrow
-            # or on very heavy data losses. In practice, that interval
-            # is at least 1 second, so this possibility is negligible.
+        if self.stream_count:
             return True
-        return False
+        start, end = self._get_sample_range()
+        return end > start
     def get_samples(self):
-        if not self.msgs:
-            return self.samples
-        total = sum([len(m['data']) for m in self.msgs])
-        count = 0
-        self.samples = samples = [None] * total
-        for msg in self.msgs:
-            for samp_time, x, y, z in msg['data']:
-                if samp_time < self.request_start_time:
-                    continue
-                if samp_time > self.request_end_time:
-                    break
-                samples[count] = Accel_Measurement(samp_time, x, y, z)
-                count += 1
-        del samples[count:]
-        return self.samples
+        start, end = self._get_sample_range()
+        values = iter(self.data[start*4:end*4])
+        return list(itertools.starmap(Accel_Measurement,
+                                      zip(values, values, values, values)))
     def write_to_file(self, filename):
         def write_impl():
             try:
@@ -94,11 +110,14 @@ class AccelQueryHelper:
                 pass
             f = open(filename, "w")
             f.write("#time,accel_x,accel_y,accel_z\n")
-            samples = self.samples or self.get_samples()
-            for t, accel_x, accel_y, accel_z in samples:
-                f.write("%.6f,%.6f,%.6f,%.6f\n" % (
-                    t, accel_x, accel_y, accel_z))
+            start, end = self._get_sample_range()
+            data = self.data
+            for pos in range(start, end, WRITE_CHUNK_SAMPLES):
+                count = min(end - pos, WRITE_CHUNK_SAMPLES)
+                f.write(("%.6f,%.6f,%.6f,%.6f\n" * count) % tuple(
+                    data[pos*4:(pos+count)*4]))
             f.close()
+        import multiprocessing
         write_proc = multiprocessing.Process(target=write_impl)
         write_proc.daemon = True
         write_proc.start()
@@ -34,6 +34,14 @@ def constrain(val, min_val, max_val):
 def lerp(t, v0, v1):
     return (1. - t) * v0 + t * v1
 
+# numpy is optional - it is only used to speed up mesh interpolation
+def load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
 # retrieve comma separated pair from config
 def parse_config_pair(config, option, default, minval=None, maxval=None):
     pair = config.getintlist(option, (default, default))
@@ -1277,6 +1285,15 @@ class MoveSplitter:
         axes_d = [np - pp for np, pp in zip(self.next_pos, self.prev_pos)]
         self.total_move_length = math.sqrt(sum([d*d for d in axes_d[:3]]))
         self.axis_move = [not isclose(d, 0., abs_tol=1e-10) for d in axes_d]
+        # Only check for splits where the move crosses a mesh cell boundary
+        self.split_points = []
+        self.split_index = 0
+        self.pending = None
+        self.slope_range = [0., 0.]
+        if ((self.axis_move[0] or self.axis_move[1])
+            and self.total_move_length > self.move_check_distance):
+            self.split_points = self.z_mesh.calc_split_points(
+                self.prev_pos, self.next_pos, self.split_delta_z)
     def _calc_z_offset(self, pos):
         z = self.z_mesh.calc_z(pos[0], pos[1])
         offset = self.fade_offset
@@ -1291,23 +1308,58 @@ class MoveSplitter:
             if self.axis_move[i]:
                 self.current_pos[i] = lerp(
                     t, self.prev_pos[i], self.next_pos[i])
+    def _add_pending(self, distance, z):
+        # Track the range of line slopes from the last split that stay
+        # within split_delta_z of every skipped point
+        dist = distance - self.distance_checked
+        min_slope = (z - self.split_delta_z - self.z_offset) / dist
+        max_slope = (z + self.split_delta_z - self.z_offset) / dist
+        if self.pending is None:
+            self.slope_range = [min_slope, max_slope]
+        else:
+            self.slope_range = [max(self.slope_range[0], min_slope),
+                                min(self.slope_range[1], max_slope)]
+        self.pending = (distance, z)
+    def _check_pending(self, distance, z):
+        if self.pending is None:
+            return True
+        slope = (z - self.z_offset) / (distance - self.distance_checked)
+        return self.slope_range[0] < slope < self.slope_range[1]
+    def _split_pending(self):
+        distance, z = self.pending
+        self.pending = None
+        self.distance_checked = distance
+        self.z_offset = z
+        self._set_next_move(distance)
+        newpos = list(self.current_pos)
+        newpos[2] += self.z_offset
+        return newpos
     def split(self):
         if not self.traverse_complete:
-            if self.axis_move[0] or self.axis_move[1]:
-                # X and/or Y axis move, traverse if necessary
-                while self.distance_checked + self.move_check_distance \
-                        < self.total_move_length:
-                    self.distance_checked += self.move_check_distance
-                    self._set_next_move(self.distance_checked)
-                    next_z = self._calc_z_offset(self.current_pos)
-                    if abs(next_z - self.z_offset) >= self.split_delta_z:
-                        self.z_offset = next_z
-                        newpos = list(self.current_pos)
-                        newpos[2] += self.z_offset
-                        return newpos
+            # Only split the move at a mesh cell boundary where a
+            # straight line would deviate from the mesh
+            split_points = self.split_points
+            while self.split_index < len(split_points):
+                distance = split_points[self.split_index] \
+                    * self.total_move_length
+                last_distance = self.distance_checked
+                if self.pending is not None:
+                    last_distance = self.pending[0]
+                if distance - last_distance < self.move_check_distance:
+                    self.split_index += 1
+                    continue
+                self._set_next_move(distance)
+                next_z = self._calc_z_offset(self.current_pos)
+                if not self._check_pending(distance, next_z):
+                    return self._split_pending()
+                self._add_pending(distance, next_z)
+                self.split_index += 1
             # end of move reached
+            next_z = self._calc_z_offset(self.next_pos)
+            if not self._check_pending(self.total_move_length, next_z):
+                return self._split_pending()
             self.current_pos[:] = self.next_pos
-            self.z_offset = self._calc_z_offset(self.current_pos)
+            self.z_offset = next_z
             # Its okay to add Z-Offset to the final move, since it will not be
             # used again.
             self.current_pos[2] += self.z_offset
@@ -1322,6 +1374,8 @@ class ZMesh:
     def __init__(self, params, name):
         self.profile_name = name or "adaptive-%X" % (id(self),)
         self.probed_matrix = self.mesh_matrix = None
+        self.mesh_coeffs = None
+        self.mesh_max_twist = 0.
         self.mesh_params = params
         self.mesh_offsets = [0., 0.]
         logging.debug('bed_mesh: probe/mesh parameters:')
@@ -1342,6 +1396,9 @@ class ZMesh:
             'direct': self._sample_direct
         }
         self._sample = interpolation_algos.get(params['algo'])
+        self.numpy = None
+        if params['algo'] != 'direct':
+            self.numpy = load_numpy()
         # Number of points to interpolate per segment
         mesh_x_pps = params['mesh_x_pps']
         mesh_y_pps = params['mesh_y_pps']
@@ -1395,17 +1452,28 @@ class ZMesh:
             msg += "Interpolation Algorithm: %s\n" \
                    % (self.mesh_params['algo'])
             msg += "Measured points:\n"
-            for y_line in range(self.mesh_y_count - 1, -1, -1):
-                for z in matrix[y_line]:
-                    msg += "  %f" % (z)
-                msg += "\n"
+            msg += "".join(["".join(["  %f" % (z,) for z in line]) + "\n"
+                            for line in reversed(matrix)])
             print_func(msg)
         else:
             print_func("bed_mesh: Z Mesh not generated")
     def build_mesh(self, z_matrix):
         self.probed_matrix = z_matrix
         self._sample(z_matrix)
-        self.print_mesh(logging.debug)
+        self._build_coeffs()
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            self.print_mesh(logging.debug)
+    def _build_coeffs(self):
+        # Precompute the bilinear coefficients of each mesh cell so that
+        # z = a + b*tx + c*ty + d*tx*ty
+        tbl = self.mesh_matrix
+        self.mesh_coeffs = [
+            [(z00, z10 - z00, z01 - z00, z11 - z10 - z01 + z00)
+             for z00, z10, z01, z11 in zip(row0[:-1], row0[1:],
+                                           row1[:-1], row1[1:])]
+            for row0, row1 in zip(tbl[:-1], tbl[1:])]
+        self.mesh_max_twist = max([abs(c[3]) for row in self.mesh_coeffs
+                                   for c in row])
     def set_zero_reference(self, xpos, ypos):
         offset = self.calc_z(xpos, ypos)
         logging.info(
@@ -1416,6 +1484,7 @@ class ZMesh:
             for yidx in range(len(matrix)):
                 for xidx in range(len(matrix[yidx])):
                     matrix[yidx][xidx] -= offset
+        self._build_coeffs()
     def set_mesh_offsets(self, offsets):
         for i, o in enumerate(offsets):
             if o is not None:
@@ -1425,16 +1494,74 @@ class ZMesh:
     def get_y_coordinate(self, index):
         return self.mesh_y_min + self.mesh_y_dist * index
     def calc_z(self, x, y):
-        if self.mesh_matrix is not None:
-            tbl = self.mesh_matrix
-            tx, xidx = self._get_linear_index(x + self.mesh_offsets[0], 0)
-            ty, yidx = self._get_linear_index(y + self.mesh_offsets[1], 1)
-            z0 = lerp(tx, tbl[yidx][xidx], tbl[yidx][xidx+1])
-            z1 = lerp(tx, tbl[yidx+1][xidx], tbl[yidx+1][xidx+1])
-            return lerp(ty, z0, z1)
-        else:
+        coeffs = self.mesh_coeffs
+        if coeffs is None:
             # No mesh table generated, no z-adjustment
             return 0.
+        xpos = (x + self.mesh_offsets[0] - self.mesh_x_min) / self.mesh_x_dist
+        xidx = min(max(int(math.floor(xpos)), 0), self.mesh_x_count - 2)
+        tx = min(max(xpos - xidx, 0.), 1.)
+        ypos = (y + self.mesh_offsets[1] - self.mesh_y_min) / self.mesh_y_dist
+        yidx = min(max(int(math.floor(ypos)), 0), self.mesh_y_count - 2)
+        ty = min(max(ypos - yidx, 0.), 1.)
+        a, b, c, d = coeffs[yidx][xidx]
+        return a + tx * (b + d * ty) + c * ty
+    def calc_split_points(self, start_pos, end_pos, max_deviation):
+        # Return the fractions (0. < t < 1.) along an XY move where it
+        # crosses a mesh cell boundary.  Extra points are added within
+        # cells where the (non-linear) mesh surface would deviate from a
+        # straight line by more than max_deviation.
+        if self.mesh_coeffs is None:
+            return []
+        offsets = self.mesh_offsets
+        axes = [
+            (start_pos[0] + offsets[0], end_pos[0] + offsets[0],
+             self.mesh_x_min, self.mesh_x_dist, self.mesh_x_count),
+            (start_pos[1] + offsets[1], end_pos[1] + offsets[1],
+             self.mesh_y_min, self.mesh_y_dist, self.mesh_y_count)]
+        crossings = []
+        for c0, c1, mesh_min, mesh_dist, mesh_cnt in axes:
+            delta = c1 - c0
+            if isclose(delta, 0., abs_tol=1e-10):
+                continue
+            lo = (min(c0, c1) - mesh_min) / mesh_dist
+            hi = (max(c0, c1) - mesh_min) / mesh_dist
+            first = max(0, int(math.floor(lo)) + 1)
+            last = min(mesh_cnt - 1, int(math.ceil(hi)) - 1)
+            for i in range(first, last + 1):
+                t = (mesh_min + mesh_dist * i - c0) / delta
+                if 0. < t < 1.:
+                    crossings.append(t)
+        crossings.sort()
+        if self.mesh_max_twist <= 4. * max_deviation:
+            # A line within a single cell never deviates enough
+            return crossings
+        crossings.append(1.)
+        points = []
+        last_t = 0.
+        for t in crossings:
+            if t - last_t < 1e-9:
+                continue
+            # Along a line the twist term (d*tx*ty) of a cell is quadratic
+            twist = 1.
+            mid_t = (last_t + t) * .5
+            idxs = []
+            for c0, c1, mesh_min, mesh_dist, mesh_cnt in axes:
+                pos = (c0 + (c1 - c0) * mid_t - mesh_min) / mesh_dist
+                idx = min(max(int(math.floor(pos)), 0), mesh_cnt - 2)
+                idxs.append(idx)
+                if pos <= 0. or pos >= mesh_cnt - 1:
+                    # Outside the mesh along this axis
+                    twist = 0.
+                twist *= (c1 - c0) * (t - last_t) / mesh_dist
+            twist *= self.mesh_coeffs[idxs[1]][idxs[0]][3]
+            count = int(math.ceil(math.sqrt(abs(twist) / (4. * max_deviation))))
+            for j in range(1, count):
+                points.append(last_t + (t - last_t) * j / count)
+            if t < 1.:
+                points.append(t)
+            last_t = t
+        return points
     def get_z_range(self):
         if self.mesh_matrix is not None:
             mesh_min = min([min(x) for x in self.mesh_matrix])
@@ -1452,27 +1579,12 @@ class ZMesh:
             return round(avg_z, 2)
         else:
             return 0.
-    def _get_linear_index(self, coord, axis):
-        if axis == 0:
-            # X-axis
-            mesh_min = self.mesh_x_min
-            mesh_cnt = self.mesh_x_count
-            mesh_dist = self.mesh_x_dist
-            cfunc = self.get_x_coordinate
-        else:
-            # Y-axis
-            mesh_min = self.mesh_y_min
-            mesh_cnt = self.mesh_y_count
-            mesh_dist = self.mesh_y_dist
-            cfunc = self.get_y_coordinate
-        t = 0.
-        idx = int(math.floor((coord - mesh_min) / mesh_dist))
-        idx = constrain(idx, 0, mesh_cnt - 2)
-        t = (coord - cfunc(idx)) / mesh_dist
-        return constrain(t, 0., 1.), idx
     def _sample_direct(self, z_matrix):
         self.mesh_matrix = z_matrix
     def _sample_lagrange(self, z_matrix):
+        if self.numpy is not None:
+            self._sample_lagrange_numpy(z_matrix)
+            return
         x_mult = self.x_mult
         y_mult = self.y_mult
         self.mesh_matrix = \
@@ -1498,6 +1610,48 @@ class ZMesh:
                     continue
                 y = self.get_y_coordinate(j)
                 self.mesh_matrix[j][i] = self._calc_lagrange(ypts, y, i, 1)
+    def _sample_lagrange_numpy(self, z_matrix):
+        # Vectorized version of the loops above - the arithmetic is
+        # performed in the same order so the results are identical
+        np = self.numpy
+        x_mult = self.x_mult
+        y_mult = self.y_mult
+        matrix = np.zeros((self.mesh_y_count, self.mesh_x_count))
+        matrix[::y_mult, ::x_mult] = z_matrix
+        xpts, ypts = self._get_lagrange_coords()
+        # Interpolate X coordinates (only on rows with probed coordinates)
+        x_idx = np.array([i for i in range(self.mesh_x_count) if i % x_mult])
+        if len(x_idx):
+            x = self.mesh_x_min + self.mesh_x_dist * x_idx
+            z = matrix[::y_mult, ::x_mult]
+            total = np.zeros((z.shape[0], len(x_idx)))
+            for i, n, d in self._calc_lagrange_numpy(xpts, x):
+                total += z[:, i:i+1] * n / d
+            matrix[::y_mult, x_idx] = total
+        # Interpolate Y coordinates
+        y_idx = np.array([j for j in range(self.mesh_y_count) if j % y_mult])
+        if len(y_idx):
+            y = self.mesh_y_min + self.mesh_y_dist * y_idx
+            z = matrix[::y_mult, :]
+            total = np.zeros((len(y_idx), self.mesh_x_count))
+            for i, n, d in self._calc_lagrange_numpy(ypts, y):
+                total += z[i] * n[:, np.newaxis] / d
+            matrix[y_idx, :] = total
+        self.mesh_matrix = matrix.tolist()
+    def _calc_lagrange_numpy(self, lpts, c):
+        # Yield the numerator and denominator of the weight of each
+        # lagrange point at the coordinates in array 'c'
+        np = self.numpy
+        pt_cnt = len(lpts)
+        for i in range(pt_cnt):
+            n = np.ones(len(c))
+            d = 1.
+            for j in range(pt_cnt):
+                if j == i:
+                    continue
+                n *= (c - lpts[j])
+                d *= (lpts[i] - lpts[j])
+            yield i, n, d
     def _get_lagrange_coords(self):
         xpts = []
         ypts = []
@@ -1527,6 +1681,9 @@ class ZMesh:
         return total
     def _sample_bicubic(self, z_matrix):
         # should work for any number of probe points above 3x3
+        if self.numpy is not None:
+            self._sample_bicubic_numpy(z_matrix)
+            return
         x_mult = self.x_mult
         y_mult = self.y_mult
         c = self.mesh_params['tension']
@@ -1551,6 +1708,52 @@ class ZMesh:
                     continue
                 pts = self._get_y_ctl_pts(x, y)
                 self.mesh_matrix[y][x] = self._cardinal_spline(pts, c)
+    def _sample_bicubic_numpy(self, z_matrix):
+        # Vectorized version of the loops above - the arithmetic is
+        # performed in the same order so the results are identical
+        np = self.numpy
+        x_mult = self.x_mult
+        y_mult = self.y_mult
+        c = self.mesh_params['tension']
+        matrix = np.zeros((self.mesh_y_count, self.mesh_x_count))
+        matrix[::y_mult, ::x_mult] = z_matrix
+        # Interpolate X values
+        if x_mult > 1:
+            pts = self._get_ctl_pts_numpy(matrix[::y_mult, ::x_mult].T)
+            vals = self._cardinal_spline_numpy(pts, x_mult, c)
+            # vals[segment][t][row]
+            x_idx = [i for i in range(self.mesh_x_count) if i % x_mult]
+            matrix[::y_mult, x_idx] = vals.reshape(len(x_idx), -1).T
+        # Interpolate Y values
+        if y_mult > 1:
+            pts = self._get_ctl_pts_numpy(matrix[::y_mult, :])
+            vals = self._cardinal_spline_numpy(pts, y_mult, c)
+            y_idx = [j for j in range(self.mesh_y_count) if j % y_mult]
+            matrix[y_idx, :] = vals.reshape(len(y_idx), -1)
+        self.mesh_matrix = matrix.tolist()
+    def _get_ctl_pts_numpy(self, probed):
+        # Return the control points of each segment between the rows
+        # of the 'probed' array
+        np = self.numpy
+        seg_cnt = probed.shape[0] - 1
+        segs = np.arange(seg_cnt)
+        p0 = probed[np.maximum(segs - 1, 0)]
+        p3 = probed[np.minimum(segs + 2, seg_cnt)]
+        return p0, probed[:-1], probed[1:], p3
+    def _cardinal_spline_numpy(self, p, mult, tension):
+        # Evaluate the splines of all segments at each t in a segment
+        np = self.numpy
+        t = (np.arange(1, mult) / float(mult))[:, np.newaxis]
+        t2 = t*t
+        t3 = t2*t
+        p0, p1, p2, p3 = [v[:, np.newaxis, :] for v in p]
+        m1 = tension * (p2 - p0)
+        m2 = tension * (p3 - p1)
+        a = p1 * (2*t3 - 3*t2 + 1)
+        b = p2 * (-2*t3 + 3*t2)
+        c = m1 * (t3 - 2*t2 + t)
+        d = m2 * (t3 - t2)
+        return a + b + c + d
     def _get_x_ctl_pts(self, x, y):
         # Fetch control points and t for a X value in the mesh
         x_mult = self.x_mult
@@ -4,6 +4,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging, threading, struct
+import chelper
 
 # This "bulk sensor" module facilitates the processing of sensor chip
 # measurements that do not require the host to respond with low
@@ -109,7 +110,7 @@ class BatchWebhooksClient:
             return False
         tmp = dict(self.template)
         tmp['params'] = msg
-        self.cconn.send(tmp)
+        self.cconn.send_bulk(tmp)
         return True
 
 # Helper class to store incoming messages in a queue
@@ -131,6 +132,41 @@ class BulkDataQueue:
     def clear_queue(self):
         self.pull_queue()
 
+# Helper class to store incoming messages in a C buffer.  The messages
+# are parsed in the serial background thread and are not delivered to
+# Python response handlers while the queue is started.
+class CBulkDataQueue:
+    def __init__(self, mcu, oid):
+        self.mcu = mcu
+        ffi_main, ffi_lib = chelper.get_ffi()
+        self.ffi_main, self.ffi_lib = ffi_main, ffi_lib
+        data_tag = mcu.lookup_command(
+            "sensor_bulk_data oid=%c sequence=%hu data=%*s").get_command_tag()
+        self.bulkqueue = ffi_main.gc(ffi_lib.bulkqueue_alloc(
+            mcu.get_serialqueue(), data_tag, oid),
+            ffi_lib.bulkqueue_free)
+        self.pull_data = ffi_main.new('struct bulkqueue_data *')
+        # Discard any messages received while stopped
+        mcu.register_response((lambda params: None), "sensor_bulk_data", oid)
+    def start(self):
+        self.ffi_lib.bulkqueue_start(self.bulkqueue)
+    def stop(self):
+        self.ffi_lib.bulkqueue_stop(self.bulkqueue)
+    def pull_queue(self):
+        # Return the (sequences, lengths, data) of the messages received
+        # since the last call.  The 'data' memoryview contains the
+        # contents of all messages and is only valid until the next call.
+        pd = self.pull_data
+        self.ffi_lib.bulkqueue_pull(self.bulkqueue, pd)
+        count = pd.msg_count
+        if not count:
+            return [], [], memoryview(b"")
+        ffi_main = self.ffi_main
+        sequences = ffi_main.unpack(pd.sequences, count)
+        lengths = ffi_main.unpack(pd.lengths, count)
+        data = memoryview(ffi_main.buffer(pd.data, pd.data_len))
+        return sequences, lengths, data
+
 
 ######################################################################
 # Clock synchronization
@@ -207,7 +243,14 @@ class FixedFreqReader:
         self.mcu = mcu
         self.clock_sync = ClockSyncRegression(mcu, chip_clock_smooth)
         unpack = struct.Struct(unpack_fmt)
-        self.unpack_from = unpack.unpack_from
+        self.iter_unpack = getattr(unpack, 'iter_unpack', None)
+        if self.iter_unpack is None:
+            # Python 2 does not support Struct.iter_unpack()
+            unpack_from, size = unpack.unpack_from, unpack.size
+            def iter_unpack(data):
+                return [unpack_from(data, pos)
+                        for pos in range(0, len(data), size)]
+            self.iter_unpack = iter_unpack
         self.bytes_per_sample = unpack.size
         self.samples_per_block = MAX_BULK_MSG_SIZE // self.bytes_per_sample
         self.last_sequence = self.max_query_duration = 0
@@ -221,7 +264,7 @@ class FixedFreqReader:
             " next_sequence=%hu buffered=%u possible_overflows=%hu",
             oid=oid, cq=cq)
         # Read sensor_bulk_data messages and store in a queue
-        self.bulk_queue = BulkDataQueue(self.mcu, oid=oid)
+        self.bulk_queue = CBulkDataQueue(self.mcu, oid)
     def get_last_overflows(self):
         return self.last_overflows
     def _clear_duration_filter(self):
@@ -229,15 +272,15 @@ class FixedFreqReader:
     def note_start(self):
         self.last_sequence = 0
         self.last_overflows = 0
-        # Clear local queue (clear any stale samples from previous session)
-        self.bulk_queue.clear_queue()
+        # Start local queue (clear any stale samples from previous session)
+        self.bulk_queue.start()
         # Set initial clock
         self._clear_duration_filter()
         self._update_clock(is_reset=True)
         self._clear_duration_filter()
     def note_end(self):
-        # Clear local queue (free no longer needed memory)
-        self.bulk_queue.clear_queue()
+        # Stop local queue
+        self.bulk_queue.stop()
     def _update_clock(self, is_reset=False):
         params = self.query_status_cmd.send([self.oid])
         mcu_clock = self.mcu.clock32_to_clock64(params['clock'])
@@ -269,29 +312,39 @@ class FixedFreqReader:
         # Query MCU for sample timing and update clock synchronization
         self._update_clock()
         # Pull sensor_bulk_data messages from local queue
-        raw_samples = self.bulk_queue.pull_queue()
-        if not raw_samples:
+        sequences, lengths, data = self.bulk_queue.pull_queue()
+        if not sequences:
             return []
         # Load variables to optimize inner loop below
         last_sequence = self.last_sequence
         time_base, chip_base, inv_freq = self.clock_sync.get_time_translation()
-        unpack_from = self.unpack_from
         bytes_per_sample = self.bytes_per_sample
         samples_per_block = self.samples_per_block
-        # Process every message in raw_samples
-        count = seq = 0
-        samples = [None] * (len(raw_samples) * samples_per_block)
-        for params in raw_samples:
-            seq_diff = (params['sequence'] - last_sequence) & 0xffff
+        # Determine the chip clock of the first sample of each message
+        msg_cdiffs = []
+        for seq in sequences:
+            seq_diff = (seq - last_sequence) & 0xffff
             seq_diff -= (seq_diff & 0x8000) << 1
             seq = last_sequence + seq_diff
-            msg_cdiff = seq * samples_per_block - chip_base
-            data = params['data']
-            for i in range(len(data) // bytes_per_sample):
-                ptime = time_base + (msg_cdiff + i) * inv_freq
-                udata = unpack_from(data, i * bytes_per_sample)
-                samples[count] = (ptime,) + udata
-                count += 1
-        self.clock_sync.set_last_chip_clock(seq * samples_per_block + i)
-        del samples[count:]
+            msg_cdiffs.append(seq * samples_per_block - chip_base)
+        iter_unpack = self.iter_unpack
+        block_size = samples_per_block * bytes_per_sample
+        if lengths.count(block_size) == len(lengths):
+            # All messages are full - unpack all samples at once
+            count = samples_per_block
+            times = [time_base + (msg_cdiff + i) * inv_freq
+                     for msg_cdiff in msg_cdiffs for i in range(count)]
+            udata = iter_unpack(data)
+        else:
+            times = []
+            udata = []
+            pos = 0
+            for msg_cdiff, length in zip(msg_cdiffs, lengths):
+                count = length // bytes_per_sample
+                times.extend([time_base + (msg_cdiff + i) * inv_freq
+                              for i in range(count)])
+                udata.extend(iter_unpack(data[pos:pos+count*bytes_per_sample]))
+                pos += length
+        samples = [(ptime,) + u for ptime, u in zip(times, udata)]
+        self.clock_sync.set_last_chip_clock(seq * samples_per_block + count - 1)
         return samples
@@ -7,11 +7,14 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging, os, ast
 from . import aip31068_spi, hd44780, hd44780_spi, st7920, uc1701, menu
+from .. import gcode_macro
 
 # Normal time between each screen redraw
 REDRAW_TIME = 0.500
 # Minimum time between screen redraws
 REDRAW_MIN_TIME = 0.100
+# Default maximum time to reuse the text of an unchanged display_data item
+REFRESH_TIME = 5.
 
 LCD_chips = {
     'st7920': st7920.ST7920, 'emulated_st7920': st7920.EmulatedST7920,
@@ -52,6 +55,98 @@ class DisplayTemplate:
         context.update(params)
         return self.template.render(context)
 
+# Tracking of the printer status fields read while rendering templates
+MISSING = object()
+ALL_FIELDS = object()
+
+def _read_all_fields(method):
+    def read_all(self, *args, **kwargs):
+        self._reads[ALL_FIELDS] = True
+        return method(self, *args, **kwargs)
+    return read_all
+
+class TrackedStatus(gcode_macro.StatusDict):
+    __slots__ = ('_reads',)
+    def __init__(self, status, reads):
+        gcode_macro.StatusDict.__init__(self, status)
+        self._reads = reads
+    def __getitem__(self, key):
+        val = dict.get(self, key, MISSING)
+        self._reads[key] = val
+        if val is MISSING:
+            raise KeyError(key)
+        return val
+    def get(self, key, default=None):
+        val = dict.get(self, key, MISSING)
+        self._reads[key] = val
+        if val is MISSING:
+            return default
+        return val
+    def __contains__(self, key):
+        val = dict.get(self, key, MISSING)
+        self._reads[key] = val
+        return val is not MISSING
+    # Any other access may depend on all fields
+    __iter__ = _read_all_fields(dict.__iter__)
+    __len__ = _read_all_fields(dict.__len__)
+    __repr__ = _read_all_fields(dict.__repr__)
+    __eq__ = _read_all_fields(dict.__eq__)
+    __ne__ = _read_all_fields(dict.__ne__)
+    __hash__ = None
+    keys = _read_all_fields(dict.keys)
+    values = _read_all_fields(dict.values)
+    items = _read_all_fields(dict.items)
+
+class StatusTracker:
+    def __init__(self, status_wrapper):
+        self.status_wrapper = status_wrapper
+        self.deps = {}
+    def start(self):
+        self.deps = {}
+    def get_deps(self):
+        return self.deps
+    def __getitem__(self, val):
+        status = self.status_wrapper[val]
+        reads = {}
+        self.deps[str(val).strip()] = (status, reads)
+        return TrackedStatus(status, reads)
+    def __contains__(self, val):
+        # The available printer objects do not change at run-time
+        return val in self.status_wrapper
+    def __iter__(self):
+        return iter(self.status_wrapper)
+
+# Last rendered output of a display_data item
+class DisplayItemState:
+    def __init__(self, refresh_time):
+        self.refresh_time = refresh_time
+        self.text = ""
+        self.draw_ops = []
+        self.deps = None
+        self.expire_time = 0.
+    def update(self, text, draw_ops, deps, eventtime):
+        self.text = text
+        self.draw_ops = draw_ops
+        self.deps = deps
+        self.expire_time = eventtime + self.refresh_time
+    def is_current(self, status_wrapper, eventtime):
+        # Check if any of the status fields read by the item have changed
+        if self.deps is None or eventtime >= self.expire_time:
+            return False
+        for name, (status, reads) in self.deps.items():
+            cur_status = status_wrapper[name]
+            if cur_status is status:
+                continue
+            if ALL_FIELDS in reads:
+                if cur_status != status:
+                    return False
+                continue
+            for key, val in reads.items():
+                cur_val = cur_status.get(key, MISSING)
+                if cur_val is not val and cur_val != val:
+                    return False
+        return True
+
 # Store [display_data my_group my_item] sections (one instance per group name)
 class DisplayGroup:
     def __init__(self, config, name, data_configs):
@@ -68,23 +163,48 @@ class DisplayGroup:
         # Load all templates and store sorted by display position
         configs_by_name = {c.get_name(): c for c in data_configs}
         printer = config.get_printer()
+        self.reactor = printer.get_reactor()
         gcode_macro = printer.load_object(config, 'gcode_macro')
         self.data_items = []
         for row, col, name in sorted(items):
             c = configs_by_name[name]
             if c.get('text'):
                 template = gcode_macro.load_template(c, 'text')
-                self.data_items.append((row, col, template))
+                refresh_time = c.getfloat('refresh_time', REFRESH_TIME,
+                                          minval=0.)
+                state = DisplayItemState(refresh_time)
+                self.data_items.append((row, col, template, state))
     def show(self, display, templates, eventtime):
+        # Render the items - returns (render_count, skip_count, render_time)
         context = self.data_items[0][2].create_template_context(eventtime)
-        context['draw_progress_bar'] = display.draw_progress_bar
+        status_wrapper = context['printer']
+        tracker = StatusTracker(status_wrapper)
+        context['printer'] = tracker
+        draw_ops = []
+        def draw_progress_bar(*args):
+            draw_ops.append(args)
+            return display.draw_progress_bar(*args)
+        context['draw_progress_bar'] = draw_progress_bar
         def render(name, **kwargs):
             return templates[name].render(context, **kwargs)
         context['render'] = render
-        for row, col, template in self.data_items:
-            text = template.render(context)
-            display.draw_text(row, col, text.replace('\n', ''), eventtime)
+        render_count = skip_count = 0
+        start_time = self.reactor.monotonic()
+        for row, col, template, state in self.data_items:
+            if state.is_current(status_wrapper, eventtime):
+                for args in state.draw_ops:
+                    display.draw_progress_bar(*args)
+                skip_count += 1
+            else:
+                tracker.start()
+                draw_ops = []
+                text = template.render(context).replace('\n', '')
+                state.update(text, draw_ops, tracker.get_deps(), eventtime)
+                render_count += 1
+            display.draw_text(row, col, state.text, eventtime)
         context.clear() # Remove circular references for better gc
+        return (render_count, skip_count,
+                self.reactor.monotonic() - start_time)
 
 # Global cache of DisplayTemplate, DisplayGroup, and glyphs
 class PrinterDisplayTemplate:
@@ -204,6 +324,8 @@ class PrinterLCD:
             self.screen_update_event)
         self.redraw_request_pending = False
         self.redraw_time = 0.
+        self.render_count = self.render_skip_count = 0
+        self.render_time = 0.
         # Register g-code commands
         gcode = self.printer.lookup_object("gcode")
         gcode.register_mux_command('SET_DISPLAY_GROUP', 'DISPLAY', name,
@@ -214,6 +336,10 @@ class PrinterLCD:
                                        self.cmd_SET_DISPLAY_GROUP)
     def get_dimensions(self):
         return self.lcd_chip.get_dimensions()
+    def get_status(self, eventtime):
+        return {'render_count': self.render_count,
+                'render_skip_count': self.render_skip_count,
+                'render_time': self.render_time}
     def handle_ready(self):
         self.lcd_chip.init()
         # Start screen update timer
@@ -232,7 +358,11 @@ class PrinterLCD:
                 return eventtime + REDRAW_TIME
         # Update normal display
         try:
-            self.show_data_group.show(self, self.display_templates, eventtime)
+            res = self.show_data_group.show(self, self.display_templates,
+                                            eventtime)
+            self.render_count += res[0]
+            self.render_skip_count += res[1]
+            self.render_time += res[2]
         except:
             logging.exception("Error during display screen update")
         self.lcd_chip.flush()
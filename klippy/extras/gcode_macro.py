@@ -3,7 +3,7 @@
 # Copyright (C) 2018-2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import traceback, logging, ast, copy, json
+import sys, os, traceback, logging, ast, copy, json, time, hashlib, marshal
 import jinja2
 
 
@@ -11,11 +11,90 @@ import jinja2
 # Template handling
 ######################################################################
 
+# Read-only containers used for shared get_status() snapshots
+def _readonly_error(self, *args, **kwargs):
+    raise TypeError("'%s' object is read-only" % (type(self).__name__,))
+
+class StatusDict(dict):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _readonly_error
+    clear = pop = popitem = setdefault = update = _readonly_error
+    def __copy__(self):
+        return dict(self)
+    def __deepcopy__(self, memo):
+        return {k: copy.deepcopy(v, memo) for k, v in self.items()}
+
+class StatusList(list):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly_error
+    append = clear = extend = insert = pop = remove = _readonly_error
+    reverse = sort = _readonly_error
+    def __copy__(self):
+        return list(self)
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(v, memo) for v in self]
+
+IMMUTABLE_TYPES = (float, int, str, bool, type(None))
+
+# Create a read-only copy of a get_status() result
+def freeze_status(val):
+    vtype = type(val)
+    if vtype in IMMUTABLE_TYPES:
+        return val
+    if isinstance(val, dict):
+        return StatusDict([(k, freeze_status(v)) for k, v in val.items()])
+    if isinstance(val, list):
+        return StatusList([freeze_status(v) for v in val])
+    if isinstance(val, tuple):
+        items = [freeze_status(v) for v in val]
+        if hasattr(val, '_fields'):
+            # namedtuple (eg, gcode.Coord)
+            return vtype(*items)
+        return tuple(items)
+    if isinstance(val, (set, frozenset)):
+        return frozenset(val)
+    return copy.deepcopy(val)
+
+# Snapshots of printer object get_status() results shared by all
+# templates.  A new snapshot is only created when the status of an
+# object changes, which avoids copying large status dictionaries
+# (eg, configfile settings or bed_mesh matrices) on every render.
+# Objects that implement get_status_version() are only queried when
+# their version changes; other objects are compared with the snapshot.
+class StatusSnapshots:
+    def __init__(self):
+        self.snapshots = {}
+    def get_status(self, name, po, eventtime):
+        version = None
+        if hasattr(po, 'get_status_version'):
+            version = po.get_status_version()
+        snap = self.snapshots.get(name)
+        if snap is not None and snap[0] is po:
+            if snap[1] == eventtime:
+                return snap[3]
+            if version is not None and version == snap[2]:
+                # Object reports its status is unchanged
+                self.snapshots[name] = (po, eventtime, version, snap[3])
+                return snap[3]
+            status = po.get_status(eventtime)
+            if version is None and snap[3] == status:
+                # Status unchanged - reuse the existing snapshot
+                self.snapshots[name] = (po, eventtime, version, snap[3])
+                return snap[3]
+        else:
+            status = po.get_status(eventtime)
+        frozen = freeze_status(status)
+        self.snapshots[name] = (po, eventtime, version, frozen)
+        return frozen
+
 # Wrapper for access to printer object get_status() methods
 class GetStatusWrapper:
-    def __init__(self, printer, eventtime=None):
+    def __init__(self, printer, eventtime=None, snapshots=None):
         self.printer = printer
         self.eventtime = eventtime
+        if snapshots is None:
+            snapshots = StatusSnapshots()
+        self.snapshots = snapshots
         self.cache = {}
     def __getitem__(self, val):
         sval = str(val).strip()
@@ -26,7 +105,8 @@ class GetStatusWrapper:
             raise KeyError(val)
         if self.eventtime is None:
             self.eventtime = self.printer.get_reactor().monotonic()
-        self.cache[sval] = res = copy.deepcopy(po.get_status(self.eventtime))
+        self.cache[sval] = res = self.snapshots.get_status(
+            sval, po, self.eventtime)
         return res
     def __contains__(self, val):
         try:
@@ -39,6 +119,73 @@ class GetStatusWrapper:
             if self.__contains__(name):
                 yield name
 
+# On-disk cache of compiled templates (indexed by a hash of the
+# template source) so that unchanged templates are not recompiled on
+# each restart
+TEMPLATE_CACHE_FILE = "templates.cache"
+
+class TemplateCache:
+    def __init__(self, cache_dir):
+        self.filename = None
+        if cache_dir:
+            self.filename = os.path.join(cache_dir, TEMPLATE_CACHE_FILE)
+        self.version = "%s %s" % (jinja2.__version__, sys.version)
+        self.cached = {}
+        self.used = {}
+        self.need_save = False
+        self.compile_count = self.cache_count = 0
+        self.load_time = 0.
+        self._load()
+    def _load(self):
+        if self.filename is None:
+            return
+        try:
+            with open(self.filename, 'rb') as f:
+                data = marshal.load(f)
+            if data['version'] == self.version:
+                self.cached = data['templates']
+        except (IOError, OSError, EOFError, ValueError, TypeError, KeyError):
+            pass
+    def save(self):
+        if self.filename is None or not self.need_save:
+            return
+        self.need_save = False
+        data = {'version': self.version, 'templates': self.used}
+        tmpname = self.filename + ".tmp"
+        try:
+            cache_dir = os.path.dirname(self.filename)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            with open(tmpname, 'wb') as f:
+                marshal.dump(data, f)
+            os.rename(tmpname, self.filename)
+        except (IOError, OSError) as e:
+            # Unable to cache the templates - not a fatal error
+            logging.info("Unable to write template cache %s: %s",
+                         self.filename, e)
+    def from_string(self, env, script):
+        start_time = time.time()
+        key = hashlib.sha1(repr((env.block_start_string, env.block_end_string,
+                                 env.variable_start_string,
+                                 env.variable_end_string,
+                                 script)).encode()).hexdigest()
+        code = self.used.get(key, self.cached.get(key))
+        if code is None:
+            code = env.compile(script)
+            self.compile_count += 1
+            self.need_save = True
+        else:
+            self.cache_count += 1
+        self.used[key] = code
+        template = env.template_class.from_code(
+            env, code, env.make_globals(None), None)
+        self.load_time += time.time() - start_time
+        return template
+    def log_stats(self):
+        logging.info("Loaded %d templates in %.3fs (%d compiled, %d cached)",
+                     self.compile_count + self.cache_count, self.load_time,
+                     self.compile_count, self.cache_count)
+
 # Wrapper around a Jinja2 template
 class TemplateWrapper:
     def __init__(self, printer, env, name, script):
@@ -47,8 +194,9 @@ class TemplateWrapper:
         self.gcode = self.printer.lookup_object('gcode')
         gcode_macro = self.printer.lookup_object('gcode_macro')
         self.create_template_context = gcode_macro.create_template_context
+        template_cache = gcode_macro.template_cache
         try:
-            self.template = env.from_string(script)
+            self.template = template_cache.from_string(env, script)
         except jinja2.exceptions.TemplateSyntaxError as e:
             lines = script.splitlines()
             msg = "Error loading template '%s'\nline %s: %s # %s" % (
@@ -78,6 +226,13 @@ class PrinterGCodeMacro:
     def __init__(self, config):
         self.printer = config.get_printer()
         self.env = jinja2.Environment('{%', '%}', '{', '}')
+        self.status_snapshots = StatusSnapshots()
+        cache_dir = self.printer.get_start_args().get('cache_dir')
+        self.template_cache = TemplateCache(cache_dir)
+        self.printer.register_event_handler("klippy:ready",
+                                            self._handle_ready)
+        self.printer.register_event_handler("klippy:disconnect",
+                                            self._handle_disconnect)
     def load_template(self, config, option, default=None):
         name = "%s:%s" % (config.get_name(), option)
         if default is None:
@@ -85,6 +240,13 @@ class PrinterGCodeMacro:
         else:
             script = config.get(option, default)
         return TemplateWrapper(self.printer, self.env, name, script)
+    def _handle_ready(self):
+        # All config templates are loaded by this point
+        self.template_cache.log_stats()
+        self.template_cache.save()
+    def _handle_disconnect(self):
+        # Store any templates that were loaded after startup
+        self.template_cache.save()
     def _action_emergency_stop(self, msg="action_emergency_stop"):
         self.printer.invoke_shutdown("Shutdown due to %s" % (msg,))
         return ""
@@ -102,7 +264,8 @@ class PrinterGCodeMacro:
         return ""
     def create_template_context(self, eventtime=None):
         return {
-            'printer': GetStatusWrapper(self.printer, eventtime),
+            'printer': GetStatusWrapper(self.printer, eventtime,
+                                        self.status_snapshots),
             'action_emergency_stop': self._action_emergency_stop,
             'action_respond_info': self._action_respond_info,
             'action_raise_error': self._action_raise_error,
@@ -35,6 +35,7 @@ class GCodeMove:
             desc = getattr(self, 'cmd_' + cmd + '_help', None)
             gcode.register_command(cmd, func, False, desc)
         gcode.register_command('G0', self.cmd_G1)
+        gcode.register_simple_move_handler(self.cmd_G1, self._simple_G1)
         gcode.register_command('M114', self.cmd_M114, True)
         gcode.register_command('GET_POSITION', self.cmd_GET_POSITION, True,
                                desc=self.cmd_GET_POSITION_help)
@@ -155,6 +156,28 @@ class GCodeMove:
             raise gcmd.error("Unable to parse move '%s'"
                              % (gcmd.get_commandline(),))
         self.move_with_transform(self.last_position, self.speed)
+    def _simple_G1(self, params):
+        # Move (from g-code fast path parser - params is [x, y, z, e, f])
+        last_position = self.last_position
+        base_position = self.base_position
+        absolute_coord = self.absolute_coord
+        for pos in range(3):
+            v = params[pos]
+            if v is not None:
+                if absolute_coord:
+                    last_position[pos] = v + base_position[pos]
+                else:
+                    last_position[pos] += v
+        v = params[3]
+        if v is not None:
+            v *= self.extrude_factor
+            if absolute_coord and self.absolute_extrude:
+                last_position[3] = v + base_position[3]
+            else:
+                last_position[3] += v
+        if params[4] is not None:
+            self.speed = params[4] * self.speed_factor
+        self.move_with_transform(last_position, self.speed)
     # G-Code coordinate manipulation
     def cmd_G20(self, gcmd):
         # Set units to inches
@@ -3,7 +3,7 @@
 # Copyright (C) 2025  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging
+import logging, os
 import chelper
 
 BGFLUSH_LOW_TIME = 0.200
@@ -26,10 +26,17 @@ class PrinterMotionQueuing:
         self.trapqs = []
         self.stepcompress = []
         self.steppersyncs = []
+        # Step generation profiling
+        self.stepper_stats = []
+        self.stats_buf = None
+        # Parallel step generation
+        self.stepgen_pool = self.stepgen_args = None
+        self.stepgen_times = []
+        self._setup_stepgen_pool()
         # Low-level C flushing calls
         ffi_main, ffi_lib = chelper.get_ffi()
         self.trapq_finalize_moves = ffi_lib.trapq_finalize_moves
-        self.steppersync_generate_steps = ffi_lib.steppersync_generate_steps
+        self.stepgen_pool_generate_steps = ffi_lib.stepgen_pool_generate_steps
         self.steppersync_flush = ffi_lib.steppersync_flush
         self.steppersync_history_expire = ffi_lib.steppersync_history_expire
         # Flush notification callbacks
@@ -58,11 +65,13 @@ class PrinterMotionQueuing:
         trapq = ffi_main.gc(ffi_lib.trapq_alloc(), ffi_lib.trapq_free)
         self.trapqs.append(trapq)
         return trapq
-    def allocate_stepcompress(self, mcu, oid):
+    def allocate_stepcompress(self, mcu, oid, name=None):
         ffi_main, ffi_lib = chelper.get_ffi()
         sc = ffi_main.gc(ffi_lib.stepcompress_alloc(oid),
                          ffi_lib.stepcompress_free)
         self.stepcompress.append((mcu, sc))
+        if name is not None:
+            self.stepper_stats.append((name, sc))
         return sc
     def allocate_steppersync(self, mcu, serialqueue, move_count):
         stepqueues = []
@@ -75,7 +84,26 @@ class PrinterMotionQueuing:
                                       move_count),
             ffi_lib.steppersync_free)
         self.steppersyncs.append((mcu, ss))
+        self._setup_stepgen_pool()
         return ss
+    def _setup_stepgen_pool(self):
+        # Use a worker thread for each additional mcu (up to cpu count)
+        ffi_main, ffi_lib = chelper.get_ffi()
+        ss_num = len(self.steppersyncs)
+        try:
+            cpu_count = os.sysconf('SC_NPROCESSORS_ONLN')
+        except (ValueError, OSError):
+            cpu_count = 1
+        num_threads = max(0, min(ss_num, cpu_count) - 1)
+        self.stepgen_pool = None
+        self.stepgen_pool = ffi_main.gc(
+            ffi_lib.stepgen_pool_alloc(num_threads), ffi_lib.stepgen_pool_free)
+        ss_list = ffi_main.new("struct steppersync *[]",
+                               [ss for mcu, ss in self.steppersyncs])
+        self.stepgen_args = (ss_list, ffi_main.new("uint64_t[]", ss_num),
+                             ffi_main.new("int32_t[]", ss_num),
+                             ffi_main.new("double[]", ss_num))
+        self.stepgen_times = [0.] * ss_num
     def register_flush_callback(self, callback):
         self.flush_callbacks.append(callback)
     def unregister_flush_callback(self, callback):
@@ -87,16 +115,23 @@ class PrinterMotionQueuing:
         # Invoke flush callbacks (if any)
         for cb in self.flush_callbacks:
             cb(must_flush_time, max_step_gen_time)
-        # Generate stepper movement and transmit
-        for mcu, ss in self.steppersyncs:
-            clock = max(0, mcu.print_time_to_clock(must_flush_time))
-            # Generate steps
-            ret = self.steppersync_generate_steps(ss, max_step_gen_time, clock)
-            if ret:
+        # Generate steps (in parallel on each mcu)
+        steppersyncs = self.steppersyncs
+        ss_list, flush_clocks, results, gen_times = self.stepgen_args
+        for i, (mcu, ss) in enumerate(steppersyncs):
+            flush_clocks[i] = max(0, mcu.print_time_to_clock(must_flush_time))
+        self.stepgen_pool_generate_steps(
+            self.stepgen_pool, ss_list, flush_clocks, results, gen_times,
+            len(steppersyncs), max_step_gen_time)
+        stepgen_times = self.stepgen_times
+        for i, (mcu, ss) in enumerate(steppersyncs):
+            stepgen_times[i] += gen_times[i]
+            if results[i]:
                 raise mcu.error("Internal error in MCU '%s' stepcompress"
                                 % (mcu.get_name(),))
-            # Flush steps from steppersync
-            ret = self.steppersync_flush(ss, clock)
+        # Transmit steps from steppersync
+        for i, (mcu, ss) in enumerate(steppersyncs):
+            ret = self.steppersync_flush(ss, flush_clocks[i])
             if ret:
                 raise mcu.error("Internal error in MCU '%s' stepcompress"
                                 % (mcu.get_name(),))
@@ -119,6 +154,24 @@ class PrinterMotionQueuing:
     def lookup_trapq_append(self):
         ffi_main, ffi_lib = chelper.get_ffi()
         return ffi_lib.trapq_append
+    # Step generation profiling
+    def _get_stepper_stats(self):
+        ffi_main, ffi_lib = chelper.get_ffi()
+        if self.stats_buf is None:
+            self.stats_buf = ffi_main.new('struct stepcompress_stats *')
+        buf = self.stats_buf
+        out = []
+        for name, sc in self.stepper_stats:
+            ffi_lib.stepcompress_get_stats(sc, buf)
+            out.append((name, {
+                'steps': buf.step_count,
+                'solver_iterations': buf.solver_iterations,
+                'solve_time': buf.solve_time,
+                'compress_time': buf.compress_time,
+                'queue_steps': buf.queue_step_count}))
+        return out
+    def get_status(self, eventtime):
+        return {'step_generation': dict(self._get_stepper_stats())}
     def stats(self, eventtime):
         # Hack to globally invoke mcu check_active()
         for m in self.all_mcus:
@@ -126,7 +179,13 @@ class PrinterMotionQueuing:
         # Calculate history expiration
         est_print_time = self.mcu.estimated_print_time(eventtime)
         self.clear_history_time = est_print_time - MOVE_HISTORY_EXPIRE
-        return False, ""
+        # Report time spent generating steps for each mcu
+        if not self.steppersyncs:
+            return False, ""
+        gen_times = ["%s_stepgen_time=%.3f" % (mcu.get_name(), t)
+                     for (mcu, ss), t in zip(self.steppersyncs,
+                                             self.stepgen_times)]
+        return False, "motion_queuing: %s" % (" ".join(gen_times),)
     # Kinematic step generation scan window time tracking
     def get_kin_flush_delay(self):
         return self.kin_flush_delay
@@ -227,6 +227,15 @@ class ResonanceTester:
                 (chip_axis, self.printer.lookup_object(chip_name))
                 for chip_axis, chip_name in self.accel_chip_names]
 
+    def _stream_data(self, helper, aclient, chip, keep_samples=False):
+        # Chips that do not report their data rate are processed after
+        # the measurements complete
+        data_rate = getattr(chip, 'data_rate', None)
+        if data_rate is None:
+            return aclient
+        return helper.stream_accelerometer_data(aclient, data_rate,
+                                                keep_samples)
+
     def _run_test(self, gcmd, axes, helper, raw_name_suffix=None,
                   accel_chips=None, test_point=None):
         toolhead = self.printer.lookup_object('toolhead')
@@ -252,34 +261,43 @@ class ResonanceTester:
                     for chip_axis, chip in self.accel_chips:
                         if axis.matches(chip_axis):
                             aclient = chip.start_internal_client()
-                            raw_values.append((chip_axis, aclient, chip.name))
+                            raw_values.append((chip_axis, aclient, chip))
                 else:
                     for chip in accel_chips:
                         aclient = chip.start_internal_client()
-                        raw_values.append((axis, aclient, chip.name))
+                        raw_values.append((axis, aclient, chip))
+                # Calculate the frequency response during the test (raw
+                # samples are only retained if they are written to a file)
+                accumulators = {}
+                if helper is not None:
+                    for chip_axis, aclient, chip in raw_values:
+                        accumulators[aclient] = self._stream_data(
+                                helper, aclient, chip,
+                                raw_name_suffix is not None)
 
                 # Generate moves
                 test_seq = self.generator.gen_test()
                 self.executor.run_test(test_seq, axis, gcmd)
-                for chip_axis, aclient, chip_name in raw_values:
+                for chip_axis, aclient, chip in raw_values:
                     aclient.finish_measurements()
                     if raw_name_suffix is not None:
                         raw_name = self.get_filename(
                                 'raw_data', raw_name_suffix, axis,
                                 point if len(test_points) > 1 else None,
-                                chip_name if accel_chips is not None else None,)
+                                chip.name if accel_chips is not None else None,)
                         aclient.write_to_file(raw_name)
                         gcmd.respond_info(
                                 "Writing raw accelerometer data to "
                                 "%s file" % (raw_name,))
                 if helper is None:
                     continue
-                for chip_axis, aclient, chip_name in raw_values:
+                for chip_axis, aclient, chip in raw_values:
                     if not aclient.has_valid_samples():
                         raise gcmd.error(
                             "accelerometer '%s' measured no data" % (
-                                chip_name,))
-                    new_data = helper.process_accelerometer_data(aclient)
+                                chip.name,))
+                    new_data = helper.process_accelerometer_data(
+                            accumulators[aclient])
                     if calibration_data[axis] is None:
                         calibration_data[axis] = new_data
                     else:
@@ -407,18 +425,21 @@ class ResonanceTester:
         "Measures noise of all enabled accelerometer chips")
     def cmd_MEASURE_AXES_NOISE(self, gcmd):
         meas_time = gcmd.get_float("MEAS_TIME", 2.)
-        raw_values = [(chip_axis, chip.start_internal_client())
-                      for chip_axis, chip in self.accel_chips]
+        helper = shaper_calibrate.ShaperCalibrate(self.printer)
+        raw_values = []
+        for chip_axis, chip in self.accel_chips:
+            aclient = chip.start_internal_client()
+            accumulator = self._stream_data(helper, aclient, chip)
+            raw_values.append((chip_axis, aclient, accumulator))
         self.printer.lookup_object('toolhead').dwell(meas_time)
-        for chip_axis, aclient in raw_values:
+        for chip_axis, aclient, accumulator in raw_values:
             aclient.finish_measurements()
-        helper = shaper_calibrate.ShaperCalibrate(self.printer)
-        for chip_axis, aclient in raw_values:
+        for chip_axis, aclient, accumulator in raw_values:
             if not aclient.has_valid_samples():
                 raise gcmd.error(
                         "%s-axis accelerometer measured no data" % (
                             chip_axis,))
-            data = helper.process_accelerometer_data(aclient)
+            data = helper.process_accelerometer_data(accumulator)
             vx = data.psd_x.mean()
             vy = data.psd_y.mean()
             vz = data.psd_z.mean()
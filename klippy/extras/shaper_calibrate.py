@@ -3,7 +3,7 @@
 # Copyright (C) 2020-2024  Dmitry Butyugin <dmbutyugin@google.com>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import collections, importlib, logging, math, multiprocessing, traceback
+import collections, importlib, logging, math, traceback
 shaper_defs = importlib.import_module('.shaper_defs', 'extras')
 
 MIN_FREQ = 5.
@@ -13,6 +13,9 @@ MAX_SHAPER_FREQ = 150.
 
 TEST_DAMPING_RATIOS=[0.075, 0.1, 0.15]
 
+# Maximum number of elements in intermediate arrays during estimation
+MAX_ESTIMATE_SIZE = 1000000
+
 AUTOTUNE_SHAPERS = ['zv', 'mzv', 'ei', '2hump_ei', '3hump_ei']
 
 ######################################################################
@@ -55,6 +58,89 @@ class CalibrationData:
         return self._psd_map[axis]
 
 
+# Incrementally calculate the power spectral density of accelerometer
+# samples (using Welch's algorithm) as the samples arrive
+def calc_fft_size(sampling_freq):
+    # Round up to the nearest power of 2 for faster FFT
+    return 1 << int(sampling_freq * WINDOW_T_SEC - 1).bit_length()
+
+class WelchAccumulator:
+    def __init__(self, helper, data_rate):
+        self.helper = helper
+        self.numpy = np = helper.numpy
+        self.pending = []
+        self.pending_count = 0
+        self.buffer = None
+        self.first_time = self.last_time = None
+        self.num_samples = 0
+        # The window size is based on the sensor's configured data rate
+        # so that it does not depend on how the samples are batched
+        self.nfft = calc_fft_size(data_rate)
+        self.window = np.kaiser(self.nfft, 6.)
+        self.psd_sums = np.zeros(shape=(3, self.nfft // 2 + 1))
+        self.num_windows = 0
+    def _process_pending(self):
+        np = self.numpy
+        data = np.array([s for samples in self.pending for s in samples])
+        data = data[:, 1:]
+        self.pending = []
+        self.pending_count = 0
+        if self.buffer is not None:
+            data = np.concatenate([self.buffer, data])
+        nfft = self.nfft
+        overlap = nfft // 2
+        step_between_windows = nfft - overlap
+        n_windows = (data.shape[0] - overlap) // step_between_windows
+        if n_windows > 0:
+            window = self.window
+            for i in range(3):
+                x = self.helper._split_into_windows(
+                        data[:n_windows * step_between_windows + overlap, i],
+                        nfft, overlap)
+                # First detrend, then apply windowing function
+                x = window[:, None] * (x - np.mean(x, axis=0))
+                # Calculate frequency response for each window using FFT
+                result = np.fft.rfft(x, n=nfft, axis=0)
+                result = np.conjugate(result) * result
+                self.psd_sums[i] += result.real.sum(axis=-1)
+            self.num_windows += n_windows
+            data = data[n_windows * step_between_windows:]
+        self.buffer = data
+    def add_samples(self, samples):
+        # Add a list of (time, accel_x, accel_y, accel_z) samples
+        if not samples:
+            return
+        if self.first_time is None:
+            self.first_time = samples[0][0]
+        self.last_time = samples[-1][0]
+        self.num_samples += len(samples)
+        self.pending.append(samples)
+        self.pending_count += len(samples)
+        buffered = 0 if self.buffer is None else self.buffer.shape[0]
+        if buffered + self.pending_count >= self.nfft:
+            self._process_pending()
+    def get_calibration_data(self):
+        np = self.numpy
+        if (self.num_samples <= self.nfft
+                or self.last_time <= self.first_time):
+            return None
+        if self.pending:
+            self._process_pending()
+        if not self.num_windows:
+            return None
+        T = self.last_time - self.first_time
+        sampling_freq = self.num_samples / T
+        # Compensation for windowing loss
+        scale = 1.0 / (self.window**2).sum()
+        psd = self.psd_sums * (scale / sampling_freq / self.num_windows)
+        # For one-sided FFT output the response must be doubled, except
+        # the last point for unpaired Nyquist frequency (assuming even nfft)
+        # and the 'DC' term (0 Hz)
+        psd[:, 1:-1] *= 2.
+        freqs = np.fft.rfftfreq(self.nfft, 1. / sampling_freq)
+        px, py, pz = psd
+        return CalibrationData(freqs, px+py+pz, px, py, pz)
+
 CalibrationResult = collections.namedtuple(
         'CalibrationResult',
         ('name', 'freq', 'vals', 'vibrs', 'smoothing', 'score', 'max_accel'))
@@ -71,10 +157,8 @@ class ShaperCalibrate:
                     "installed via `~/klippy-env/bin/pip install` (refer to "
                     "docs/Measuring_Resonances.md for more details).")
 
-    def background_process_exec(self, method, args):
-        if self.printer is None:
-            return method(*args)
-        import queuelogger
+    def _start_background_process(self, method, args):
+        import multiprocessing, queuelogger
         parent_conn, child_conn = multiprocessing.Pipe()
         def wrapper():
             queuelogger.clear_bg_logging()
@@ -86,10 +170,27 @@ class ShaperCalibrate:
                 return
             child_conn.send((False, res))
             child_conn.close()
-        # Start a process to perform the calculation
         calc_proc = multiprocessing.Process(target=wrapper)
         calc_proc.daemon = True
         calc_proc.start()
+        return calc_proc, parent_conn
+
+    def _finish_background_process(self, calc_proc, parent_conn):
+        try:
+            is_err, res = parent_conn.recv()
+        except EOFError:
+            is_err, res = True, "calculation process exited unexpectedly"
+        if is_err:
+            raise self.error("Error in remote calculation: %s" % (res,))
+        calc_proc.join()
+        parent_conn.close()
+        return res
+
+    def background_process_exec(self, method, args):
+        if self.printer is None:
+            return method(*args)
+        # Start a process to perform the calculation
+        calc_proc, parent_conn = self._start_background_process(method, args)
         # Wait for the process to finish
         reactor = self.printer.get_reactor()
         gcode = self.printer.lookup_object("gcode")
@@ -100,12 +201,45 @@ class ShaperCalibrate:
                 gcode.respond_info("Wait for calculations..", log=False)
             eventtime = reactor.pause(eventtime + .1)
         # Return results
-        is_err, res = parent_conn.recv()
-        if is_err:
-            raise self.error("Error in remote calculation: %s" % (res,))
-        calc_proc.join()
-        parent_conn.close()
-        return res
+        return self._finish_background_process(calc_proc, parent_conn)
+
+    def background_process_exec_all(self, jobs):
+        # Run a list of (method, args) calculations in parallel processes
+        import multiprocessing
+        num_procs = min(len(jobs), multiprocessing.cpu_count())
+        if self.printer is None or num_procs <= 1:
+            return [self.background_process_exec(method, args)
+                    for method, args in jobs]
+        reactor = self.printer.get_reactor()
+        gcode = self.printer.lookup_object("gcode")
+        eventtime = last_report_time = reactor.monotonic()
+        results = [None] * len(jobs)
+        pending = list(enumerate(jobs))[::-1]
+        running = []
+        try:
+            while pending or running:
+                # Start processes for pending calculations
+                while pending and len(running) < num_procs:
+                    i, (method, args) = pending.pop()
+                    calc_proc, parent_conn = self._start_background_process(
+                            method, args)
+                    running.append((i, calc_proc, parent_conn))
+                # Collect results (a process may not exit until its
+                # result has been read)
+                for job in [job for job in running if job[2].poll()]:
+                    running.remove(job)
+                    i, calc_proc, parent_conn = job
+                    results[i] = self._finish_background_process(
+                            calc_proc, parent_conn)
+                if eventtime > last_report_time + 5.:
+                    last_report_time = eventtime
+                    gcode.respond_info("Wait for calculations..", log=False)
+                eventtime = reactor.pause(eventtime + .02)
+        finally:
+            for i, calc_proc, parent_conn in running:
+                calc_proc.terminate()
+                parent_conn.close()
+        return results
 
     def _split_into_windows(self, x, window_size, overlap):
         # Memory-efficient algorithm to split an input 'x' into a series
@@ -162,8 +296,7 @@ class ShaperCalibrate:
         N = data.shape[0]
         T = data[-1,0] - data[0,0]
         SAMPLING_FREQ = N / T
-        # Round up to the nearest power of 2 for faster FFT
-        M = 1 << int(SAMPLING_FREQ * WINDOW_T_SEC - 1).bit_length()
+        M = calc_fft_size(SAMPLING_FREQ)
         if N <= M:
             return None
 
@@ -174,69 +307,99 @@ class ShaperCalibrate:
         fz, pz = self._psd(data[:,3], SAMPLING_FREQ, M)
         return CalibrationData(fx, px+py+pz, px, py, pz)
 
+    def stream_accelerometer_data(self, aclient, data_rate,
+                                  keep_samples=False):
+        # Calculate the frequency response while measurements are taken
+        accumulator = WelchAccumulator(self, data_rate)
+        aclient.set_stream_callback(accumulator.add_samples, keep_samples)
+        return accumulator
+
     def process_accelerometer_data(self, data):
-        calibration_data = self.background_process_exec(
-                self.calc_freq_response, (data,))
+        if isinstance(data, WelchAccumulator):
+            calibration_data = data.get_calibration_data()
+        else:
+            calibration_data = self.background_process_exec(
+                    self.calc_freq_response, (data,))
         if calibration_data is None:
             raise self.error(
                     "Internal error processing accelerometer data %s" % (data,))
         calibration_data.set_numpy(self.numpy)
         return calibration_data
 
-    def _estimate_shaper(self, shaper, test_damping_ratio, test_freqs):
+    def _estimate_shapers(self, A, T, test_damping_ratio, test_freqs):
+        # Estimate the response of several shapers at once - 'A' and 'T'
+        # contain the pulse amplitudes and times with one row per shaper
         np = self.numpy
 
-        A, T = np.array(shaper[0]), np.array(shaper[1])
-        inv_D = 1. / A.sum()
+        inv_D = 1. / A.sum(axis=-1)
 
         omega = 2. * math.pi * test_freqs
         damping = test_damping_ratio * omega
         omega_d = omega * math.sqrt(1. - test_damping_ratio**2)
-        W = A * np.exp(np.outer(-damping, (T[-1] - T)))
-        S = W * np.sin(np.outer(omega_d, T))
-        C = W * np.cos(np.outer(omega_d, T))
-        return np.sqrt(S.sum(axis=1)**2 + C.sum(axis=1)**2) * inv_D
-
-    def _estimate_remaining_vibrations(self, shaper, test_damping_ratio,
-                                       freq_bins, psd):
-        vals = self._estimate_shaper(shaper, test_damping_ratio, freq_bins)
+        W = A[:, None, :] * np.exp(
+                -damping[None, :, None] * (T[:, -1:] - T)[:, None, :])
+        S = W * np.sin(omega_d[None, :, None] * T[:, None, :])
+        C = W * np.cos(omega_d[None, :, None] * T[:, None, :])
+        return (np.sqrt(S.sum(axis=-1)**2 + C.sum(axis=-1)**2)
+                * inv_D[:, None])
+
+    def _estimate_remaining_vibrations(self, A, T, test_damping_ratios,
+                                           freq_bins, psd):
+        np = self.numpy
         # The input shaper can only reduce the amplitude of vibrations by
         # SHAPER_VIBRATION_REDUCTION times, so all vibrations below that
         # threshold can be igonred
         vibr_threshold = psd.max() / shaper_defs.SHAPER_VIBRATION_REDUCTION
-        remaining_vibrations = self.numpy.maximum(
-                vals * psd - vibr_threshold, 0).sum()
-        all_vibrations = self.numpy.maximum(psd - vibr_threshold, 0).sum()
-        return (remaining_vibrations / all_vibrations, vals)
-
-    def _get_shaper_smoothing(self, shaper, accel=5000, scv=5.):
+        all_vibrations = np.maximum(psd - vibr_threshold, 0).sum()
+        shaper_vibrations = np.zeros(shape=A.shape[:1])
+        shaper_vals = np.zeros(shape=(A.shape[0], freq_bins.shape[0]))
+        # Limit the size of the intermediate arrays
+        block = max(1, MAX_ESTIMATE_SIZE // (freq_bins.shape[0] * A.shape[1]))
+        for i in range(0, A.shape[0], block):
+            A_blk, T_blk = A[i:i+block], T[i:i+block]
+            # Exact damping ratio of the printer is unknown, pessimizing
+            # remaining vibrations over possible damping values
+            for dr in test_damping_ratios:
+                vals = self._estimate_shapers(A_blk, T_blk, dr, freq_bins)
+                remaining_vibrations = np.maximum(
+                        vals * psd - vibr_threshold, 0).sum(axis=-1)
+                vibrations = remaining_vibrations / all_vibrations
+                shaper_vals[i:i+block] = np.maximum(
+                        shaper_vals[i:i+block], vals)
+                shaper_vibrations[i:i+block] = np.maximum(
+                        shaper_vibrations[i:i+block], vibrations)
+        return shaper_vibrations, shaper_vals
+
+    def _get_shapers_smoothing(self, A, T, accel=5000, scv=5.):
+        # Calculate the smoothing of several shapers at once (one shaper
+        # per row of 'A' and 'T', 'accel' may be an array of per-shaper
+        # accelerations)
+        np = self.numpy
         half_accel = accel * .5
 
-        A, T = shaper
-        inv_D = 1. / sum(A)
-        n = len(T)
+        n = A.shape[1]
+        sum_A, sum_AT = A[:, 0], A[:, 0] * T[:, 0]
+        for i in range(1, n):
+            sum_A = sum_A + A[:, i]
+            sum_AT = sum_AT + A[:, i] * T[:, i]
+        inv_D = 1. / sum_A
         # Calculate input shaper shift
-        ts = sum([A[i] * T[i] for i in range(n)]) * inv_D
+        ts = sum_AT * inv_D
 
         # Calculate offset for 90 and 180 degrees turn
         offset_90 = offset_180 = 0.
         for i in range(n):
-            if T[i] >= ts:
-                # Calculate offset for one of the axes
-                offset_90 += A[i] * (scv + half_accel * (T[i]-ts)) * (T[i]-ts)
-            offset_180 += A[i] * half_accel * (T[i]-ts)**2
-        offset_90 *= inv_D * math.sqrt(2.)
-        offset_180 *= inv_D
-        return max(offset_90, offset_180)
-
-    def fit_shaper(self, shaper_cfg, calibration_data, shaper_freqs,
-                   damping_ratio, scv, max_smoothing, test_damping_ratios,
-                   max_freq):
+            dt = T[:, i] - ts
+            # Calculate offset for one of the axes
+            offset_90 = offset_90 + np.where(
+                    T[:, i] >= ts, A[:, i] * (scv + half_accel * dt) * dt, 0.)
+            offset_180 = offset_180 + A[:, i] * half_accel * dt**2
+        offset_90 = offset_90 * (inv_D * math.sqrt(2.))
+        offset_180 = offset_180 * inv_D
+        return np.maximum(offset_90, offset_180)
+
+    def _get_test_freqs(self, shaper_cfg, shaper_freqs):
         np = self.numpy
-
-        damping_ratio = damping_ratio or shaper_defs.DEFAULT_DAMPING_RATIO
-        test_damping_ratios = test_damping_ratios or TEST_DAMPING_RATIOS
-
         if not shaper_freqs:
             shaper_freqs = (None, None, None)
         if isinstance(shaper_freqs, tuple):
@@ -244,47 +407,79 @@ class ShaperCalibrate:
             freq_start = min(shaper_freqs[0] or shaper_cfg.min_freq,
                              freq_end - 1e-7)
             freq_step = shaper_freqs[2] or .2
-            test_freqs = np.arange(freq_start, freq_end, freq_step)
-        else:
-            test_freqs = np.array(shaper_freqs)
+            return np.arange(freq_start, freq_end, freq_step)
+        return np.array(shaper_freqs)
+
+    def _fit_shaper_range(self, shaper_cfg, calibration_data, shaper_freqs,
+                          damping_ratio, scv, max_smoothing,
+                          test_damping_ratios, max_freq, start=0, end=None):
+        # Evaluate the shaper at the test frequencies (from highest to
+        # lowest) in the range [start:end].  Returns the list of results
+        # and a flag indicating that evaluation stopped early due to
+        # max_smoothing.
+        np = self.numpy
 
+        damping_ratio = damping_ratio or shaper_defs.DEFAULT_DAMPING_RATIO
+        test_damping_ratios = test_damping_ratios or TEST_DAMPING_RATIOS
+
+        test_freqs = self._get_test_freqs(shaper_cfg, shaper_freqs)
         max_freq = max(max_freq or MAX_FREQ, test_freqs.max())
 
         freq_bins = calibration_data.freq_bins
         psd = calibration_data.psd_sum[freq_bins <= max_freq]
         freq_bins = freq_bins[freq_bins <= max_freq]
 
-        best_res = None
+        test_freqs = test_freqs[::-1][start:end]
+        shapers = [shaper_cfg.init_func(test_freq, damping_ratio)
+                   for test_freq in test_freqs]
+        A = np.array([shaper[0] for shaper in shapers])
+        T = np.array([shaper[1] for shaper in shapers])
+        shaper_smoothing = self._get_shapers_smoothing(A, T, scv=scv)
+        # Stop at the first frequency with too much smoothing (other
+        # than the very first tested frequency)
+        count = len(test_freqs)
+        stopped = False
+        if max_smoothing:
+            over = np.nonzero(shaper_smoothing > max_smoothing)[0]
+            over = over[over + start > 0]
+            if len(over):
+                count = over[0]
+                stopped = True
+        A, T = A[:count], T[:count]
+        shaper_vibrations, shaper_vals = (
+                self._estimate_remaining_vibrations(
+                    A, T, test_damping_ratios, freq_bins, psd))
+        max_accels = self._find_shapers_max_accel(A, T, scv)
         results = []
-        for test_freq in test_freqs[::-1]:
-            shaper_vibrations = 0.
-            shaper_vals = np.zeros(shape=freq_bins.shape)
-            shaper = shaper_cfg.init_func(test_freq, damping_ratio)
-            shaper_smoothing = self._get_shaper_smoothing(shaper, scv=scv)
-            if max_smoothing and shaper_smoothing > max_smoothing and best_res:
-                return best_res
-            # Exact damping ratio of the printer is unknown, pessimizing
-            # remaining vibrations over possible damping values
-            for dr in test_damping_ratios:
-                vibrations, vals = self._estimate_remaining_vibrations(
-                        shaper, dr, freq_bins, psd)
-                shaper_vals = np.maximum(shaper_vals, vals)
-                if vibrations > shaper_vibrations:
-                    shaper_vibrations = vibrations
-            max_accel = self.find_shaper_max_accel(shaper, scv)
+        for i in range(count):
+            vibrs = shaper_vibrations[i]
+            smoothing = float(shaper_smoothing[i])
             # The score trying to minimize vibrations, but also accounting
             # the growth of smoothing. The formula itself does not have any
             # special meaning, it simply shows good results on real user data
-            shaper_score = shaper_smoothing * (shaper_vibrations**1.5 +
-                                               shaper_vibrations * .2 + .01)
+            shaper_score = smoothing * (vibrs**1.5 + vibrs * .2 + .01)
             results.append(
                     CalibrationResult(
-                        name=shaper_cfg.name, freq=test_freq, vals=shaper_vals,
-                        vibrs=shaper_vibrations, smoothing=shaper_smoothing,
-                        score=shaper_score, max_accel=max_accel))
-            if best_res is None or best_res.vibrs > results[-1].vibrs:
+                        name=shaper_cfg.name, freq=test_freqs[i],
+                        vals=shaper_vals[i], vibrs=vibrs, smoothing=smoothing,
+                        score=shaper_score, max_accel=float(max_accels[i])))
+        return results, stopped
+
+    def _select_shaper(self, fit_results):
+        # Merge the results of _fit_shaper_range() calls (in order)
+        results = []
+        stopped = False
+        for range_results, stopped in fit_results:
+            results.extend(range_results)
+            if stopped:
+                break
+        best_res = None
+        for res in results:
+            if best_res is None or best_res.vibrs > res.vibrs:
                 # The current frequency is better for the shaper.
-                best_res = results[-1]
+                best_res = res
+        if stopped:
+            return best_res
         # Try to find an 'optimal' shapper configuration: the one that is not
         # much worse than the 'best' one, but gives much less smoothing
         selected = best_res
@@ -293,31 +488,49 @@ class ShaperCalibrate:
                 selected = res
         return selected
 
-    def _bisect(self, func):
-        left = right = 1.
-        if not func(1e-9):
-            return 0.
-        while not func(left):
-            right = left
-            left *= .5
-        if right == left:
-            while func(right):
-                right *= 2.
-        while right - left > 1e-8:
+    def fit_shaper(self, shaper_cfg, calibration_data, shaper_freqs,
+                   damping_ratio, scv, max_smoothing, test_damping_ratios,
+                   max_freq):
+        return self._select_shaper([self._fit_shaper_range(
+            shaper_cfg, calibration_data, shaper_freqs, damping_ratio, scv,
+            max_smoothing, test_damping_ratios, max_freq)])
+
+    def _bisect(self, func, count):
+        # Find the largest value (for each of 'count' entries) for which
+        # 'func' is true - 'func' is evaluated on arrays
+        np = self.numpy
+        left = np.ones(count)
+        right = np.ones(count)
+        valid = func(np.full(count, 1e-9))
+        active = valid & ~func(left)
+        while active.any():
+            right = np.where(active, left, right)
+            left = np.where(active, left * .5, left)
+            active &= ~func(left)
+        active = valid & (right == left) & func(right)
+        while active.any():
+            right = np.where(active, right * 2., right)
+            active &= func(right)
+        active = valid & (right - left > 1e-8)
+        while active.any():
             middle = (left + right) * .5
-            if func(middle):
-                left = middle
-            else:
-                right = middle
-        return left
+            res = func(middle)
+            left = np.where(active & res, middle, left)
+            right = np.where(active & ~res, middle, right)
+            active &= right - left > 1e-8
+        return np.where(valid, left, 0.)
 
-    def find_shaper_max_accel(self, shaper, scv):
+    def _find_shapers_max_accel(self, A, T, scv):
         # Just some empirically chosen value which produces good projections
         # for max_accel without much smoothing
         TARGET_SMOOTHING = 0.12
-        max_accel = self._bisect(lambda test_accel: self._get_shaper_smoothing(
-            shaper, test_accel, scv) <= TARGET_SMOOTHING)
-        return max_accel
+        return self._bisect(lambda test_accel: self._get_shapers_smoothing(
+            A, T, test_accel, scv) <= TARGET_SMOOTHING, A.shape[0])
+
+    def find_shaper_max_accel(self, shaper, scv):
+        np = self.numpy
+        A, T = np.array([shaper[0]]), np.array([shaper[1]])
+        return float(self._find_shapers_max_accel(A, T, scv)[0])
 
     def find_best_shaper(self, calibration_data, shapers=None,
                          damping_ratio=None, scv=None, shaper_freqs=None,
@@ -326,12 +539,29 @@ class ShaperCalibrate:
         best_shaper = None
         all_shapers = []
         shapers = shapers or AUTOTUNE_SHAPERS
-        for shaper_cfg in shaper_defs.INPUT_SHAPERS:
-            if shaper_cfg.name not in shapers:
-                continue
-            shaper = self.background_process_exec(self.fit_shaper, (
-                shaper_cfg, calibration_data, shaper_freqs, damping_ratio,
-                scv, max_smoothing, test_damping_ratios, max_freq))
+        shaper_cfgs = [shaper_cfg for shaper_cfg in shaper_defs.INPUT_SHAPERS
+                       if shaper_cfg.name in shapers]
+        if not shaper_cfgs:
+            return best_shaper, all_shapers
+        # Split the test frequencies of each shaper into ranges so that
+        # there is enough work to evaluate in parallel on all cores
+        import multiprocessing
+        num_cpus = multiprocessing.cpu_count()
+        num_ranges = (num_cpus + len(shaper_cfgs) - 1) // len(shaper_cfgs)
+        jobs = []
+        for shaper_cfg in shaper_cfgs:
+            num_freqs = len(self._get_test_freqs(shaper_cfg, shaper_freqs))
+            ranges = min(num_ranges, num_freqs)
+            for i in range(ranges):
+                jobs.append((self._fit_shaper_range, (
+                    shaper_cfg, calibration_data, shaper_freqs, damping_ratio,
+                    scv, max_smoothing, test_damping_ratios, max_freq,
+                    i * num_freqs // ranges, (i + 1) * num_freqs // ranges)))
+        job_results = self.background_process_exec_all(jobs)
+        for shaper_cfg in shaper_cfgs:
+            fit_results = [res for (method, args), res in zip(jobs, job_results)
+                           if args[0] is shaper_cfg]
+            shaper = self._select_shaper(fit_results)
             if logger is not None:
                 logger("Fitted shaper '%s' frequency = %.1f Hz "
                        "(vibrations = %.1f%%, smoothing ~= %.3f)" % (
@@ -49,6 +49,34 @@ class PrinterSysStats:
                 'cputime': self.total_process_time,
                 'memavail': self.last_mem_avail}
 
+class PrinterReactorStats:
+    def __init__(self, config):
+        self.reactor = config.get_printer().get_reactor()
+        if config.getboolean('reactor_profiling', False):
+            slow_threshold = config.getfloat('slow_callback_threshold', 0.100,
+                                             above=0.)
+            self.reactor.setup_profiling(slow_threshold)
+    def stats(self, eventtime):
+        status = self.reactor.get_profile_status()
+        if status is None:
+            return (False, "")
+        cb_time = status['callback_time']
+        lateness = status['timer_lateness']
+        msg = ("reactor: callbacks=%d callback_time=%.3f callback_max=%.6f"
+               " callback_hist=%s lateness_max=%.6f lateness_hist=%s"
+               " slow_callbacks=%d" % (
+                   sum(cb_time['counts']), cb_time['total'], cb_time['max'],
+                   ",".join(["%d" % (c,) for c in cb_time['counts']]),
+                   lateness['max'],
+                   ",".join(["%d" % (c,) for c in lateness['counts']]),
+                   status['slow_callbacks']))
+        return (False, msg)
+    def get_status(self, eventtime):
+        status = self.reactor.get_profile_status()
+        if status is None:
+            return {'profiling': False}
+        return dict(status, profiling=True)
+
 class PrinterStats:
     def __init__(self, config):
         self.printer = config.get_printer()
@@ -71,4 +99,5 @@ class PrinterStats:
 
 def load_config(config):
     config.get_printer().add_object('system_stats', PrinterSysStats(config))
+    config.get_printer().add_object('reactor', PrinterReactorStats(config))
     return PrinterStats(config)
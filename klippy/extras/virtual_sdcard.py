@@ -3,7 +3,7 @@
 # Copyright (C) 2018-2024  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import os, sys, logging, io
+import os, sys, logging, io, bisect, hashlib, marshal, struct
 
 VALID_GCODE_EXTS = ['gcode', 'g', 'gco']
 
@@ -13,6 +13,118 @@ DEFAULT_ERROR_GCODE = """
 {% endif %}
 """
 
+
+######################################################################
+# Pre-parsed g-code cache files
+######################################################################
+
+# A cache file contains a header, a series of (position, lines) records,
+# an index of the records, and a trailer with the file offset of the
+# index.  Each line is stored as (line_size, parsed_command).  The index
+# contains (position, file_offset, record_size) for each record.
+CACHE_MAGIC = "klippy-gcode-cache"
+CACHE_VERSION = 2
+
+def get_cache_ident(fname, f):
+    st = os.fstat(f.fileno())
+    return (CACHE_MAGIC, CACHE_VERSION, marshal.version,
+            fname, st.st_size, st.st_mtime)
+
+class GCodeCacheReader:
+    def __init__(self, cache_fname, ident):
+        self.file = open(cache_fname, 'rb')
+        try:
+            if marshal.load(self.file) != ident:
+                raise ValueError("Cache file %s is stale" % (cache_fname,))
+            self.file.seek(-8, os.SEEK_END)
+            index_offset = struct.unpack('<Q', self.file.read(8))[0]
+            self.file.seek(index_offset)
+            self.end_position, self.index = marshal.load(self.file)
+        except:
+            self.file.close()
+            raise
+        self.positions = [pos for pos, offset, size in self.index]
+        self.next_record = len(self.index)
+        self.pending = None
+    def close(self):
+        self.file.close()
+    def _read_record(self, rec):
+        pos, offset, size = self.index[rec]
+        self.file.seek(offset)
+        return marshal.loads(self.file.read(size))
+    def seek(self, position):
+        # Returns False if position is not at the start of a cached line
+        self.next_record = len(self.index)
+        self.pending = None
+        if position == self.end_position:
+            return True
+        rec = bisect.bisect_right(self.positions, position) - 1
+        if rec < 0:
+            return False
+        line_pos, lines = self._read_record(rec)
+        for i, line in enumerate(lines):
+            if line_pos == position:
+                self.pending = lines[i:]
+                self.next_record = rec + 1
+                return True
+            line_pos += line[0]
+        return False
+    def read_lines(self):
+        # Returns a list of pre-parsed lines (or None at end of file)
+        if self.pending is not None:
+            lines = self.pending
+            self.pending = None
+            return lines
+        if self.next_record >= len(self.index):
+            return None
+        self.next_record += 1
+        return self._read_record(self.next_record - 1)[1]
+
+class GCodeCacheWriter:
+    def __init__(self, cache_fname, ident):
+        self.cache_fname = cache_fname
+        self.temp_fname = cache_fname + ".tmp"
+        self.file = open(self.temp_fname, 'wb')
+        marshal.dump(ident, self.file)
+        self.index = []
+        self.next_position = 0
+    def add_lines(self, position, lines):
+        # Store lines that extend the cache, returns False on a gap
+        rec_pos = self.next_position
+        rec_lines = []
+        for line in lines:
+            if position == self.next_position:
+                rec_lines.append(line)
+                self.next_position += line[0]
+            elif position > self.next_position:
+                return False
+            position += line[0]
+        if rec_lines:
+            data = marshal.dumps((rec_pos, rec_lines))
+            self.index.append((rec_pos, self.file.tell(), len(data)))
+            self.file.write(data)
+        return True
+    def finish(self, end_position):
+        if end_position != self.next_position:
+            self.abort()
+            return
+        index_offset = self.file.tell()
+        marshal.dump((end_position, self.index), self.file)
+        self.file.write(struct.pack('<Q', index_offset))
+        self.file.close()
+        os.rename(self.temp_fname, self.cache_fname)
+    def abort(self):
+        self.file.close()
+        try:
+            os.unlink(self.temp_fname)
+        except os.error:
+            pass
+
+
+######################################################################
+# Virtual sdcard
+######################################################################
+
 class VirtualSD:
     def __init__(self, config):
         self.printer = config.get_printer()
@@ -30,6 +142,17 @@ class VirtualSD:
         self.must_pause_work = self.cmd_from_sd = False
         self.next_file_position = 0
         self.work_timer = None
+        self.dispatch_batch_size = config.getint('dispatch_batch_size', 1,
+                                                 minval=1)
+        # Pre-parsed g-code cache
+        self.cache_dirname = config.get('gcode_cache_path', None)
+        if self.cache_dirname is not None:
+            self.cache_dirname = os.path.normpath(
+                os.path.expanduser(self.cache_dirname))
+        self.gcode_cache = self.cache_writer = None
+        self.cache_active = False
+        self.partial_input = ""
+        self.read_position = 0
         # Error handling
         gcode_macro = self.printer.load_object(config, 'gcode_macro')
         self.on_error_gcode = gcode_macro.load_template(
@@ -122,8 +245,7 @@ class VirtualSD:
     def do_cancel(self):
         if self.current_file is not None:
             self.do_pause()
-            self.current_file.close()
-            self.current_file = None
+            self._close_file()
             self.print_stats.note_cancel()
         self.file_position = self.file_size = 0
     # G-Code commands
@@ -132,8 +254,7 @@ class VirtualSD:
     def _reset_file(self):
         if self.current_file is not None:
             self.do_pause()
-            self.current_file.close()
-            self.current_file = None
+            self._close_file()
         self.file_position = self.file_size = 0
         self.print_stats.reset()
         self.printer.send_event("virtual_sdcard:reset_file")
@@ -196,6 +317,55 @@ class VirtualSD:
         self.file_position = 0
         self.file_size = fsize
         self.print_stats.set_current_file(filename)
+        self._load_cache()
+    def _close_file(self):
+        self.current_file.close()
+        self.current_file = None
+        if self.gcode_cache is not None:
+            self.gcode_cache.close()
+            self.gcode_cache = None
+        if self.cache_writer is not None:
+            self.cache_writer.abort()
+            self.cache_writer = None
+        self.cache_active = False
+    # Pre-parsed g-code cache handling
+    def _get_cache_filename(self):
+        fname = os.path.abspath(self.current_file.name)
+        hname = hashlib.sha1(fname.encode()).hexdigest()
+        return os.path.join(self.cache_dirname, hname + ".cache")
+    def _load_cache(self):
+        if self.cache_dirname is None:
+            return
+        cache_fname = self._get_cache_filename()
+        if not os.path.exists(cache_fname):
+            return
+        ident = get_cache_ident(self.current_file.name, self.current_file)
+        try:
+            self.gcode_cache = GCodeCacheReader(cache_fname, ident)
+        except:
+            logging.info("Ignoring g-code cache file %s", cache_fname)
+            return
+        logging.info("Using g-code cache file %s", cache_fname)
+    def _start_cache_writer(self):
+        if (self.cache_dirname is None or self.gcode_cache is not None
+            or self.cache_writer is not None):
+            return
+        ident = get_cache_ident(self.current_file.name, self.current_file)
+        try:
+            if not os.path.isdir(self.cache_dirname):
+                os.makedirs(self.cache_dirname)
+            self.cache_writer = GCodeCacheWriter(
+                self._get_cache_filename(), ident)
+        except:
+            logging.exception("virtual_sdcard cache create")
+    def _finish_cache_writer(self):
+        if self.cache_writer is None:
+            return
+        try:
+            self.cache_writer.finish(self.read_position)
+        except:
+            logging.exception("virtual_sdcard cache finish")
+        self.cache_writer = None
     def cmd_M24(self, gcmd):
         # Start/resume SD print
         self.do_resume()
@@ -222,55 +392,95 @@ class VirtualSD:
     def is_cmd_from_sd(self):
         return self.cmd_from_sd
     # Background work timer
+    def _seek_file(self, position):
+        self.current_file.seek(position)
+        self.partial_input = ""
+        self.read_position = position
+        self.cache_active = (self.gcode_cache is not None
+                             and self.gcode_cache.seek(position))
+    def _parse_lines(self, lines):
+        if sys.version_info.major >= 3:
+            sizes = [len(line.encode()) + 1 for line in lines]
+        else:
+            sizes = [len(line) + 1 for line in lines]
+        return list(zip(sizes, self.gcode.parse_lines(lines)))
+    def _read_lines(self):
+        # Read pre-parsed lines (stored in reverse order for pop())
+        if self.cache_active:
+            lines = self.gcode_cache.read_lines()
+            if lines is None:
+                return None
+        else:
+            data = self.current_file.read(8192)
+            if not data:
+                return None
+            lines = data.split('\n')
+            lines[0] = self.partial_input + lines[0]
+            self.partial_input = lines.pop()
+            lines = self._parse_lines(lines)
+            cache_writer = self.cache_writer
+            if (cache_writer is not None
+                and not cache_writer.add_lines(self.read_position, lines)):
+                cache_writer.abort()
+                self.cache_writer = None
+        self.read_position += sum([line[0] for line in lines])
+        lines.reverse()
+        return lines
+    def _dispatch_batch(self, lines):
+        # Run up to dispatch_batch_size commands (gcode mutex must be held)
+        gcode_mutex = self.gcode.get_mutex()
+        for i in range(self.dispatch_batch_size):
+            line_size, parsed_command = lines.pop()
+            next_file_position = self.file_position + line_size
+            self.next_file_position = next_file_position
+            self.gcode.run_parsed_command(parsed_command)
+            self.file_position = self.next_file_position
+            if self.next_file_position != next_file_position:
+                return True
+            if (not lines or self.must_pause_work
+                or gcode_mutex.has_waiters()):
+                break
+        return False
     def work_handler(self, eventtime):
         logging.info("Starting SD card print (position %d)", self.file_position)
         self.reactor.unregister_timer(self.work_timer)
         try:
-            self.current_file.seek(self.file_position)
+            self._seek_file(self.file_position)
         except:
             logging.exception("virtual_sdcard seek")
             self.work_timer = None
             return self.reactor.NEVER
+        self._start_cache_writer()
         self.print_stats.note_start()
         gcode_mutex = self.gcode.get_mutex()
-        partial_input = ""
         lines = []
         error_message = None
         while not self.must_pause_work:
             if not lines:
                 # Read more data
                 try:
-                    data = self.current_file.read(8192)
+                    lines = self._read_lines()
                 except:
                     logging.exception("virtual_sdcard read")
                     break
-                if not data:
+                if lines is None:
                     # End of file
-                    self.current_file.close()
-                    self.current_file = None
+                    self._finish_cache_writer()
+                    self._close_file()
                     logging.info("Finished SD card print")
                     self.gcode.respond_raw("Done printing file")
                     break
-                lines = data.split('\n')
-                lines[0] = partial_input + lines[0]
-                partial_input = lines.pop()
-                lines.reverse()
                 self.reactor.pause(self.reactor.NOW)
                 continue
             # Pause if any other request is pending in the gcode class
             if gcode_mutex.test():
                 self.reactor.pause(self.reactor.monotonic() + 0.100)
                 continue
-            # Dispatch command
+            # Dispatch commands
             self.cmd_from_sd = True
-            line = lines.pop()
-            if sys.version_info.major >= 3:
-                next_file_position = self.file_position + len(line.encode()) + 1
-            else:
-                next_file_position = self.file_position + len(line) + 1
-            self.next_file_position = next_file_position
             try:
-                self.gcode.run_script(line)
+                with gcode_mutex:
+                    did_jump = self._dispatch_batch(lines)
             except self.gcode.error as e:
                 error_message = str(e)
                 try:
@@ -282,17 +492,15 @@ class VirtualSD:
                 logging.exception("virtual_sdcard dispatch")
                 break
             self.cmd_from_sd = False
-            self.file_position = self.next_file_position
             # Do we need to skip around?
-            if self.next_file_position != next_file_position:
+            if did_jump:
                 try:
-                    self.current_file.seek(self.file_position)
+                    self._seek_file(self.file_position)
                 except:
                     logging.exception("virtual_sdcard seek")
                     self.work_timer = None
                     return self.reactor.NEVER
                 lines = []
-                partial_input = ""
         logging.info("Exiting SD card print (position %d)", self.file_position)
         self.work_timer = None
         self.cmd_from_sd = False
@@ -102,6 +102,7 @@ class GCodeDispatch:
         self.base_gcode_handlers = self.gcode_handlers = {}
         self.ready_gcode_handlers = {}
         self.mux_commands = {}
+        self.simple_move_handlers = {}
         self.gcode_help = {}
         self.status_commands = {}
         # Register commands needed before config file is loaded
@@ -160,6 +161,10 @@ class GCodeDispatch:
                 "mux command %s %s %s already registered (%s)" % (
                     cmd, key, value, prev_values))
         prev_values[value] = func
+    def register_simple_move_handler(self, func, move_func):
+        # Invoke move_func([x, y, z, e, f]) instead of func(gcmd) for
+        # simple G0/G1 moves (while func is the registered handler)
+        self.simple_move_handlers[func] = move_func
     def get_command_help(self):
         return dict(self.gcode_help)
     def get_status(self, eventtime):
@@ -188,41 +193,87 @@ class GCodeDispatch:
         self._respond_state("Ready")
     # Parse input into commands
     args_r = re.compile('([A-Z_]+|[A-Z*])')
+    simple_move_r = re.compile(
+        r'G[01]((?:\s*[XYZEF]\s*[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+))*)\s*(?:;|$)')
+    simple_move_args_r = re.compile(r'([XYZEF])\s*([^\sXYZEF]+)')
+    simple_move_axes = {'X': 0, 'Y': 1, 'Z': 2, 'E': 3, 'F': 4}
+    def _parse_params(self, line):
+        # Ignore comments
+        cpos = line.find(';')
+        if cpos >= 0:
+            line = line[:cpos]
+        # Break line into parts and determine command
+        parts = self.args_r.split(line.upper())
+        if ''.join(parts[:2]) == 'N':
+            # Skip line number at start of command
+            cmd = ''.join(parts[3:5]).strip()
+        else:
+            cmd = ''.join(parts[:3]).strip()
+        # Build gcode "params" dictionary
+        params = { parts[i]: parts[i+1].strip()
+                   for i in range(1, len(parts), 2) }
+        return cmd, params
+    def _parse_simple_move(self, args):
+        # Build [x, y, z, e, f] list (None for parameters not provided)
+        params = [None, None, None, None, None]
+        axes = self.simple_move_axes
+        for axis, value in self.simple_move_args_r.findall(args):
+            params[axes[axis]] = float(value)
+        if params[4] is not None and params[4] <= 0.:
+            # Let regular handler report invalid speed
+            return None
+        return params
+    def _parse_line(self, line):
+        # Ignore leading/trailing spaces
+        origline = line.strip()
+        # Check for simple moves (eg, "G1 X10 Y20 F3000")
+        m = self.simple_move_r.match(origline)
+        if m is not None:
+            params = self._parse_simple_move(m.group(1))
+            if params is not None:
+                return origline[:2], origline, params
+        cmd, params = self._parse_params(origline)
+        return cmd, origline, params
+    def _invoke_handler(self, cmd, handler, arg, need_ack):
+        try:
+            handler(arg)
+        except self.error as e:
+            self._respond_error(str(e))
+            self.printer.send_event("gcode:command_error")
+            if not need_ack:
+                raise
+        except:
+            msg = 'Internal error on command:"%s"' % (cmd,)
+            logging.exception(msg)
+            self.printer.invoke_shutdown(msg)
+            self._respond_error(msg)
+            if not need_ack:
+                raise
+    def _run_command(self, cmd, origline, params, need_ack):
+        handler = self.gcode_handlers.get(cmd, self.cmd_default)
+        if type(params) is list:
+            # Parameters from simple move parser
+            move_func = self.simple_move_handlers.get(handler)
+            if move_func is not None:
+                self._invoke_handler(cmd, move_func, params, need_ack)
+                if need_ack:
+                    self.respond_raw("ok")
+                return
+            cmd, params = self._parse_params(origline)
+        gcmd = GCodeCommand(self, cmd, origline, params, need_ack)
+        # Invoke handler for command
+        self._invoke_handler(cmd, handler, gcmd, need_ack)
+        gcmd.ack()
     def _process_commands(self, commands, need_ack=True):
         for line in commands:
-            # Ignore comments and leading/trailing spaces
-            line = origline = line.strip()
-            cpos = line.find(';')
-            if cpos >= 0:
-                line = line[:cpos]
-            # Break line into parts and determine command
-            parts = self.args_r.split(line.upper())
-            if ''.join(parts[:2]) == 'N':
-                # Skip line number at start of command
-                cmd = ''.join(parts[3:5]).strip()
-            else:
-                cmd = ''.join(parts[:3]).strip()
-            # Build gcode "params" dictionary
-            params = { parts[i]: parts[i+1].strip()
-                       for i in range(1, len(parts), 2) }
-            gcmd = GCodeCommand(self, cmd, origline, params, need_ack)
-            # Invoke handler for command
-            handler = self.gcode_handlers.get(cmd, self.cmd_default)
-            try:
-                handler(gcmd)
-            except self.error as e:
-                self._respond_error(str(e))
-                self.printer.send_event("gcode:command_error")
-                if not need_ack:
-                    raise
-            except:
-                msg = 'Internal error on command:"%s"' % (cmd,)
-                logging.exception(msg)
-                self.printer.invoke_shutdown(msg)
-                self._respond_error(msg)
-                if not need_ack:
-                    raise
-            gcmd.ack()
+            cmd, origline, params = self._parse_line(line)
+            self._run_command(cmd, origline, params, need_ack)
+    def parse_lines(self, lines):
+        return [self._parse_line(line) for line in lines]
+    def run_parsed_command(self, parsed_command):
+        # Caller must hold the gcode mutex
+        cmd, origline, params = parsed_command
+        self._run_command(cmd, origline, params, False)
     def run_script_from_command(self, script):
         self._process_commands(script.split('\n'), need_ack=False)
     def run_script(self, script):
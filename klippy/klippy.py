@@ -22,6 +22,43 @@ command to reload the config and restart the host software.
 Printer is halted
 """
 
+# Track the time spent in each printer module during startup
+class StartupTiming:
+    def __init__(self, reactor):
+        self.reactor = reactor
+        self.stack = []
+        self.phases = []
+        self.modules = {}
+    def call(self, module, category, func, *args):
+        # Invoke func(*args) and note the time spent (excluding the
+        # time of any nested calls) against the given module
+        self.stack.append([self.reactor.monotonic(), 0.])
+        try:
+            return func(*args)
+        finally:
+            start_time, child_time = self.stack.pop()
+            duration = self.reactor.monotonic() - start_time
+            if self.stack:
+                self.stack[-1][1] += duration
+            times = self.modules.setdefault(module, {})
+            times[category] = times.get(category, 0.) + duration - child_time
+    def call_handler(self, category, cb, *args):
+        module = getattr(cb, '__module__', None) or '?'
+        return self.call(module, category, cb, *args)
+    def note_phase(self, phase, start_time):
+        self.phases.append((phase, self.reactor.monotonic() - start_time))
+    def log_report(self, max_modules=10):
+        phases = " ".join(["%s=%.3f" % (p, t) for p, t in self.phases])
+        totals = sorted([(sum(t.values()), m)
+                         for m, t in self.modules.items()], reverse=True)
+        lines = ["Startup timing: %s" % (phases,)]
+        for total, module in totals[:max_modules]:
+            times = self.modules[module]
+            lines.append("  %s: %.3f (%s)" % (
+                module, total, " ".join(["%s=%.3f" % (c, times[c])
+                                         for c in sorted(times)])))
+        logging.info("\n".join(lines))
+
 class Printer:
     config_error = configfile.error
     command_error = gcode.CommandError
@@ -35,6 +72,7 @@ class Printer:
         self.run_result = None
         self.event_handlers = {}
         self.objects = collections.OrderedDict()
+        self.startup_timing = StartupTiming(self.reactor)
         # Init printer components that must be setup prior to config
         for m in [gcode, webhooks]:
             m.add_early_printer_objects(self)
@@ -100,7 +138,9 @@ class Printer:
             if default is not configfile.sentinel:
                 return default
             raise self.config_error("Unable to load module '%s'" % (section,))
-        mod = importlib.import_module('extras.' + module_name)
+        timing = self.startup_timing
+        mod = timing.call('extras.' + module_name, 'import',
+                          importlib.import_module, 'extras.' + module_name)
         init_func = 'load_config'
         if len(module_parts) > 1:
             init_func = 'load_config_prefix'
@@ -109,30 +149,43 @@ class Printer:
             if default is not configfile.sentinel:
                 return default
             raise self.config_error("Unable to load module '%s'" % (section,))
-        self.objects[section] = init_func(config.getsection(section))
+        self.objects[section] = timing.call('extras.' + module_name, 'config',
+                                            init_func,
+                                            config.getsection(section))
         return self.objects[section]
     def _read_config(self):
+        timing = self.startup_timing
+        start_time = self.reactor.monotonic()
         self.objects['configfile'] = pconfig = configfile.PrinterConfig(self)
         config = pconfig.read_main_config()
         if self.bglogger is not None:
             pconfig.log_config(config)
+        timing.note_phase('read_config', start_time)
         # Create printer components
+        start_time = self.reactor.monotonic()
         for m in [pins, mcu]:
-            m.add_printer_objects(config)
+            timing.call(m.__name__, 'config', m.add_printer_objects, config)
         for section_config in config.get_prefix_sections(''):
             self.load_object(config, section_config.get_name(), None)
         for m in [toolhead]:
-            m.add_printer_objects(config)
+            timing.call(m.__name__, 'config', m.add_printer_objects, config)
         # Validate that there are no undefined parameters in the config file
         pconfig.check_unused_options(config)
+        timing.note_phase('load_objects', start_time)
     def _connect(self, eventtime):
+        timing = self.startup_timing
         try:
             self._read_config()
-            self.send_event("klippy:mcu_identify")
+            start_time = self.reactor.monotonic()
+            for cb in self.event_handlers.get("klippy:mcu_identify", []):
+                timing.call_handler('mcu_identify', cb)
+            timing.note_phase('mcu_identify', start_time)
+            start_time = self.reactor.monotonic()
             for cb in self.event_handlers.get("klippy:connect", []):
                 if self.state_message is not message_startup:
                     return
-                cb()
+                timing.call_handler('connect', cb)
+            timing.note_phase('connect', start_time)
         except (self.config_error, pins.error) as e:
             logging.exception("Config error")
             self._set_state("%s\n%s" % (str(e), message_restart))
@@ -158,10 +211,13 @@ class Printer:
             return
         try:
             self._set_state(message_ready)
+            start_time = self.reactor.monotonic()
             for cb in self.event_handlers.get("klippy:ready", []):
                 if self.state_message is not message_ready:
                     return
-                cb()
+                timing.call_handler('ready', cb)
+            timing.note_phase('ready', start_time)
+            timing.log_report()
         except Exception as e:
             logging.exception("Unhandled exception during ready callback")
             self.invoke_shutdown("Internal error during ready callback: %s"
@@ -274,6 +330,10 @@ def main():
     opts.add_option("-d", "--dictionary", dest="dictionary", type="string",
                     action="callback", callback=arg_dictionary,
                     help="file to read for mcu protocol dictionary")
+    opts.add_option("--cache-dir", dest="cachedir",
+                    help="directory for cached startup data (default is"
+                    " %s, empty to disable caching)"
+                    % (util.get_default_cache_dir(),))
     opts.add_option("--import-test", action="store_true",
                     help="perform an import module test")
     options, args = opts.parse_args()
@@ -281,8 +341,12 @@ def main():
         import_test()
     if len(args) != 1:
         opts.error("Incorrect number of arguments")
+    cache_dir = options.cachedir
+    if cache_dir is None and not options.debugoutput:
+        # Batch mode (file output) only caches with an explicit --cache-dir
+        cache_dir = util.get_default_cache_dir()
     start_args = {'config_file': args[0], 'apiserver': options.apiserver,
-                  'start_reason': 'startup'}
+                  'cache_dir': cache_dir, 'start_reason': 'startup'}
 
     debuglevel = logging.INFO
     if options.verbose:
@@ -3,7 +3,7 @@
 # Copyright (C) 2018-2019  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import math, logging, multiprocessing, traceback
+import math, logging, traceback
 import queuelogger
 
 
@@ -50,6 +50,7 @@ def coordinate_descent(adj_params, params, error_func):
 # Helper to run the coordinate descent function in a background
 # process so that it does not block the main thread.
 def background_coordinate_descent(printer, adj_params, params, error_func):
+    import multiprocessing
     parent_conn, child_conn = multiprocessing.Pipe()
     def wrapper():
         queuelogger.clear_bg_logging()
@@ -568,7 +568,9 @@ class MCU:
             self._name = self._name[4:]
         # Serial port
         name = self._name
-        self._serial = serialhdl.SerialReader(self._reactor, mcu_name = name)
+        cache_dir = printer.get_start_args().get('cache_dir')
+        self._serial = serialhdl.SerialReader(self._reactor, mcu_name = name,
+                                              cache_dir = cache_dir)
         self._baud = 0
         self._canbus_iface = None
         canbus_uuid = config.get('canbus_uuid', None)
@@ -890,6 +892,8 @@ class MCU:
         self._serial.register_response(cb, msg, oid)
     def alloc_command_queue(self):
         return self._serial.alloc_command_queue()
+    def get_serialqueue(self):
+        return self._serial.get_serialqueue()
     def lookup_command(self, msgformat, cq=None):
         return CommandWrapper(self._serial, msgformat, cq,
                               debugoutput=self.is_fileoutput())
@@ -3,18 +3,21 @@
 # Copyright (C) 2016-2025  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import os, gc, select, math, time, logging, queue
+import os, gc, select, math, time, logging, queue, heapq, bisect
 import greenlet
 import chelper, util
 
 _NOW = 0.
 _NEVER = 9999999999999999.
+TIMER_COMPACT_SIZE = 1000
 
 class ReactorTimer:
     def __init__(self, callback, waketime):
         self.callback = callback
         self.waketime = waketime
         self.timer_is_running = False
+        self.timer_is_registered = True
+        self.timer_seq = -1
 
 class ReactorCompletion:
     class sentinel: pass
@@ -62,6 +65,7 @@ class ReactorGreenlet(greenlet.greenlet):
     def __init__(self, run):
         greenlet.greenlet.__init__(self, run=run)
         self.timer = None
+        self.profile_callback = None
 
 class ReactorMutex:
     def __init__(self, reactor, is_locked):
@@ -73,6 +77,8 @@ class ReactorMutex:
         self.unlock = self.__exit__
     def test(self):
         return self.is_locked
+    def has_waiters(self):
+        return not not self.queue
     def __enter__(self):
         if not self.is_locked:
             self.is_locked = True
@@ -92,6 +98,86 @@ class ReactorMutex:
         self.next_pending = True
         self.reactor.update_timer(self.queue[0].timer, self.reactor.NOW)
 
+# Histogram bucket limits (in seconds) for callback and lateness times
+PROFILE_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .010, .025,
+                   .050, .100, .250)
+
+class ReactorHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(PROFILE_BUCKETS) + 1)
+        self.total = 0.
+        self.max_value = 0.
+    def add(self, value):
+        self.counts[bisect.bisect_left(PROFILE_BUCKETS, value)] += 1
+        self.total += value
+        if value > self.max_value:
+            self.max_value = value
+    def get_status(self):
+        return {'buckets': list(PROFILE_BUCKETS), 'counts': list(self.counts),
+                'total': self.total, 'max': self.max_value}
+
+def get_callback_name(callback):
+    g = getattr(callback, '__self__', None)
+    if isinstance(g, ReactorGreenlet) and g.profile_callback is not None:
+        # Resuming a paused greenlet - report the paused callback
+        callback = g.profile_callback
+    func = getattr(callback, '__func__', callback)
+    name = getattr(func, '__qualname__', None)
+    if name is None:
+        return repr(callback)
+    module = getattr(func, '__module__', None)
+    if module is None:
+        return name
+    return "%s.%s" % (module, name)
+
+# Track callback execution time and timer lateness
+class ReactorProfiler:
+    def __init__(self, reactor, slow_threshold):
+        self.monotonic = reactor.monotonic
+        self.slow_threshold = slow_threshold
+        self.callback_time = ReactorHistogram()
+        self.timer_lateness = ReactorHistogram()
+        self.slow_count = 0
+        self.last_slow_callback = None
+        self.cur_callback = None
+        self.cur_start = 0.
+    def _note_time(self, callback, start, end):
+        duration = end - start
+        self.callback_time.add(duration)
+        if duration >= self.slow_threshold:
+            self.slow_count += 1
+            self.last_slow_callback = name = get_callback_name(callback)
+            logging.warning("Slow reactor callback %s took %.6fs",
+                            name, duration)
+    def run(self, callback, eventtime, waketime=_NOW):
+        self.cur_callback = callback
+        self.cur_start = start = self.monotonic()
+        if waketime > _NOW:
+            self.timer_lateness.add(max(0., start - waketime))
+        res = callback(eventtime)
+        if self.cur_callback is callback:
+            self._note_time(callback, self.cur_start, self.monotonic())
+            self.cur_callback = None
+        # Otherwise the callback paused - time recorded by note_pause()
+        return res
+    def note_pause(self, g):
+        # The dispatch greenlet is pausing - record time spent so far
+        callback = self.cur_callback
+        if callback is None:
+            return
+        self.cur_callback = None
+        self._note_time(callback, self.cur_start, self.monotonic())
+        pg = getattr(callback, '__self__', None)
+        if isinstance(pg, ReactorGreenlet) and pg.profile_callback is not None:
+            callback = pg.profile_callback
+        g.profile_callback = callback
+    def get_status(self):
+        return {'callback_time': self.callback_time.get_status(),
+                'timer_lateness': self.timer_lateness.get_status(),
+                'slow_threshold': self.slow_threshold,
+                'slow_callbacks': self.slow_count,
+                'last_slow_callback': self.last_slow_callback}
+
 class SelectReactor:
     NOW = _NOW
     NEVER = _NEVER
@@ -102,8 +188,11 @@ class SelectReactor:
         # Python garbage collection
         self._check_gc = gc_checking
         self._last_gc_times = [0., 0., 0.]
-        # Timers
+        # Timers (a heap of (waketime, seq, timer) entries)
         self._timers = []
+        self._timer_seq = 0
+        self._timer_deferred = []
+        self._timer_compact_size = TIMER_COMPACT_SIZE
         self._next_timer = self.NEVER
         # Callbacks
         self._pipe_fds = None
@@ -115,26 +204,58 @@ class SelectReactor:
         self._g_dispatch = None
         self._greenlets = []
         self._all_greenlets = []
+        # Optional callback profiling
+        self._profiler = None
     def get_gc_stats(self):
         return tuple(self._last_gc_times)
+    def setup_profiling(self, slow_threshold):
+        self._profiler = ReactorProfiler(self, slow_threshold)
+    def get_profile_status(self):
+        if self._profiler is None:
+            return None
+        return self._profiler.get_status()
     # Timers
+    def _schedule_timer(self, timer_handler, waketime):
+        # Add a heap entry for the timer (any old entry becomes stale)
+        timer_handler.waketime = waketime
+        timer_handler.timer_seq = -1
+        if waketime >= self.NEVER or not timer_handler.timer_is_registered:
+            return
+        self._timer_seq = seq = self._timer_seq + 1
+        timer_handler.timer_seq = seq
+        timers = self._timers
+        heapq.heappush(timers, (waketime, seq, timer_handler))
+        if waketime < self._next_timer:
+            self._next_timer = waketime
+        if len(timers) > self._timer_compact_size:
+            # Remove stale entries
+            timers[:] = [e for e in timers if e[1] == e[2].timer_seq]
+            heapq.heapify(timers)
+            self._timer_compact_size = max(TIMER_COMPACT_SIZE,
+                                           2 * len(timers))
     def update_timer(self, timer_handler, waketime):
         if timer_handler.timer_is_running:
             return
-        timer_handler.waketime = waketime
-        self._next_timer = min(self._next_timer, waketime)
+        if (waketime == timer_handler.waketime
+            and timer_handler.timer_seq >= 0):
+            return
+        self._schedule_timer(timer_handler, waketime)
     def register_timer(self, callback, waketime=NEVER):
         timer_handler = ReactorTimer(callback, waketime)
-        timers = list(self._timers)
-        timers.append(timer_handler)
-        self._timers = timers
-        self._next_timer = min(self._next_timer, waketime)
+        self._schedule_timer(timer_handler, waketime)
         return timer_handler
     def unregister_timer(self, timer_handler):
+        timer_handler.timer_is_registered = False
         timer_handler.waketime = self.NEVER
-        timers = list(self._timers)
-        timers.pop(timers.index(timer_handler))
-        self._timers = timers
+        timer_handler.timer_seq = -1
+    def _restore_timers(self, entries):
+        # Return timer heap entries set aside by _check_timers
+        timers = self._timers
+        for entry in entries:
+            heapq.heappush(timers, entry)
+            if entry[0] < self._next_timer:
+                self._next_timer = entry[0]
+        del entries[:]
     def _check_timers(self, eventtime, busy):
         if eventtime < self._next_timer:
             if busy:
@@ -152,20 +273,44 @@ class SelectReactor:
                     gc.collect(gc_level)
                     return 0.
             return min(1., max(.001, self._next_timer - eventtime))
-        self._next_timer = self.NEVER
         g_dispatch = self._g_dispatch
-        for t in self._timers:
-            waketime = t.waketime
-            if eventtime >= waketime:
-                t.waketime = self.NEVER
-                t.timer_is_running = True
-                t.waketime = waketime = t.callback(eventtime)
-                t.timer_is_running = False
-                if g_dispatch is not self._g_dispatch:
-                    self._next_timer = min(self._next_timer, waketime)
-                    self._end_greenlet(g_dispatch)
-                    return 0.
-            self._next_timer = min(self._next_timer, waketime)
+        timers = self._timers
+        profiler = self._profiler
+        # Only run timers scheduled prior to this check (timers that are
+        # rescheduled during the check are set aside until the check
+        # completes so that they can not starve other pending timers)
+        # Restore entries from a check that paused in a timer callback
+        self._restore_timers(self._timer_deferred)
+        deferred = self._timer_deferred = []
+        last_seq = self._timer_seq
+        while timers:
+            waketime, seq, t = timers[0]
+            if waketime > eventtime:
+                break
+            heapq.heappop(timers)
+            if seq != t.timer_seq:
+                # Stale entry (timer was rescheduled or unregistered)
+                continue
+            if seq > last_seq:
+                deferred.append((waketime, seq, t))
+                continue
+            t.waketime = self.NEVER
+            t.timer_seq = -1
+            t.timer_is_running = True
+            if profiler is None:
+                waketime = t.callback(eventtime)
+            else:
+                waketime = profiler.run(t.callback, eventtime, waketime)
+            t.timer_is_running = False
+            self._schedule_timer(t, waketime)
+            if g_dispatch is not self._g_dispatch:
+                self._restore_timers(deferred)
+                self._end_greenlet(g_dispatch)
+                return 0.
+        self._restore_timers(deferred)
+        self._next_timer = self.NEVER
+        if timers:
+            self._next_timer = timers[0][0]
         return 0.
     # Callbacks and Completions
     def completion(self):
@@ -225,6 +370,8 @@ class SelectReactor:
             self._all_greenlets.append(g_next)
         g_next.parent = g.parent
         g.timer = self.register_timer(g.switch, waketime)
+        if self._profiler is not None:
+            self._profiler.note_pause(g)
         self._next_timer = self.NOW
         # Switch to _dispatch_loop (via _end_greenlet or direct)
         eventtime = g_next.switch()
@@ -271,18 +418,25 @@ class SelectReactor:
         while self._process:
             timeout = self._check_timers(eventtime, busy)
             busy = False
-            res = select.select(self._read_fds, self.write_fds, [], timeout)
+            res = select.select(self._read_fds, self._write_fds, [], timeout)
             eventtime = self.monotonic()
+            profiler = self._profiler
             for fd in res[0]:
                 busy = True
-                fd.read_callback(eventtime)
+                if profiler is None:
+                    fd.read_callback(eventtime)
+                else:
+                    profiler.run(fd.read_callback, eventtime)
                 if g_dispatch is not self._g_dispatch:
                     self._end_greenlet(g_dispatch)
                     eventtime = self.monotonic()
                     break
             for fd in res[1]:
                 busy = True
-                fd.write_callback(eventtime)
+                if profiler is None:
+                    fd.write_callback(eventtime)
+                else:
+                    profiler.run(fd.write_callback, eventtime)
                 if g_dispatch is not self._g_dispatch:
                     self._end_greenlet(g_dispatch)
                     eventtime = self.monotonic()
@@ -346,16 +500,25 @@ class PollReactor(SelectReactor):
             busy = False
             res = self._poll.poll(int(math.ceil(timeout * 1000.)))
             eventtime = self.monotonic()
+            profiler = self._profiler
             for fd, event in res:
                 busy = True
                 if event & (select.POLLIN | select.POLLHUP):
-                    self._fds[fd].read_callback(eventtime)
+                    callback = self._fds[fd].read_callback
+                    if profiler is None:
+                        callback(eventtime)
+                    else:
+                        profiler.run(callback, eventtime)
                     if g_dispatch is not self._g_dispatch:
                         self._end_greenlet(g_dispatch)
                         eventtime = self.monotonic()
                         break
                 if event & select.POLLOUT:
-                    self._fds[fd].write_callback(eventtime)
+                    callback = self._fds[fd].write_callback
+                    if profiler is None:
+                        callback(eventtime)
+                    else:
+                        profiler.run(callback, eventtime)
                     if g_dispatch is not self._g_dispatch:
                         self._end_greenlet(g_dispatch)
                         eventtime = self.monotonic()
@@ -397,16 +560,25 @@ class EPollReactor(SelectReactor):
             busy = False
             res = self._epoll.poll(timeout)
             eventtime = self.monotonic()
+            profiler = self._profiler
             for fd, event in res:
                 busy = True
                 if event & (select.EPOLLIN | select.EPOLLHUP):
-                    self._fds[fd].read_callback(eventtime)
+                    callback = self._fds[fd].read_callback
+                    if profiler is None:
+                        callback(eventtime)
+                    else:
+                        profiler.run(callback, eventtime)
                     if g_dispatch is not self._g_dispatch:
                         self._end_greenlet(g_dispatch)
                         eventtime = self.monotonic()
                         break
                 if event & select.EPOLLOUT:
-                    self._fds[fd].write_callback(eventtime)
+                    callback = self._fds[fd].write_callback
+                    if profiler is None:
+                        callback(eventtime)
+                    else:
+                        profiler.run(callback, eventtime)
                     if g_dispatch is not self._g_dispatch:
                         self._end_greenlet(g_dispatch)
                         eventtime = self.monotonic()
@@ -3,7 +3,7 @@
 # Copyright (C) 2016-2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, threading, os
+import logging, threading, os, zlib, hashlib
 import serial
 
 import msgproto, chelper, util
@@ -11,8 +11,47 @@ import msgproto, chelper, util
 class error(Exception):
     pass
 
+IDENTIFY_CHUNK = 40
+IDENTIFY_TAIL = 32
+
+# On-disk cache of mcu data dictionaries.  A cached dictionary is
+# selected using the first identify chunk and is then verified by
+# requesting the final bytes of the dictionary from the mcu (the end
+# of the zlib data contains a checksum of the full dictionary).
+class IdentifyCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+    def _get_filename(self, head):
+        return os.path.join(self.cache_dir, "mcu_dict_%s.zlib" % (
+            hashlib.sha1(head).hexdigest(),))
+    def lookup(self, head):
+        # Return the cached dictionary starting with 'head' (or None)
+        try:
+            with open(self._get_filename(head), 'rb') as f:
+                data = f.read()
+            if (len(data) < IDENTIFY_CHUNK + IDENTIFY_TAIL
+                or not data.startswith(head)):
+                return None
+            zlib.decompress(data)
+        except (IOError, OSError, zlib.error):
+            return None
+        return data
+    def save(self, data):
+        filename = self._get_filename(data[:IDENTIFY_CHUNK])
+        tmpname = filename + ".tmp"
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            with open(tmpname, 'wb') as f:
+                f.write(data)
+            os.rename(tmpname, filename)
+        except (IOError, OSError) as e:
+            # Unable to cache the dictionary - not a fatal error
+            logging.info("Unable to write mcu dictionary cache %s: %s",
+                         filename, e)
+
 class SerialReader:
-    def __init__(self, reactor, mcu_name=""):
+    def __init__(self, reactor, mcu_name="", cache_dir=None):
         self.reactor = reactor
         self.warn_prefix = ""
         self.mcu_name = mcu_name
@@ -23,6 +62,9 @@ class SerialReader:
         # Serial port
         self.serial_dev = None
         self.msgparser = msgproto.MessageParser(warn_prefix=self.warn_prefix)
+        self.identify_cache = None
+        if cache_dir:
+            self.identify_cache = IdentifyCache(cache_dir)
         # C interface
         self.ffi_main, self.ffi_lib = chelper.get_ffi()
         self.serialqueue = None
@@ -66,13 +108,33 @@ class SerialReader:
                                   self.warn_prefix)
     def _error(self, msg, *params):
         raise error(self.warn_prefix + (msg % params))
+    def _check_identify_cache(self, head):
+        # Check if the mcu data dictionary matches a cached dictionary
+        data = self.identify_cache.lookup(head)
+        if data is None:
+            return None
+        offset = len(data) - IDENTIFY_TAIL
+        msg = "identify offset=%d count=%d" % (offset, IDENTIFY_CHUNK)
+        params = self.send_with_response(msg, 'identify_response')
+        if params['offset'] != offset or params['data'] != data[offset:]:
+            return None
+        logging.info("%sUsing cached data dictionary (%d bytes)",
+                     self.warn_prefix, len(data))
+        return data
     def _get_identify_data(self, eventtime):
         # Query the "data dictionary" from the micro-controller
         identify_data = b""
         while 1:
-            msg = "identify offset=%d count=%d" % (len(identify_data), 40)
+            msg = "identify offset=%d count=%d" % (len(identify_data),
+                                                   IDENTIFY_CHUNK)
             try:
                 params = self.send_with_response(msg, 'identify_response')
+                if (not identify_data and self.identify_cache is not None
+                    and params['offset'] == 0
+                    and len(params['data']) == IDENTIFY_CHUNK):
+                    cached_data = self._check_identify_cache(params['data'])
+                    if cached_data is not None:
+                        return cached_data
             except error as e:
                 logging.exception("%sWait for identify_response",
                                   self.warn_prefix)
@@ -81,6 +143,8 @@ class SerialReader:
                 msgdata = params['data']
                 if not msgdata:
                     # Done
+                    if self.identify_cache is not None:
+                        self.identify_cache.save(identify_data)
                     return identify_data
                 identify_data += msgdata
     def _start_session(self, serial_dev, serial_fd_type=b'u', client_id=0):
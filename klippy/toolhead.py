@@ -12,13 +12,20 @@ import mcu, chelper, kinematics.extruder
 
 # Class to track each move request
 class Move:
+    # Many moves may be queued - use __slots__ to avoid per-move dicts
+    __slots__ = (
+        'toolhead', 'start_pos', 'end_pos', 'accel', 'junction_deviation',
+        'timing_callbacks', 'is_kinematic_move', 'axes_d', 'move_d',
+        'axes_r', 'min_move_t', 'max_start_v2', 'max_cruise_v2', 'delta_v2',
+        'max_smoothed_v2', 'smooth_delta_v2', 'next_junction_v2',
+        'start_v', 'cruise_v', 'end_v', 'accel_t', 'cruise_t', 'decel_t')
     def __init__(self, toolhead, start_pos, end_pos, speed):
         self.toolhead = toolhead
         self.start_pos = tuple(start_pos)
         self.end_pos = tuple(end_pos)
         self.accel = toolhead.max_accel
         self.junction_deviation = toolhead.junction_deviation
-        self.timing_callbacks = []
+        self.timing_callbacks = ()
         velocity = min(speed, toolhead.max_velocity)
         self.is_kinematic_move = True
         self.axes_d = axes_d = [ep - sp for sp, ep in zip(start_pos, end_pos)]
@@ -190,6 +197,50 @@ class LookAheadQueue:
         # Check if enough moves have been queued to reach the target flush time.
         return self.junction_flush <= 0.
 
+# Lookahead queue with the junction velocity planning done in C code
+class CLookAheadQueue(LookAheadQueue):
+    def __init__(self):
+        LookAheadQueue.__init__(self)
+        ffi_main, ffi_lib = chelper.get_ffi()
+        self.clookahead = ffi_main.gc(ffi_lib.lookahead_alloc(),
+                                      ffi_lib.lookahead_free)
+        self.lookahead_reset = ffi_lib.lookahead_reset
+        self.lookahead_add_move = ffi_lib.lookahead_add_move
+        self.lookahead_flush = ffi_lib.lookahead_flush
+        self.lookahead_pop_moves = ffi_lib.lookahead_pop_moves
+        self.junctions = ffi_main.new('double[]', 3 * 1024)
+        self.junctions_size = 1024
+        self.ffi_main = ffi_main
+    def reset(self):
+        LookAheadQueue.reset(self)
+        self.lookahead_reset(self.clookahead)
+    def flush(self, lazy=False):
+        self.junction_flush = LOOKAHEAD_FLUSH_TIME
+        flush_count = self.lookahead_flush(self.clookahead, lazy)
+        if not flush_count:
+            return []
+        if flush_count > self.junctions_size:
+            self.junctions_size = flush_count
+            self.junctions = self.ffi_main.new('double[]', 3 * flush_count)
+        junctions = self.junctions
+        self.lookahead_pop_moves(self.clookahead, junctions, flush_count)
+        # Remove processed moves from the queue
+        queue = self.queue
+        res = queue[:flush_count]
+        del queue[:flush_count]
+        for i, move in enumerate(res):
+            move.set_junction(junctions[i*3], junctions[i*3+1],
+                              junctions[i*3+2])
+        return res
+    def add_move(self, move):
+        want_flush = LookAheadQueue.add_move(self, move)
+        self.lookahead_add_move(self.clookahead, move.max_start_v2,
+                                move.delta_v2, move.max_smoothed_v2,
+                                move.smooth_delta_v2, move.max_cruise_v2)
+        return want_flush
+
+LOOKAHEAD_PLANNERS = {'python': LookAheadQueue, 'c': CLookAheadQueue}
+
 BUFFER_TIME_LOW = 1.0
 BUFFER_TIME_HIGH = 2.0
 BUFFER_TIME_START = 0.250
@@ -200,7 +251,9 @@ class ToolHead:
         self.printer = config.get_printer()
         self.reactor = self.printer.get_reactor()
         self.mcu = self.printer.lookup_object('mcu')
-        self.lookahead = LookAheadQueue()
+        planner = config.getchoice('lookahead_planner', LOOKAHEAD_PLANNERS,
+                                   'python')
+        self.lookahead = planner()
         self.lookahead.set_flush_time(BUFFER_TIME_HIGH)
         self.commanded_pos = [0., 0., 0., 0.]
         # Velocity and acceleration control
@@ -512,7 +565,7 @@ class ToolHead:
         if last_move is None:
             callback(self.get_last_move_time())
             return
-        last_move.timing_callbacks.append(callback)
+        last_move.timing_callbacks += (callback,)
     def get_max_velocity(self):
         return self.max_velocity, self.max_accel
     def _calc_junction_deviation(self):
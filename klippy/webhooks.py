@@ -3,7 +3,7 @@
 # Copyright (C) 2020 Eric Callahan <arksine.code@gmail.com>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license
-import logging, socket, os, sys, errno, collections
+import logging, socket, os, sys, errno, collections, struct, itertools
 import gcode
 
 try:
@@ -37,6 +37,31 @@ else:
     json_loads = msgspec.json.decode
 
 REQUEST_LOG_SIZE = 20
+CLIENT_SEND_BUFFER_LIMIT = 1024 * 1024
+
+# Binary message framing.  Each message is sent as a header containing
+# the length of a JSON encoded dictionary and the length of an optional
+# binary attachment, followed by the JSON data and the attachment.
+FRAMING_TYPES = ['json', 'binary']
+BINARY_FRAME_HEADER = struct.Struct("<II")
+
+def encode_binary_frame(data, attachment=b""):
+    jmsg = json_dumps(data)
+    hdr = BINARY_FRAME_HEADER.pack(len(jmsg), len(attachment))
+    return hdr + jmsg + attachment
+
+# Pack a list of equal length sample tuples into little-endian doubles
+def pack_samples(samples):
+    if not samples:
+        return None
+    cols = len(samples[0])
+    try:
+        sample_struct = struct.Struct("<%dd" % (cols,))
+        data = b"".join(itertools.starmap(sample_struct.pack, samples))
+    except (TypeError, struct.error):
+        return None
+    desc = {'encoding': 'float64le', 'rows': len(samples), 'cols': cols}
+    return desc, data
 
 class WebRequestError(gcode.CommandError):
     def __init__(self, message,):
@@ -174,6 +199,9 @@ class ServerSocket:
     def pop_client(self, client_id):
         self.clients.pop(client_id, None)
 
+    def get_clients(self):
+        return list(self.clients.values())
+
     def stats(self, eventtime):
         # Called once per second - check for idle clients
         for client in list(self.clients.values()):
@@ -197,6 +225,12 @@ class ClientConnection:
         self.partial_data = self.send_buffer = b""
         self.is_blocking = False
         self.blocking_count = 0
+        # Status updates merged while the client is not keeping up
+        self.pending_status = None
+        self.drop_count = self.coalesce_count = 0
+        self.client_info = None
+        # Message framing (changed via the "info" endpoint)
+        self.framing = self.next_framing = 'json'
         self.set_client_info("?", "New connection")
         self.request_log = collections.deque([], REQUEST_LOG_SIZE)
 
@@ -209,6 +243,7 @@ class ClientConnection:
         logging.info("\n".join(out))
 
     def set_client_info(self, client_info, state_msg=None):
+        self.client_info = client_info
         if state_msg is None:
             state_msg = "Client info %s" % (repr(client_info),)
         logging.info("webhooks client %s: %s", self.uid, state_msg)
@@ -219,9 +254,24 @@ class ClientConnection:
         rollover_msg = "webhooks client %s: %s" % (self.uid, repr(client_info))
         self.printer.set_rollover_info(log_id, rollover_msg, log=False)
 
+    def get_stats(self):
+        pending_status = 0
+        if self.pending_status is not None:
+            pending_status = len(self.pending_status[2])
+        return {'client_id': self.uid, 'client_info': self.client_info,
+                'is_blocking': self.is_blocking,
+                'send_backlog': len(self.send_buffer),
+                'pending_status_objects': pending_status,
+                'dropped_messages': self.drop_count,
+                'coalesced_status_updates': self.coalesce_count}
+
     def close(self):
         if self.fd_handle is None:
             return
+        if self.drop_count or self.coalesce_count:
+            logging.info("webhooks client %s: dropped %d messages,"
+                         " coalesced %d status updates", self.uid,
+                         self.drop_count, self.coalesce_count)
         self.set_client_info(None, "Disconnected")
         self.reactor.unregister_fd(self.fd_handle)
         self.fd_handle = None
@@ -275,14 +325,28 @@ class ClientConnection:
             web_request.set_error(WebRequestError(str(e)))
             self.printer.invoke_shutdown(msg)
         result = web_request.finish()
-        if result is None:
-            return
-        self.send(result)
-
-    def send(self, data):
+        if result is not None:
+            self.send(result)
+        # Framing changes take effect after the requesting response
+        self.framing = self.next_framing
+
+    def set_framing(self, framing):
+        self.next_framing = framing
+
+    def _check_backlog(self, droppable):
+        if (droppable and self.is_blocking
+            and len(self.send_buffer) >= CLIENT_SEND_BUFFER_LIMIT):
+            # Client is not keeping up - discard bulk sensor messages
+            self.drop_count += 1
+            return True
+        return False
+
+    def _queue_message(self, data, attachment=b""):
         try:
-            jmsg = json_dumps(data)
-            self.send_buffer += jmsg + b"\x03"
+            if self.framing == 'binary':
+                self.send_buffer += encode_binary_frame(data, attachment)
+            else:
+                self.send_buffer += json_dumps(data) + b"\x03"
         except (TypeError, ValueError) as e:
             msg = ("json encoding error: %s" % (str(e),))
             logging.exception(msg)
@@ -291,6 +355,46 @@ class ClientConnection:
         if not self.is_blocking:
             self._do_send()
 
+    def send(self, data, droppable=False):
+        if self._check_backlog(droppable):
+            return
+        self._queue_message(data)
+
+    def send_bulk(self, data):
+        # Send a message with a params['data'] list of sample tuples.
+        # With binary framing the samples are sent as an attachment.
+        if self.framing != 'binary':
+            self.send(data, droppable=True)
+            return
+        if self._check_backlog(True):
+            return
+        params = data['params']
+        res = pack_samples(params.get('data'))
+        if res is None:
+            self._queue_message(data)
+            return
+        desc, attachment = res
+        hdr = dict(data)
+        hdr['params'] = dict(params)
+        hdr['params']['data'] = desc
+        self._queue_message(hdr, attachment)
+
+    def send_status(self, template, eventtime, status):
+        if not self.is_blocking:
+            tmp = dict(template)
+            tmp['params'] = {'eventtime': eventtime, 'status': status}
+            self.send(tmp)
+            return
+        # Client is not keeping up - merge with any pending status update
+        if self.pending_status is None:
+            self.pending_status = (template, eventtime, {})
+        else:
+            self.coalesce_count += 1
+        pstatus = self.pending_status[2]
+        for obj_name, cres in status.items():
+            pstatus.setdefault(obj_name, {}).update(cres)
+        self.pending_status = (template, eventtime, pstatus)
+
     def _do_send(self, eventtime=None):
         if self.fd_handle is None:
             return
@@ -311,6 +415,11 @@ class ClientConnection:
             self.reactor.set_fd_wake(self.fd_handle, True, False)
             self.is_blocking = False
         self.send_buffer = self.send_buffer[sent:]
+        if not self.is_blocking and self.pending_status is not None:
+            # Transmit status updates that were merged while blocked
+            template, status_time, status = self.pending_status
+            self.pending_status = None
+            self.send_status(template, status_time, status)
 
 class WebHooks:
     def __init__(self, printer):
@@ -322,6 +431,7 @@ class WebHooks:
         self.register_endpoint("emergency_stop", self._handle_estop_request)
         self.register_endpoint("register_remote_method",
                                self._handle_rpc_registration)
+        self.register_endpoint("webhooks/clients", self._handle_clients)
         self.sconn = ServerSocket(self, printer)
 
     def register_endpoint(self, path, callback):
@@ -363,6 +473,11 @@ class WebHooks:
         client_info = web_request.get_dict('client_info', None)
         if client_info is not None:
             web_request.get_client_connection().set_client_info(client_info)
+        framing = web_request.get_str('framing', None)
+        if framing is not None:
+            if framing not in FRAMING_TYPES:
+                raise web_request.error("Invalid framing '%s'" % (framing,))
+            web_request.get_client_connection().set_framing(framing)
         state_message, state = self.printer.get_state_message()
         src_path = os.path.dirname(__file__)
         klipper_path = os.path.normpath(os.path.join(src_path, ".."))
@@ -377,8 +492,14 @@ class WebHooks:
         start_args = self.printer.get_start_args()
         for sa in ['log_file', 'config_file', 'software_version', 'cpu_info']:
             response[sa] = start_args.get(sa)
+        if framing is not None:
+            response['framing'] = framing
         web_request.send(response)
 
+    def _handle_clients(self, web_request):
+        clients = self.sconn.get_clients()
+        web_request.send({'clients': [c.get_stats() for c in clients]})
+
     def _handle_estop_request(self, web_request):
         self.printer.invoke_shutdown("Shutdown due to webhooks request")
 
@@ -467,6 +588,19 @@ class GCodeHelper:
             self.is_output_registered = True
 
 SUBSCRIPTION_REFRESH_TIME = .25
+SUBSCRIPTION_MIN_REFRESH_TIME = .050
+
+# Status subscription state for a single client (or a single query)
+class StatusSubscription:
+    def __init__(self, cconn, objects, template, refresh_time):
+        self.cconn = cconn
+        self.objects = objects
+        self.template = template
+        self.refresh_time = refresh_time
+        self.next_time = 0.
+        # Status (and status version) last sent to this client
+        self.last_status = {}
+        self.last_versions = {}
 
 class QueryStatusHelper:
     def __init__(self, printer):
@@ -474,7 +608,6 @@ class QueryStatusHelper:
         self.clients = {}
         self.pending_queries = []
         self.query_timer = None
-        self.last_query = {}
         # Register webhooks
         webhooks = printer.lookup_object('webhooks')
         webhooks.register_endpoint("objects/list", self._handle_list)
@@ -484,52 +617,86 @@ class QueryStatusHelper:
         objects = [n for n, o in self.printer.lookup_objects()
                    if hasattr(o, 'get_status')]
         web_request.send({'objects': objects})
+    def _get_status(self, query, obj_name, eventtime):
+        res = query.get(obj_name, None)
+        if res is None:
+            po = self.printer.lookup_object(obj_name, None)
+            if po is None or not hasattr(po, 'get_status'):
+                res = query[obj_name] = {}
+            else:
+                res = query[obj_name] = po.get_status(eventtime)
+        return res
+    def _get_status_version(self, versions, obj_name):
+        # Objects may optionally implement get_status_version() - a
+        # value that changes whenever get_status() may return new data
+        if obj_name in versions:
+            return versions[obj_name]
+        po = self.printer.lookup_object(obj_name, None)
+        version = None
+        if po is not None and hasattr(po, 'get_status_version'):
+            version = po.get_status_version()
+        versions[obj_name] = version
+        return version
+    def _query_subscription(self, sub, query, versions, eventtime,
+                            is_query=False):
+        cquery = {}
+        for obj_name, req_items in sub.objects.items():
+            # Skip objects that report they have not changed
+            version = self._get_status_version(versions, obj_name)
+            if (not is_query and version is not None
+                and version == sub.last_versions.get(obj_name)):
+                continue
+            res = self._get_status(query, obj_name, eventtime)
+            if req_items is None:
+                req_items = list(res.keys())
+                if req_items:
+                    sub.objects[obj_name] = req_items
+            lres = sub.last_status.get(obj_name, {})
+            cres = {}
+            for ri in req_items:
+                rd = res.get(ri, None)
+                if is_query or rd != lres.get(ri):
+                    cres[ri] = rd
+            sub.last_status[obj_name] = res
+            sub.last_versions[obj_name] = version
+            if cres or is_query:
+                cquery[obj_name] = cres
+        return cquery
     def _do_query(self, eventtime):
-        last_query = self.last_query
-        query = self.last_query = {}
+        query = {}
+        versions = {}
+        # Report full status to each pending query
         msglist = self.pending_queries
         self.pending_queries = []
-        msglist.extend(self.clients.values())
-        # Generate get_status() info for each client
-        for cconn, subscription, send_func, template in msglist:
-            is_query = cconn is None
-            if not is_query and cconn.is_closed():
+        for sub, send_func in msglist:
+            cquery = self._query_subscription(sub, query, versions, eventtime,
+                                              is_query=True)
+            send_func({'params': {'eventtime': eventtime, 'status': cquery}})
+        # Report changes to each subscribed client that is due an update
+        for cconn, sub in list(self.clients.items()):
+            if cconn.is_closed():
                 del self.clients[cconn]
                 continue
-            # Query each requested printer object
-            cquery = {}
-            for obj_name, req_items in subscription.items():
-                res = query.get(obj_name, None)
-                if res is None:
-                    po = self.printer.lookup_object(obj_name, None)
-                    if po is None or not hasattr(po, 'get_status'):
-                        res = query[obj_name] = {}
-                    else:
-                        res = query[obj_name] = po.get_status(eventtime)
-                if req_items is None:
-                    req_items = list(res.keys())
-                    if req_items:
-                        subscription[obj_name] = req_items
-                lres = last_query.get(obj_name, {})
-                cres = {}
-                for ri in req_items:
-                    rd = res.get(ri, None)
-                    if is_query or rd != lres.get(ri):
-                        cres[ri] = rd
-                if cres or is_query:
-                    cquery[obj_name] = cres
-            # Send data
-            if cquery or is_query:
-                tmp = dict(template)
-                tmp['params'] = {'eventtime': eventtime, 'status': cquery}
-                send_func(tmp)
-        if not query:
+            if eventtime < sub.next_time:
+                continue
+            sub.next_time = eventtime + sub.refresh_time
+            cquery = self._query_subscription(sub, query, versions, eventtime)
+            if cquery:
+                cconn.send_status(sub.template, eventtime, cquery)
+        reactor = self.printer.get_reactor()
+        if not self.clients:
             # Unregister timer if there are no longer any subscriptions
-            reactor = self.printer.get_reactor()
             reactor.unregister_timer(self.query_timer)
             self.query_timer = None
             return reactor.NEVER
-        return eventtime + SUBSCRIPTION_REFRESH_TIME
+        return min([sub.next_time for sub in self.clients.values()])
+    def _kick_timer(self):
+        reactor = self.printer.get_reactor()
+        if self.query_timer is None:
+            qt = reactor.register_timer(self._do_query, reactor.NOW)
+            self.query_timer = qt
+        else:
+            reactor.update_timer(self.query_timer, reactor.NOW)
     def _handle_query(self, web_request, is_subscribe=False):
         objects = web_request.get_dict('objects')
         # Validate subscription format
@@ -540,6 +707,12 @@ class QueryStatusHelper:
                 for ri in v:
                     if type(ri) != str:
                         raise web_request.error("Invalid argument")
+        refresh_time = SUBSCRIPTION_REFRESH_TIME
+        if is_subscribe:
+            refresh_time = web_request.get_float('refresh_time',
+                                                 SUBSCRIPTION_REFRESH_TIME)
+            if refresh_time < SUBSCRIPTION_MIN_REFRESH_TIME:
+                raise web_request.error("Invalid refresh_time")
         # Add to pending queries
         cconn = web_request.get_client_connection()
         template = web_request.get_dict('response_template', {})
@@ -547,16 +720,16 @@ class QueryStatusHelper:
             del self.clients[cconn]
         reactor = self.printer.get_reactor()
         complete = reactor.completion()
-        self.pending_queries.append((None, objects, complete.complete, {}))
-        # Start timer if needed
-        if self.query_timer is None:
-            qt = reactor.register_timer(self._do_query, reactor.NOW)
-            self.query_timer = qt
+        sub = StatusSubscription(cconn, objects, template, refresh_time)
+        self.pending_queries.append((sub, complete.complete))
+        self._kick_timer()
         # Wait for data to be queried
         msg = complete.wait()
         web_request.send(msg['params'])
         if is_subscribe:
-            self.clients[cconn] = (cconn, objects, cconn.send, template)
+            sub.next_time = msg['params']['eventtime'] + refresh_time
+            self.clients[cconn] = sub
+            self._kick_timer()
     def _handle_subscribe(self, web_request):
         self._handle_query(web_request, is_subscribe=True)
 
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Benchmark memory and time used to store accelerometer measurements
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, time, random, importlib, tracemalloc
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+adxl345 = importlib.import_module('extras.adxl345')
+
+# Minimal printer object for use with AccelQueryHelper
+class BenchToolhead:
+    def __init__(self):
+        self.last_move_time = 0.
+    def get_last_move_time(self):
+        return self.last_move_time
+    def wait_moves(self):
+        pass
+class BenchPrinter:
+    def __init__(self):
+        self.toolhead = BenchToolhead()
+    def lookup_object(self, name):
+        return self.toolhead
+
+def gen_batches(rnd, duration, rate, batch_time):
+    # Batches similar to those generated by BatchBulkHelper
+    count = int(rate * batch_time)
+    samp_time = 1.
+    for i in range(int(duration / batch_time)):
+        samples = [None] * count
+        for j in range(count):
+            samples[j] = (round(samp_time, 6),
+                          round(rnd.uniform(-20000., 20000.), 6),
+                          round(rnd.uniform(-20000., 20000.), 6),
+                          round(rnd.uniform(-20000., 20000.), 6))
+            samp_time += 1. / rate
+        yield {'data': samples, 'errors': 0, 'overflows': 0}
+
+def measure_memory(rnd, duration, rate, keep_msgs):
+    # Report memory used to store the measurements of a capture
+    printer = BenchPrinter()
+    aqh = adxl345.AccelQueryHelper(printer)
+    batches = gen_batches(rnd, duration, rate, adxl345.BATCH_UPDATES)
+    msgs = []
+    count = 0
+    tracemalloc.start()
+    start_size = tracemalloc.get_traced_memory()[0]
+    for msg in batches:
+        count += len(msg['data'])
+        if keep_msgs:
+            # Retain the messages (as previous versions of the code did)
+            msgs.append(msg)
+        else:
+            aqh.handle_batch(msg)
+        del msg
+    end_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return count, end_size - start_size
+
+def measure_speed(rnd, duration, rate):
+    # Report time to store and retrieve the measurements of a capture
+    printer = BenchPrinter()
+    aqh = adxl345.AccelQueryHelper(printer)
+    batches = list(gen_batches(rnd, duration, rate, adxl345.BATCH_UPDATES))
+    start_time = time.time()
+    for msg in batches:
+        aqh.handle_batch(msg)
+    handle_time = time.time() - start_time
+    printer.toolhead.last_move_time = 1. + duration
+    aqh.finish_measurements()
+    start_time = time.time()
+    samples = aqh.get_samples()
+    samples_time = time.time() - start_time
+    return len(samples), handle_time, samples_time
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-d", "--duration", type="float", dest="duration",
+                    default=60., help="capture duration (in seconds)")
+    opts.add_option("-r", "--rate", type="float", dest="rate",
+                    default=3200., help="samples per second")
+    options, args = opts.parse_args()
+    if args:
+        opts.error("Incorrect number of arguments")
+    for name, keep_msgs in [("messages", True), ("array", False)]:
+        count, size = measure_memory(random.Random(0), options.duration,
+                                     options.rate, keep_msgs)
+        print("Memory (%s): %d samples in %.1fMB (%.1f bytes/sample)" % (
+            name, count, size / 1000000., float(size) / count))
+    count, handle_time, samples_time = measure_speed(
+        random.Random(0), options.duration, options.rate)
+    print("Speed: handle_batch %.3fus/sample, get_samples %.3fms" % (
+        handle_time * 1000000. / count, samples_time * 1000.))
+
+if __name__ == '__main__':
+    main()
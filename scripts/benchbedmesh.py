@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# Benchmark bed mesh interpolation
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, time, random
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+from extras import bed_mesh
+from check_bed_mesh import build_mesh
+
+def measure(algo, count, pps, use_numpy, runs):
+    # Report the time to build an interpolated mesh
+    params = {'min_x': 10., 'max_x': 290., 'min_y': 10., 'max_y': 290.,
+              'x_count': count, 'y_count': count,
+              'mesh_x_pps': pps, 'mesh_y_pps': pps,
+              'algo': algo, 'tension': .2}
+    rnd = random.Random(0)
+    z_matrix = [[rnd.uniform(-.5, .5) for i in range(count)]
+                for j in range(count)]
+    start_time = time.time()
+    for i in range(runs):
+        build_mesh(params, z_matrix, use_numpy)
+    return (time.time() - start_time) / runs
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-p", "--pps", type="int", dest="pps", default=4,
+                    help="number of points to interpolate per segment")
+    opts.add_option("-r", "--runs", type="int", dest="runs", default=5,
+                    help="number of times to build each mesh")
+    options, args = opts.parse_args()
+    if args:
+        opts.error("Incorrect number of arguments")
+    modes = [('python', False)]
+    if bed_mesh.load_numpy() is not None:
+        modes.append(('numpy', True))
+    for algo, count in [('lagrange', 5), ('lagrange', 6), ('bicubic', 9),
+                        ('bicubic', 15), ('bicubic', 20)]:
+        for mode, use_numpy in modes:
+            duration = measure(algo, count, options.pps, use_numpy,
+                               options.runs)
+            print("%-8s %2dx%-2d pps=%d %-6s: %.3fms per mesh" % (
+                algo, count, count, options.pps, mode, duration * 1000.))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Benchmark API server encoding of bulk sensor messages
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, time, random
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+import webhooks
+
+def gen_batch(rnd, count, cols):
+    # Samples similar to an accelerometer batch (time, x, y, z)
+    start_time = rnd.uniform(1000., 100000.)
+    samples = []
+    for i in range(count):
+        samp = [round(rnd.uniform(-20000., 20000.), 6)
+                for j in range(cols - 1)]
+        samples.append(tuple([start_time + i * .0003125] + samp))
+    return {'params': {'data': samples, 'errors': 0, 'overflows': 0}}
+
+def encode_json(msg):
+    return webhooks.json_dumps(msg) + b"\x03"
+
+def encode_binary(msg):
+    params = msg['params']
+    desc, attachment = webhooks.pack_samples(params['data'])
+    hdr = dict(msg)
+    hdr['params'] = dict(params)
+    hdr['params']['data'] = desc
+    return webhooks.encode_binary_frame(hdr, attachment)
+
+MODES = {'json': encode_json, 'binary': encode_binary}
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-b", "--batch", type="int", dest="batch", default=1600,
+                    help="number of samples per message")
+    opts.add_option("-c", "--columns", type="int", dest="cols", default=4,
+                    help="number of values per sample")
+    opts.add_option("-n", "--messages", type="int", dest="count", default=200,
+                    help="number of messages to encode")
+    options, args = opts.parse_args()
+    if args:
+        opts.error("Incorrect number of arguments")
+    rnd = random.Random(0)
+    msgs = [gen_batch(rnd, options.batch, options.cols)
+            for i in range(options.count)]
+    total_samples = options.batch * options.count
+    for mode in sorted(MODES.keys()):
+        encode = MODES[mode]
+        start_time = time.time()
+        size = 0
+        for msg in msgs:
+            size += len(encode(msg))
+        duration = time.time() - start_time
+        print("%-6s %d samples in %.3fs: %.1fus per 1000 samples"
+              " (%.1f bytes/sample)" % (
+                  mode, total_samples, duration,
+                  duration * 1000000000. / total_samples,
+                  float(size) / total_samples))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# Benchmark host g-code parsing and dispatch overhead
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, time, logging, importlib, tempfile
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+import gcode, reactor
+virtual_sdcard = importlib.import_module('.virtual_sdcard', 'extras')
+gcode_move = importlib.import_module('.gcode_move', 'extras')
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'test', 'klippy', 'move.gcode')
+
+MOVE_COMMANDS = ['G0', 'G1', 'G90', 'G91', 'G92', 'M82', 'M83', 'M220', 'M221']
+
+# Minimal printer object for use with GCodeDispatch and GCodeMove
+class BenchPrinter:
+    config_error = Exception
+    def __init__(self):
+        self.objects = {'toolhead': BenchToolhead()}
+    def get_start_args(self):
+        return {}
+    def register_event_handler(self, event, callback):
+        pass
+    def send_event(self, event, *params):
+        pass
+    def get_reactor(self):
+        return self
+    def mutex(self):
+        return reactor.ReactorMutex(self, False)
+    def get_printer(self):
+        return self
+    def add_object(self, name, obj):
+        self.objects[name] = obj
+    def lookup_object(self, name, default=None):
+        return self.objects.get(name, default)
+
+# Toolhead that discards all moves
+class BenchToolhead:
+    def move(self, newpos, speed):
+        pass
+    def get_position(self):
+        return [0., 0., 0., 0.]
+
+def setup_gcode(data, simple_moves=True):
+    printer = BenchPrinter()
+    gcode_dispatch = gcode.GCodeDispatch(printer)
+    printer.add_object('gcode', gcode_dispatch)
+    gm = gcode_move.GCodeMove(printer)
+    if not simple_moves:
+        gcode_dispatch.simple_move_handlers.clear()
+    gm._handle_ready()
+    gcode_dispatch._handle_ready()
+    # Only use real handlers for g-code coordinate commands
+    for cmd in list(gcode_dispatch.ready_gcode_handlers.keys()):
+        if cmd not in MOVE_COMMANDS:
+            gcode_dispatch.register_command(cmd, None)
+    # Register a dummy handler for every command in the input
+    def dummy_handler(gcmd):
+        pass
+    for line in data.split('\n'):
+        cmd, params = gcode_dispatch._parse_params(line.strip())
+        if cmd and cmd not in gcode_dispatch.ready_gcode_handlers:
+            gcode_dispatch.register_command(cmd, dummy_handler)
+    return gcode_dispatch
+
+
+######################################################################
+# Dispatch modes
+######################################################################
+
+def read_blocks(data):
+    # Split data into 8192 byte blocks (similar to virtual_sdcard reads)
+    partial_input = ""
+    for pos in range(0, len(data), 8192):
+        lines = data[pos:pos+8192].split('\n')
+        lines[0] = partial_input + lines[0]
+        partial_input = lines.pop()
+        yield lines
+
+def run_lines(gcode_dispatch, data, batch_size):
+    # Original virtual_sdcard dispatch - one run_script() call per line
+    file_position = 0
+    for lines in read_blocks(data):
+        for line in lines:
+            file_position += len(line.encode()) + 1
+            gcode_dispatch.run_script(line)
+    return file_position
+
+def run_batch(gcode_dispatch, data, batch_size):
+    # Batched dispatch - pre-parsed lines, one mutex acquisition per batch
+    mutex = gcode_dispatch.get_mutex()
+    file_position = 0
+    for lines in read_blocks(data):
+        sizes = [len(line.encode()) + 1 for line in lines]
+        parsed = list(zip(sizes, gcode_dispatch.parse_lines(lines)))
+        parsed.reverse()
+        while parsed:
+            with mutex:
+                for i in range(batch_size):
+                    line_size, parsed_command = parsed.pop()
+                    file_position += line_size
+                    gcode_dispatch.run_parsed_command(parsed_command)
+                    if not parsed:
+                        break
+    return file_position
+
+def run_cache(gcode_dispatch, data, batch_size):
+    # Batched dispatch from a pre-parsed cache file (cache built untimed)
+    tmpdir = tempfile.mkdtemp()
+    cache_fname = os.path.join(tmpdir, "bench.cache")
+    ident = ("benchgcode",)
+    writer = virtual_sdcard.GCodeCacheWriter(cache_fname, ident)
+    position = 0
+    for lines in read_blocks(data):
+        sizes = [len(line.encode()) + 1 for line in lines]
+        parsed = list(zip(sizes, gcode_dispatch.parse_lines(lines)))
+        writer.add_lines(position, parsed)
+        position += sum(sizes)
+    writer.finish(position)
+    start_time = time.time()
+    reader = virtual_sdcard.GCodeCacheReader(cache_fname, ident)
+    reader.seek(0)
+    mutex = gcode_dispatch.get_mutex()
+    file_position = 0
+    while 1:
+        parsed = reader.read_lines()
+        if parsed is None:
+            break
+        parsed.reverse()
+        while parsed:
+            with mutex:
+                for i in range(batch_size):
+                    line_size, parsed_command = parsed.pop()
+                    file_position += line_size
+                    gcode_dispatch.run_parsed_command(parsed_command)
+                    if not parsed:
+                        break
+    reader.close()
+    os.unlink(cache_fname)
+    os.rmdir(tmpdir)
+    return file_position, time.time() - start_time
+
+MODES = {'lines': run_lines, 'batch': run_batch, 'cache': run_cache}
+
+
+######################################################################
+# Startup
+######################################################################
+
+def main():
+    usage = "%prog [options] [gcode file]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-m", "--mode", type="choice", dest="mode",
+                    choices=sorted(MODES.keys()), default=None,
+                    help="only run the given dispatch mode")
+    opts.add_option("-b", "--batch", type="int", dest="batch", default=16,
+                    help="number of lines per batch (default 16)")
+    opts.add_option("-l", "--lines", type="int", dest="lines",
+                    default=200000, help="minimum number of input lines")
+    opts.add_option("-s", "--no-simple-moves", action="store_false",
+                    dest="simple_moves", default=True,
+                    help="disable the G0/G1 simple move fast path")
+    options, args = opts.parse_args()
+    if len(args) > 1:
+        opts.error("Incorrect number of arguments")
+    fname = DEFAULT_INPUT
+    if args:
+        fname = args[0]
+    logging.basicConfig(level=logging.WARNING)
+    # Build input by repeating the source file
+    with open(fname, 'r') as f:
+        src = f.read()
+    if not src.endswith('\n'):
+        src += '\n'
+    count = max(1, options.lines // max(1, src.count('\n')))
+    data = src * count
+    total_lines = data.count('\n')
+    modes = sorted(MODES.keys())
+    if options.mode is not None:
+        modes = [options.mode]
+    for mode in modes:
+        gcode_dispatch = setup_gcode(data, options.simple_moves)
+        start_time = time.time()
+        res = MODES[mode](gcode_dispatch, data, options.batch)
+        duration = time.time() - start_time
+        if type(res) == tuple:
+            # Mode reported its own timing
+            file_position, duration = res
+        else:
+            file_position = res
+        print("%-6s %d lines (%d bytes) in %.3fs: %.0f lines/s"
+              " (%.3fus/line)" % (
+                  mode, total_lines, file_position, duration,
+                  total_lines / duration, duration * 1000000. / total_lines))
+
+if __name__ == '__main__':
+    main()
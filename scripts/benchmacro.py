@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Benchmark g-code macro template rendering
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, time, copy, configparser, collections
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+from extras import gcode_macro
+
+Coord = collections.namedtuple('Coord', ('x', 'y', 'z', 'e'))
+
+# Typical print start and object change macros
+MACROS = {
+    'start': """
+{% set bed_temp = params.BED|default(60)|float %}
+{% set max_x = printer.configfile.settings.stepper_x.position_max %}
+{% set max_y = printer.configfile.settings.stepper_y.position_max %}
+{% if "xyz" not in printer.toolhead.homed_axes %}
+G28
+{% endif %}
+M190 S{bed_temp}
+{% if printer.bed_mesh.profile_name == "" %}
+BED_MESH_PROFILE LOAD=default
+{% endif %}
+G1 X{max_x / 2} Y{max_y / 2} Z{printer.toolhead.position.z + 5} F6000
+M109 S{printer.extruder.target}
+""",
+    'object': """
+{% set obj = printer.exclude_object.current_object %}
+{% if obj in printer.exclude_object.excluded_objects %}
+M117 Skipping {obj}
+{% endif %}
+G1 Z{printer.gcode_move.gcode_position.z} E{printer.extruder.temperature}
+""",
+}
+
+# Printer objects with realistic get_status() results
+class StaticObject:
+    def __init__(self, status):
+        self.status = status
+    def get_status(self, eventtime):
+        return self.status
+
+class MovingObject:
+    def __init__(self, build_status):
+        self.build_status = build_status
+    def get_status(self, eventtime):
+        return self.build_status(eventtime)
+
+def parse_value(val):
+    for conv in (int, float):
+        try:
+            return conv(val)
+        except ValueError:
+            pass
+    return val
+
+def load_settings(filename):
+    cfg = configparser.RawConfigParser(strict=False,
+                                       inline_comment_prefixes=(';', '#'))
+    cfg.read(filename)
+    settings = {}
+    raw = {}
+    for section in cfg.sections():
+        raw[section] = dict(cfg.items(section))
+        settings[section.lower()] = {
+            opt: parse_value(val) for opt, val in cfg.items(section)}
+    settings.setdefault('stepper_x', {})['position_max'] = 235.
+    settings.setdefault('stepper_y', {})['position_max'] = 235.
+    return {'config': raw, 'settings': settings, 'warnings': [],
+            'save_config_pending': False, 'save_config_pending_items': {}}
+
+def gen_mesh(probe_count, mesh_count):
+    probed = [[.01 * ((x * 7 + y * 3) % 11) for x in range(probe_count)]
+              for y in range(probe_count)]
+    mesh = [[.001 * ((x * 5 + y * 13) % 97) for x in range(mesh_count)]
+            for y in range(mesh_count)]
+    params = {'min_x': 10., 'max_x': 225., 'min_y': 10., 'max_y': 225.,
+              'x_count': probe_count, 'y_count': probe_count,
+              'mesh_x_pps': 2, 'mesh_y_pps': 2, 'algo': 'bicubic',
+              'tension': .2}
+    return {'profile_name': 'default', 'mesh_min': (10., 10.),
+            'mesh_max': (225., 225.), 'probed_matrix': probed,
+            'mesh_matrix': mesh,
+            'profiles': {'default': {'points': probed, 'mesh_params': params}}}
+
+def gen_objects(count, points):
+    objects = []
+    for i in range(count):
+        cx, cy = 20. + (i % 8) * 25., 20. + (i // 8) * 25.
+        polygon = [[cx + 10. * ((j % 4) in (1, 2)), cy + 10. * (j % 4 >= 2)]
+                   for j in range(points)]
+        objects.append({'name': 'PART_%d.STL_ID_%d' % (i, i),
+                        'center': [cx + 5., cy + 5.], 'polygon': polygon})
+    return {'objects': objects, 'excluded_objects': ['PART_3.STL_ID_3'],
+            'current_object': 'PART_1.STL_ID_1'}
+
+class FakeReactor:
+    def __init__(self):
+        self.curtime = 0.
+    def monotonic(self):
+        self.curtime += .001
+        return self.curtime
+
+class FakePrinter:
+    def __init__(self, objects):
+        self.objects = objects
+        self.reactor = FakeReactor()
+    def get_reactor(self):
+        return self.reactor
+    def get_start_args(self):
+        return {}
+    def register_event_handler(self, event, callback):
+        pass
+    def lookup_object(self, name, default=None):
+        return self.objects.get(name, default)
+    def lookup_objects(self, module=None):
+        return list(self.objects.items())
+
+def build_printer(options):
+    def toolhead_status(eventtime):
+        return {'homed_axes': 'xyz', 'print_time': eventtime,
+                'position': Coord(eventtime % 200., 100., .2, eventtime),
+                'max_velocity': 300., 'max_accel': 3000.}
+    def gcode_move_status(eventtime):
+        pos = Coord(eventtime % 200., 100., .2, eventtime)
+        return {'speed_factor': 1., 'extrude_factor': 1., 'absolute_e': False,
+                'position': pos, 'gcode_position': pos}
+    def extruder_status(eventtime):
+        return {'temperature': 210. + eventtime % 1., 'target': 210.,
+                'power': .5, 'pressure_advance': .04}
+    objs = {
+        'configfile': StaticObject(load_settings(options.config)),
+        'bed_mesh': StaticObject(gen_mesh(options.probe_count,
+                                          options.probe_count * 3 - 2)),
+        'exclude_object': StaticObject(gen_objects(options.objects, 20)),
+        'toolhead': MovingObject(toolhead_status),
+        'gcode_move': MovingObject(gcode_move_status),
+        'extruder': MovingObject(extruder_status),
+    }
+    return FakePrinter(objs)
+
+# Status access prior to shared snapshots (a deep copy on every render)
+class DeepCopySnapshots:
+    def get_status(self, name, po, eventtime):
+        return copy.deepcopy(po.get_status(eventtime))
+
+class FakeConfig:
+    def __init__(self, printer):
+        self.printer = printer
+    def get_printer(self):
+        return self.printer
+
+MODES = {'deepcopy': DeepCopySnapshots, 'snapshot': gcode_macro.StatusSnapshots}
+
+def measure(options, mode):
+    printer = build_printer(options)
+    gm = gcode_macro.PrinterGCodeMacro(FakeConfig(printer))
+    gm.status_snapshots = MODES[mode]()
+    templates = [gm.env.from_string(MACROS[n]) for n in sorted(MACROS)]
+    output = []
+    start_time = time.time()
+    for i in range(options.count):
+        for template in templates:
+            context = gm.create_template_context()
+            context['params'] = {}
+            output.append(template.render(context))
+    duration = time.time() - start_time
+    return duration, output
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-n", "--count", type="int", dest="count", default=1000,
+                    help="number of times to render each macro")
+    opts.add_option("-c", "--config", type="string", dest="config",
+                    default=os.path.join(os.path.dirname(__file__), '..',
+                                         'config', 'sample-mmu2s-diy.cfg'),
+                    help="config file used for configfile settings")
+    opts.add_option("-p", "--probe-count", type="int", dest="probe_count",
+                    default=7, help="bed mesh probe points per axis")
+    opts.add_option("-o", "--objects", type="int", dest="objects",
+                    default=40, help="number of exclude_object objects")
+    options, args = opts.parse_args()
+    if args:
+        opts.error("Incorrect number of arguments")
+    results = {}
+    renders = options.count * len(MACROS)
+    for mode in sorted(MODES.keys()):
+        duration, output = measure(options, mode)
+        results[mode] = output
+        print("%-8s %d renders in %.3fs: %.1fus per render" % (
+            mode, renders, duration, duration * 1000000. / renders))
+    if results['deepcopy'] != results['snapshot']:
+        print("WARNING: rendered output differs between modes")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# Benchmark toolhead Move allocation and lookahead queue overhead
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, time, math, gc, tracemalloc
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+import toolhead
+from check_lookahead import CheckToolhead
+
+PLANNERS = {'python': toolhead.LookAheadQueue, 'c': toolhead.CLookAheadQueue}
+
+def gen_positions(count):
+    # Small segments around a circle (similar to arcs or organic supports)
+    for i in range(count):
+        a = i * .01
+        yield [50. + 30. * math.cos(a), 50. + 30. * math.sin(a), .2, i * .001]
+
+def measure_memory(th, count):
+    # Report memory used by a full lookahead queue of moves
+    pos = [50., 50., .2, 0.]
+    moves = []
+    tracemalloc.start()
+    start_size = tracemalloc.get_traced_memory()[0]
+    for newpos in gen_positions(count):
+        move = toolhead.Move(th, pos, newpos, 300.)
+        pos = move.end_pos
+        moves.append(move)
+    end_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return float(end_size - start_size) / count
+
+def measure_speed(th, planner, count):
+    # Report moves/second and garbage collections/second
+    gc_counts = [0, 0, 0]
+    def gc_callback(phase, info):
+        if phase == 'start':
+            gc_counts[info['generation']] += 1
+    lookahead = PLANNERS[planner]()
+    lookahead.set_flush_time(toolhead.BUFFER_TIME_HIGH)
+    positions = list(gen_positions(count))
+    pos = [50., 50., .2, 0.]
+    gc.callbacks.append(gc_callback)
+    start_time = time.time()
+    for newpos in positions:
+        move = toolhead.Move(th, pos, newpos, 300.)
+        pos = move.end_pos
+        if lookahead.add_move(move):
+            lookahead.flush(lazy=True)
+    lookahead.flush()
+    duration = time.time() - start_time
+    gc.callbacks.remove(gc_callback)
+    return duration, gc_counts
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-c", "--count", type="int", dest="count",
+                    default=200000, help="number of moves")
+    opts.add_option("-p", "--planner", type="choice", dest="planner",
+                    choices=sorted(PLANNERS.keys()), default="python",
+                    help="lookahead planner to use")
+    options, args = opts.parse_args()
+    if args:
+        opts.error("Incorrect number of arguments")
+    th = CheckToolhead(300., 3000., 5., .5)
+    mem = measure_memory(th, 10000)
+    print("Memory: %.0f bytes per queued move" % (mem,))
+    duration, gc_counts = measure_speed(th, options.planner, options.count)
+    print("Speed: %d moves in %.3fs: %.0f moves/s (%.3fus/move)" % (
+        options.count, duration, options.count / duration,
+        duration * 1000000. / options.count))
+    print("GC: %.1f gen0, %.1f gen1, %.1f gen2 collections per 1000 moves" % (
+        tuple([c * 1000. / options.count for c in gc_counts])))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# Benchmark reactor timer dispatch overhead
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+import reactor
+
+def measure(num_timers, count):
+    # Report the time to dispatch a timer while other timers are idle
+    r = reactor.Reactor()
+    def idle_timer(eventtime):
+        # Similar to a periodic heater or sensor timer
+        return eventtime + 1.
+    curtime = r.monotonic()
+    for i in range(num_timers):
+        r.register_timer(idle_timer, curtime + 1. + i * .001)
+    state = {'count': 0}
+    def busy_timer(eventtime):
+        state['count'] += 1
+        if state['count'] >= count:
+            r.end()
+            return r.NEVER
+        return r.NOW
+    r.register_timer(busy_timer, r.NOW)
+    start_time = time.time()
+    r.run()
+    duration = time.time() - start_time
+    r.finalize()
+    return duration
+
+def measure_starvation(count):
+    # Report how often a periodic timer runs while another timer is
+    # continually rescheduled to run immediately
+    r = reactor.Reactor()
+    state = {'busy': 0, 'periodic': 0}
+    def periodic_timer(eventtime):
+        state['periodic'] += 1
+        return eventtime + .001
+    def busy_timer(eventtime):
+        state['busy'] += 1
+        if state['busy'] >= count:
+            r.end()
+            return r.NEVER
+        return r.NOW
+    r.register_timer(periodic_timer, r.NOW)
+    r.register_timer(busy_timer, r.NOW)
+    start_time = time.time()
+    r.run()
+    duration = time.time() - start_time
+    r.finalize()
+    return duration, state['periodic']
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-c", "--count", type="int", dest="count",
+                    default=100000, help="number of timer dispatches")
+    opts.add_option("-t", "--timers", type="string", dest="timers",
+                    default="0,10,30,60,100,200",
+                    help="comma separated list of idle timer counts")
+    options, args = opts.parse_args()
+    if args:
+        opts.error("Incorrect number of arguments")
+    for num_timers in [int(t) for t in options.timers.split(',')]:
+        duration = measure(num_timers, options.count)
+        print("%4d idle timers: %.3fus per timer dispatch" % (
+            num_timers, duration * 1000000. / options.count))
+    duration, runs = measure_starvation(options.count)
+    print("periodic 1ms timer ran %d times in %.3fs (expected ~%d)" % (
+        runs, duration, int(duration * 1000.)))
+
+if __name__ == '__main__':
+    main()
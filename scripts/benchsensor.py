@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# Benchmark host processing of bulk sensor data messages
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, time, socket, threading, random, json
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+import chelper, msgproto
+from extras import bulk_sensor
+
+DATA_FORMAT = "sensor_bulk_data oid=%c sequence=%hu data=%*s"
+DATA_TAG = 85
+OID = 3
+
+class FakeMCU:
+    # Minimal mcu interface needed by CBulkDataQueue
+    def __init__(self, sq):
+        self.sq = sq
+        self._serial = self
+    def get_serialqueue(self):
+        return self.sq
+    def lookup_command(self, msgformat):
+        return self
+    def get_command_tag(self):
+        return DATA_TAG
+    def register_response(self, cb, msg, oid=None):
+        pass
+
+def gen_blocks(msgparser, count, size):
+    rnd = random.Random(0)
+    cmd = msgparser.lookup_command(DATA_FORMAT)
+    blocks = []
+    for seq in range(count):
+        data = bytes([rnd.randrange(256) for i in range(size)])
+        msg = cmd.encode([OID, seq & 0xffff, data])
+        out = [msgproto.MESSAGE_MIN + len(msg), msgproto.MESSAGE_DEST] + msg
+        out += msgproto.crc16_ccitt(out) + [msgproto.MESSAGE_SYNC]
+        blocks.append(bytes(out))
+    return b"".join(blocks)
+
+def run_python(ffi_main, ffi_lib, sq, msgparser, count):
+    # Messages parsed in Python (similar to serialhdl.SerialReader)
+    bulk_queue = bulk_sensor.BulkDataQueue.__new__(bulk_sensor.BulkDataQueue)
+    bulk_queue.lock = threading.Lock()
+    bulk_queue.raw_samples = []
+    lock = threading.Lock()
+    handlers = {('sensor_bulk_data', OID): bulk_queue._handle_data}
+    response = ffi_main.new('struct pull_queue_message *')
+    for i in range(count):
+        ffi_lib.serialqueue_pull(sq, response)
+        params = msgparser.parse(response.msg[0:response.len])
+        params['#sent_time'] = response.sent_time
+        params['#receive_time'] = response.receive_time
+        hdl = (params['#name'], params.get('oid'))
+        with lock:
+            handlers[hdl](params)
+    return len(bulk_queue.pull_queue())
+
+def run_c(ffi_main, ffi_lib, sq, msgparser, count):
+    # Messages stored by the C bulkqueue
+    bulk_queue = bulk_sensor.CBulkDataQueue(FakeMCU(sq), OID)
+    bulk_queue.start()
+    received = 0
+    while received < count:
+        time.sleep(.010)
+        sequences, lengths, data = bulk_queue.pull_queue()
+        received += len(sequences)
+    bulk_queue.stop()
+    return received
+
+MODES = {'python': run_python, 'c': run_c}
+
+def measure(mode, msgparser, data, count):
+    ffi_main, ffi_lib = chelper.get_ffi()
+    rsock, wsock = socket.socketpair()
+    sq = ffi_lib.serialqueue_alloc(rsock.fileno(), b'u', 0, b"bench")
+    writer = threading.Thread(target=wsock.sendall, args=(data,))
+    start_time = time.process_time()
+    writer.start()
+    received = MODES[mode](ffi_main, ffi_lib, sq, msgparser, count)
+    writer.join()
+    duration = time.process_time() - start_time
+    ffi_lib.serialqueue_exit(sq)
+    ffi_lib.serialqueue_free(sq)
+    rsock.close()
+    wsock.close()
+    return received, duration
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-n", "--messages", type="int", dest="count",
+                    default=20000, help="number of messages")
+    opts.add_option("-s", "--size", type="int", dest="size", default=50,
+                    help="data bytes per message")
+    options, args = opts.parse_args()
+    if args:
+        opts.error("Incorrect number of arguments")
+    msgparser = msgproto.MessageParser()
+    identify = {'commands': {}, 'responses': {DATA_FORMAT: DATA_TAG}}
+    msgparser.process_identify(json.dumps(identify).encode(),
+                               decompress=False)
+    data = gen_blocks(msgparser, options.count, options.size)
+    for mode in sorted(MODES.keys()):
+        received, duration = measure(mode, msgparser, data, options.count)
+        print("%-6s %d messages: %.3fs cpu time (%.2fus per message)" % (
+            mode, received, duration, duration * 1000000. / options.count))
+
+if __name__ == '__main__':
+    main()
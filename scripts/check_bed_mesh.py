@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Verify the numpy bed mesh interpolation matches the Python version
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, random
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+from extras import bed_mesh
+
+def gen_params(rnd, algo):
+    # Generate random mesh parameters valid for the given algorithm
+    max_count = 6 if algo == 'lagrange' else 20
+    min_x = rnd.uniform(-10., 50.)
+    min_y = rnd.uniform(-10., 50.)
+    return {
+        'min_x': min_x, 'max_x': min_x + rnd.uniform(50., 400.),
+        'min_y': min_y, 'max_y': min_y + rnd.uniform(50., 400.),
+        'x_count': rnd.randint(4, max_count),
+        'y_count': rnd.randint(4, max_count),
+        'mesh_x_pps': rnd.randint(0, 6), 'mesh_y_pps': rnd.randint(0, 6),
+        'algo': algo, 'tension': rnd.uniform(0., 2.)}
+
+def build_mesh(params, z_matrix, use_numpy):
+    zmesh = bed_mesh.ZMesh(params, "check")
+    if not use_numpy:
+        zmesh.numpy = None
+    zmesh.build_mesh(z_matrix)
+    return zmesh.mesh_matrix
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-t", "--tests", type="int", dest="tests",
+                    default=200, help="number of tests to run")
+    opts.add_option("-s", "--seed", type="int", dest="seed", default=0,
+                    help="random seed")
+    options, args = opts.parse_args()
+    if args:
+        opts.error("Incorrect number of arguments")
+    if bed_mesh.load_numpy() is None:
+        sys.stderr.write("numpy module not available\n")
+        sys.exit(-1)
+    for test in range(options.tests):
+        seed = options.seed + test
+        rnd = random.Random(seed)
+        for algo in ['lagrange', 'bicubic']:
+            params = gen_params(rnd, algo)
+            z_matrix = [[rnd.uniform(-.5, .5)
+                         for i in range(params['x_count'])]
+                        for j in range(params['y_count'])]
+            res_py = build_mesh(params, z_matrix, False)
+            res_np = build_mesh(params, z_matrix, True)
+            if res_py != res_np:
+                sys.stderr.write("Mesh mismatch on test seed %d (%s)\n"
+                                 % (seed, algo))
+                sys.exit(-1)
+    print("%d tests: numpy and Python mesh interpolation identical" % (
+        options.tests,))
+
+if __name__ == '__main__':
+    main()
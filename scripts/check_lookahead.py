@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# Verify the C lookahead planner matches the Python lookahead planner
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, random, math
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+import toolhead, kinematics.extruder
+
+# Minimal toolhead object for use with toolhead.Move
+class CheckToolhead:
+    def __init__(self, max_velocity, max_accel, square_corner_velocity,
+                 min_cruise_ratio):
+        self.printer = None
+        self.max_velocity = max_velocity
+        self.max_accel = max_accel
+        scv2 = square_corner_velocity**2
+        self.junction_deviation = scv2 * (math.sqrt(2.) - 1.) / max_accel
+        self.max_accel_to_decel = max_accel * (1. - min_cruise_ratio)
+        self.extra_axes = [kinematics.extruder.DummyExtruder(None)]
+
+def gen_moves(rnd, count):
+    # Generate a list of (newpos, speed, limit_speed) move requests
+    pos = [100., 100., 1., 0.]
+    out = []
+    for i in range(count):
+        r = rnd.random()
+        newpos = list(pos)
+        if r < .05:
+            # Extrude only move
+            newpos[3] += rnd.uniform(-1., 1.)
+        elif r < .10:
+            # Z move
+            newpos[2] += rnd.uniform(-.5, .5)
+        else:
+            # XY move (often tiny segments with small direction changes)
+            dist = rnd.choice([.01, .05, .1, .5, 2., 20.]) * rnd.random()
+            angle = rnd.uniform(-math.pi, math.pi)
+            newpos[0] += dist * math.cos(angle)
+            newpos[1] += dist * math.sin(angle)
+            newpos[3] += dist * .05 * rnd.random()
+        speed = rnd.choice([5., 50., 150., 300., 600.])
+        limit_speed = None
+        if r >= .05 and r < .10:
+            limit_speed = (rnd.uniform(1., 10.), rnd.uniform(50., 200.))
+        out.append((newpos, speed, limit_speed))
+        pos = newpos
+    return out
+
+def get_junctions(move):
+    return tuple([v.hex() for v in (
+        move.start_v, move.cruise_v, move.end_v,
+        move.accel_t, move.cruise_t, move.decel_t)])
+
+def run_planner(queue_class, th, move_reqs, rnd):
+    # Run the moves through the given lookahead queue implementation
+    lookahead = queue_class()
+    lookahead.set_flush_time(toolhead.BUFFER_TIME_HIGH)
+    results = []
+    pos = [100., 100., 1., 0.]
+    for newpos, speed, limit_speed in move_reqs:
+        move = toolhead.Move(th, pos, newpos, speed)
+        pos = move.end_pos
+        if not move.move_d:
+            continue
+        if limit_speed is not None:
+            move.limit_speed(*limit_speed)
+        want_flush = lookahead.add_move(move)
+        if want_flush:
+            moves = lookahead.flush(lazy=True)
+            results.append([get_junctions(m) for m in moves])
+        if rnd.random() < .001:
+            # Simulate a full flush (eg, from M400)
+            moves = lookahead.flush()
+            results.append([get_junctions(m) for m in moves])
+            lookahead.set_flush_time(toolhead.BUFFER_TIME_HIGH)
+    moves = lookahead.flush()
+    results.append([get_junctions(m) for m in moves])
+    return results
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-c", "--count", type="int", dest="count",
+                    default=20000, help="number of moves per test")
+    opts.add_option("-t", "--tests", type="int", dest="tests",
+                    default=20, help="number of tests to run")
+    opts.add_option("-s", "--seed", type="int", dest="seed", default=0,
+                    help="random seed")
+    options, args = opts.parse_args()
+    if args:
+        opts.error("Incorrect number of arguments")
+    for test in range(options.tests):
+        seed = options.seed + test
+        rnd = random.Random(seed)
+        th = CheckToolhead(rnd.choice([100., 300., 500.]),
+                           rnd.choice([500., 3000., 20000.]),
+                           rnd.choice([0., 1., 5., 20.]),
+                           rnd.choice([0., .5, .9]))
+        move_reqs = gen_moves(rnd, options.count)
+        res_py = run_planner(toolhead.LookAheadQueue, th, move_reqs,
+                             random.Random(seed))
+        res_c = run_planner(toolhead.CLookAheadQueue, th, move_reqs,
+                            random.Random(seed))
+        if res_py != res_c:
+            sys.stderr.write("Lookahead mismatch on test seed %d\n" % (seed,))
+            sys.exit(-1)
+        flushed = sum([len(r) for r in res_py])
+        print("Seed %d: %d flushes, %d moves identical" % (
+            seed, len(res_py), flushed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Verify streamed resonance measurements match post-hoc processing
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, importlib, tempfile
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+shaper_calibrate = importlib.import_module('.shaper_calibrate', 'extras')
+adxl345 = importlib.import_module('.adxl345', 'extras')
+
+# Synthetic recordings of (data rate, duration) - includes short and
+# low rate captures
+SYNTHETIC_RECORDINGS = [(3200, 5.), (4000, 1.5), (1344, 2.), (400, 3.)]
+
+def gen_recording(filename, rate, duration, seed):
+    # Write a raw accelerometer CSV file (in the format produced by
+    # AccelQueryHelper.write_to_file) with resonances on each axis
+    rnd = np.random.RandomState(seed)
+    # The actual sample rate of a chip differs slightly from its
+    # configured rate
+    actual_rate = rate * rnd.uniform(.99, 1.01)
+    count = int(duration * actual_rate)
+    t = 10. + np.arange(count) / actual_rate
+    t += rnd.uniform(-.1, .1, count) / actual_rate
+    freq_sweep = 5. + 100. * (t - t[0]) / duration
+    data = [t]
+    for res_freq, amp in [(42., 1500.), (57., 1200.), (35., 300.)]:
+        # Response of a resonance to a sweep of vibration frequencies
+        gain = 1. / np.sqrt((1. - (freq_sweep / res_freq)**2)**2
+                            + (.2 * freq_sweep / res_freq)**2)
+        phase = 2. * np.pi * np.cumsum(freq_sweep) / actual_rate
+        data.append(amp * gain * np.sin(phase) + rnd.normal(0., 100., count))
+    with open(filename, "w") as f:
+        f.write("#time,accel_x,accel_y,accel_z\n")
+        for row in zip(*data):
+            f.write("%.6f,%.6f,%.6f,%.6f\n" % row)
+
+def stream_data(helper, data, rate):
+    # Pass samples to a WelchAccumulator in batches (as BatchBulkHelper
+    # would during a measurement)
+    accumulator = shaper_calibrate.WelchAccumulator(helper, rate)
+    batch_size = max(1, int(rate * adxl345.BATCH_UPDATES))
+    samples = [tuple(s) for s in data.tolist()]
+    for i in range(0, len(samples), batch_size):
+        accumulator.add_samples(samples[i:i+batch_size])
+    return helper.process_accelerometer_data(accumulator)
+
+def find_shapers(helper, calibration_data):
+    calibration_data.normalize_to_frequencies()
+    best, all_shapers = helper.find_best_shaper(calibration_data, scv=5.)
+    return best.name, [(s.name, s.freq) for s in all_shapers]
+
+def check_file(helper, filename, rate):
+    data = np.loadtxt(filename, comments='#', delimiter=',')
+    if rate is None:
+        # Use the measured sample rate of the recording
+        rate = (data.shape[0] - 1) / (data[-1,0] - data[0,0])
+    post = helper.process_accelerometer_data(data)
+    stream = stream_data(helper, data, rate)
+    errors = []
+    if not np.array_equal(post.freq_bins, stream.freq_bins):
+        errors.append("frequency bins differ")
+    else:
+        for name in ['psd_x', 'psd_y', 'psd_z', 'psd_sum']:
+            p, s = getattr(post, name), getattr(stream, name)
+            if not np.allclose(p, s, rtol=1e-9, atol=1e-12 * p.max()):
+                errors.append("%s differs (max relative error %g)" % (
+                    name, np.max(np.abs(p - s) / (np.abs(p) + 1e-300))))
+        post_shapers = find_shapers(helper, post)
+        stream_shapers = find_shapers(helper, stream)
+        if post_shapers != stream_shapers:
+            errors.append("fitted shapers differ: %s vs %s" % (
+                post_shapers, stream_shapers))
+    if errors:
+        print("%s (rate %.0f): FAILED\n  %s" % (
+            filename, rate, "\n  ".join(errors)))
+        return False
+    print("%s (rate %.0f): %d samples ok" % (filename, rate, data.shape[0]))
+    return True
+
+def main():
+    usage = "%prog [options] [<raw_data.csv> ...]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-r", "--rate", type="float", dest="rate", default=None,
+                    help="configured accelerometer data rate of the"
+                    " recordings (default is the measured rate)")
+    options, args = opts.parse_args()
+    helper = shaper_calibrate.ShaperCalibrate(printer=None)
+    results = []
+    if args:
+        for filename in args:
+            results.append(check_file(helper, filename, options.rate))
+    else:
+        tempdir = tempfile.mkdtemp()
+        for i, (rate, duration) in enumerate(SYNTHETIC_RECORDINGS):
+            filename = os.path.join(tempdir, "raw_data_%d.csv" % (rate,))
+            gen_recording(filename, rate, duration, i)
+            results.append(check_file(helper, filename, rate))
+            os.remove(filename)
+        os.rmdir(tempdir)
+    if not all(results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -74,6 +74,10 @@ start_test klippy "Test klippy import (Python2)"
 $PYTHON2 klippy/klippy.py --import-test
 finish_test klippy "Test klippy import (Python2)"
 
+start_test klippy "Test lookahead planner"
+$PYTHON scripts/check_lookahead.py
+finish_test klippy "Test lookahead planner"
+
 start_test klippy "Test invoke klippy (Python3)"
 $PYTHON scripts/test_klippy.py -d ${DICTDIR} test/klippy/*.test
 finish_test klippy "Test invoke klippy (Python3)"
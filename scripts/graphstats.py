@@ -4,8 +4,9 @@
 # Copyright (C) 2016-2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import optparse, datetime
+import optparse, datetime, functools, math
 import matplotlib
+import logindex
 
 MAXBANDWIDTH=25000.
 MAXBUFFER=2.
@@ -18,37 +19,35 @@ APPLY_PREFIX = [
     'target', 'temp', 'pwm'
 ]
 
-def parse_log(logname, mcu):
+def parse_line(mcu_prefix, apply_prefix, line):
+    parts = line.split()
+    prefix = ""
+    keyparts = {}
+    for p in parts[2:]:
+        name, sep, val = p.partition('=')
+        if not sep:
+            prefix = p
+            if prefix == mcu_prefix:
+                prefix = ''
+            continue
+        if name in apply_prefix:
+            name = prefix + name
+        keyparts[name] = val
+    if 'print_time' not in keyparts:
+        return None
+    keyparts['#sampletime'] = parts[1][:-1]
+    return keyparts
+
+def parse_log(logname, mcu, processes=None):
     if mcu is None:
         mcu = "mcu"
     mcu_prefix = mcu + ":"
     apply_prefix = { p: 1 for p in APPLY_PREFIX }
-    f = open(logname, 'r')
-    out = []
-    for line in f:
-        parts = line.split()
-        if not parts or parts[0] not in ('Stats', 'INFO:root:Stats'):
-            #if parts and parts[0] == 'INFO:root:shutdown:':
-            #    break
-            continue
-        prefix = ""
-        keyparts = {}
-        for p in parts[2:]:
-            if '=' not in p:
-                prefix = p
-                if prefix == mcu_prefix:
-                    prefix = ''
-                continue
-            name, val = p.split('=', 1)
-            if name in apply_prefix:
-                name = prefix + name
-            keyparts[name] = val
-        if 'print_time' not in keyparts:
-            continue
-        keyparts['#sampletime'] = float(parts[1][:-1])
-        out.append(keyparts)
-    f.close()
-    return out
+    # Stats lines are located using the log index and then parsed
+    # into columns in parallel
+    index = logindex.load_index(logname)
+    parse_func = functools.partial(parse_line, mcu_prefix, apply_prefix)
+    return logindex.parse_stats(index, parse_func, processes)
 
 def setup_matplotlib(output_to_file):
     global matplotlib
@@ -61,10 +60,10 @@ def find_print_restarts(data):
     runoff_samples = {}
     last_runoff_start = last_buffer_time = last_sampletime = 0.
     last_print_stall = 0
-    for d in reversed(data):
+    rows = list(zip(data.get('#sampletime'), data.get('buffer_time', 0.),
+                    data.get('print_stall')))
+    for sampletime, buffer_time, print_stall in reversed(rows):
         # Check for buffer runoff
-        sampletime = d['#sampletime']
-        buffer_time = float(d.get('buffer_time', 0.))
         if (last_runoff_start and last_sampletime - sampletime < 5
             and buffer_time > last_buffer_time):
             runoff_samples[last_runoff_start][1].append(sampletime)
@@ -76,7 +75,6 @@ def find_print_restarts(data):
         last_buffer_time = buffer_time
         last_sampletime = sampletime
         # Check for print stall
-        print_stall = int(d['print_stall'])
         if print_stall < last_print_stall:
             if last_runoff_start:
                 runoff_samples[last_runoff_start][0] = True
@@ -87,28 +85,31 @@ def find_print_restarts(data):
 
 def plot_mcu(data, maxbw):
     # Generate data for plot
-    basetime = lasttime = data[0]['#sampletime']
-    lastbw = float(data[0]['bytes_write']) + float(data[0]['bytes_retransmit'])
+    sampletimes = data.get('#sampletime')
+    bytes_write = data.get('bytes_write')
+    bytes_retransmit = data.get('bytes_retransmit')
+    basetime = lasttime = sampletimes[0]
+    lastbw = bytes_write[0] + bytes_retransmit[0]
     sample_resets = find_print_restarts(data)
     times = []
     bwdeltas = []
     loads = []
     awake = []
     hostbuffers = []
-    for d in data:
-        st = d['#sampletime']
+    for st, bw_w, bw_r, task_avg, task_stddev, hb, mcu_awake in zip(
+            sampletimes, bytes_write, bytes_retransmit,
+            data.get('mcu_task_avg'), data.get('mcu_task_stddev'),
+            data.get('buffer_time'), data.get('mcu_awake', 0.)):
         timedelta = st - lasttime
         if timedelta <= 0.:
             continue
-        bw = float(d['bytes_write']) + float(d['bytes_retransmit'])
+        bw = bw_w + bw_r
         if bw < lastbw:
             lastbw = bw
             continue
-        load = float(d['mcu_task_avg']) + 3*float(d['mcu_task_stddev'])
+        load = task_avg + 3*task_stddev
         if st - basetime < 15.:
             load = 0.
-        pt = float(d['print_time'])
-        hb = float(d['buffer_time'])
         if hb >= MAXBUFFER or st in sample_resets:
             hb = 0.
         else:
@@ -117,7 +118,7 @@ def plot_mcu(data, maxbw):
         times.append(datetime.datetime.utcfromtimestamp(st))
         bwdeltas.append(100. * (bw - lastbw) / (maxbw * timedelta))
         loads.append(100. * load / TASK_MAX)
-        awake.append(100. * float(d.get('mcu_awake', 0.)) / STATS_INTERVAL)
+        awake.append(100. * mcu_awake / STATS_INTERVAL)
         lasttime = st
         lastbw = bw
 
@@ -139,25 +140,27 @@ def plot_mcu(data, maxbw):
 
 def plot_system(data):
     # Generate data for plot
-    lasttime = data[0]['#sampletime']
-    lastcputime = float(data[0]['cputime'])
+    sampletimes = data.get('#sampletime')
+    cputimes_raw = data.get('cputime')
+    lasttime = sampletimes[0]
+    lastcputime = cputimes_raw[0]
     times = []
     sysloads = []
     cputimes = []
     memavails = []
-    for d in data:
-        st = d['#sampletime']
+    for st, cputime, sysload, memavail in zip(
+            sampletimes, cputimes_raw, data.get('sysload'),
+            data.get('memavail')):
         timedelta = st - lasttime
         if timedelta <= 0.:
             continue
         lasttime = st
         times.append(datetime.datetime.utcfromtimestamp(st))
-        cputime = float(d['cputime'])
         cpudelta = max(0., min(1.5, (cputime - lastcputime) / timedelta))
         lastcputime = cputime
         cputimes.append(cpudelta * 100.)
-        sysloads.append(float(d['sysload']) * 100.)
-        memavails.append(float(d['memavail']))
+        sysloads.append(sysload * 100.)
+        memavails.append(memavail)
 
     # Build plot
     fig, ax1 = matplotlib.pyplot.subplots()
@@ -181,20 +184,24 @@ def plot_system(data):
     ax1.grid(True)
     return fig
 
+def get_frequency_values(data, keys):
+    # Return {key: (times, values)} of the valid mcu frequency samples
+    times = [datetime.datetime.utcfromtimestamp(st)
+             for st in data.get('#sampletime')]
+    graph_keys = {}
+    for key in keys:
+        graph_keys[key] = key_times, key_values = [], []
+        for st, val in zip(times, data.get(key)):
+            if not math.isnan(val) and val not in (0., 1.):
+                key_times.append(st)
+                key_values.append(val)
+    return graph_keys
+
 def plot_mcu_frequencies(data):
-    all_keys = {}
-    for d in data:
-        all_keys.update(d)
-    graph_keys = { key: ([], []) for key in all_keys
-                   if (key in ("freq", "adj")
-                       or (key.endswith(":freq") or key.endswith(":adj"))) }
-    for d in data:
-        st = datetime.datetime.utcfromtimestamp(d['#sampletime'])
-        for key, (times, values) in graph_keys.items():
-            val = d.get(key)
-            if val not in (None, '0', '1'):
-                times.append(st)
-                values.append(float(val))
+    graph_keys = get_frequency_values(data, [
+        key for key in data.get_keys()
+        if (key in ("freq", "adj")
+            or (key.endswith(":freq") or key.endswith(":adj")))])
     est_mhz = { key: round((sum(values)/len(values)) / 1000000.)
                 for key, (times, values) in graph_keys.items() }
 
@@ -218,18 +225,8 @@ def plot_mcu_frequencies(data):
     return fig
 
 def plot_mcu_frequency(data, mcu):
-    all_keys = {}
-    for d in data:
-        all_keys.update(d)
-    graph_keys = { key: ([], []) for key in all_keys
-                   if key in ("freq", "adj") }
-    for d in data:
-        st = datetime.datetime.utcfromtimestamp(d['#sampletime'])
-        for key, (times, values) in graph_keys.items():
-            val = d.get(key)
-            if val not in (None, '0', '1'):
-                times.append(st)
-                values.append(float(val))
+    graph_keys = get_frequency_values(data, [
+        key for key in data.get_keys() if key in ("freq", "adj")])
 
     # Build plot
     fig, ax1 = matplotlib.pyplot.subplots()
@@ -259,14 +256,15 @@ def plot_temperature(data, heaters):
         temps = []
         targets = []
         pwm = []
-        for d in data:
-            temp = d.get(temp_key)
-            if temp is None:
+        for st, temp, pwm_val, target in zip(
+                data.get('#sampletime'), data.get(temp_key),
+                data.get(pwm_key, 0.), data.get(target_key, 0.)):
+            if math.isnan(temp):
                 continue
-            times.append(datetime.datetime.utcfromtimestamp(d['#sampletime']))
-            temps.append(float(temp))
-            pwm.append(float(d.get(pwm_key, 0.)))
-            targets.append(float(d.get(target_key, 0.)))
+            times.append(datetime.datetime.utcfromtimestamp(st))
+            temps.append(temp)
+            pwm.append(pwm_val)
+            targets.append(target)
         ax1.plot_date(times, temps, '-', label='%s temp' % (heater,), alpha=0.8)
         if any(targets):
             label = '%s target' % (heater,)
@@ -302,13 +300,15 @@ def main():
                     default=None, help="graph heater temperature")
     opts.add_option("-m", "--mcu", type="string", dest="mcu", default=None,
                     help="limit stats to the given mcu")
+    opts.add_option("-j", "--jobs", type="int", dest="jobs", default=None,
+                    help="number of processes used to parse the log")
     options, args = opts.parse_args()
     if len(args) != 1:
         opts.error("Incorrect number of arguments")
     logname = args[0]
 
     # Parse data
-    data = parse_log(logname, options.mcu)
+    data = parse_log(logname, options.mcu, options.jobs)
     if not data:
         return
 
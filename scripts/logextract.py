@@ -5,6 +5,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import sys, re, collections, ast, itertools
+import logindex
 
 def format_comment(line_num, line):
     return "# %6d: %s" % (line_num, line)
@@ -576,17 +577,40 @@ class GatherShutdown:
 # Startup
 ######################################################################
 
+# Lines that may start a config or shutdown extraction
+INDEX_EVENTS = ('config', 'git', 'start', 'shutdown', 'dump')
+RECENT_LINES = 200
+
 def main():
     logname = sys.argv[1]
     last_git = last_start = None
     configs = {}
     handler = None
-    recent_lines = collections.deque([], 200)
+    recent_lines = collections.deque([], RECENT_LINES)
+    # Only the lines near interesting events need to be parsed
+    index = logindex.load_index(logname)
+    events = index.get_events(INDEX_EVENTS)
+    event_pos = 0
     # Parse log file
-    with open(logname, 'rt') as f:
-        for line_num, line in enumerate(f):
+    with open(logname, 'rb') as f:
+        reader = logindex.LineReader(f)
+        while 1:
+            if handler is None:
+                # Skip to the recent lines before the next event
+                while (event_pos < len(events)
+                       and events[event_pos][2] <= reader.line_num):
+                    event_pos += 1
+                if event_pos >= len(events):
+                    break
+                kind, offset, event_line_num = events[event_pos]
+                if event_line_num - reader.line_num > RECENT_LINES + 1:
+                    reader.seek(offset, event_line_num, RECENT_LINES)
+                    recent_lines.clear()
+            res = reader.readline()
+            if res is None:
+                break
+            line_num, line = res
             line = line.rstrip()
-            line_num += 1
             recent_lines.append((line_num, line))
             if handler is not None:
                 ret = handler.add_line(line_num, line)
@@ -0,0 +1,279 @@
+# Index klippy.log files for the log analysis scripts
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import os, re, json, zlib, array, functools, itertools, multiprocessing
+
+INDEX_VERSION = 1
+READ_SIZE = 4 * 1024 * 1024
+FINGERPRINT_SIZE = 4096
+NAN = float('nan')
+
+
+######################################################################
+# Log index
+######################################################################
+
+# Lines of interest (all matched after a newline - searching for a
+# literal prefix is much faster than using a multi-line "^" match)
+event_r = re.compile(
+    br"\n(?:(?P<stats>(?:INFO:root:)?Stats [0-9]+[.][0-9]+:)"
+    br"|(?P<config>===== Config file =====)"
+    br"|(?P<git>Git version)"
+    br"|(?P<start>Start printer at)"
+    br"|(?P<rollover>=============== Log rollover at)"
+    br"|(?P<dump>Dumping ))")
+shutdown_s = b"shutdown: "
+
+# Byte offsets (and line numbers) of the interesting lines in a log.
+# The index is stored in "<logname>.index" so that later runs only
+# need to scan newly appended lines.
+class LogIndex:
+    def __init__(self, logname):
+        self.logname = logname
+        self.index_filename = logname + ".index"
+        self.size = self.line_count = 0
+        self.fingerprint = None
+        self.events = []
+        self.stats = array.array('q')
+    def _calc_fingerprint(self, f, size):
+        # Checksum the start and end of the indexed data (used to
+        # detect if the log file was replaced)
+        f.seek(0)
+        head = f.read(min(size, FINGERPRINT_SIZE))
+        f.seek(max(0, size - FINGERPRINT_SIZE))
+        tail = f.read(min(size, FINGERPRINT_SIZE))
+        return [zlib.crc32(head) & 0xffffffff, zlib.crc32(tail) & 0xffffffff]
+    def load(self):
+        try:
+            with open(self.index_filename, 'r') as f:
+                data = json.load(f)
+            if data['version'] != INDEX_VERSION:
+                return
+            with open(self.logname, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() < data['size']:
+                    return
+                fingerprint = self._calc_fingerprint(f, data['size'])
+            if fingerprint != data['fingerprint']:
+                return
+        except (IOError, OSError, ValueError, KeyError):
+            return
+        self.size = data['size']
+        self.line_count = data['line_count']
+        self.fingerprint = fingerprint
+        self.events = [tuple(e) for e in data['events']]
+        self.stats = array.array('q', data['stats'])
+    def save(self):
+        data = {'version': INDEX_VERSION, 'size': self.size,
+                'line_count': self.line_count,
+                'fingerprint': self.fingerprint, 'events': self.events,
+                'stats': self.stats.tolist()}
+        try:
+            with open(self.index_filename, 'w') as f:
+                f.write(json.dumps(data, separators=(',', ':')))
+        except (IOError, OSError):
+            # Unable to cache the index - not a fatal error
+            pass
+    def _scan_block(self, data, offset, line_num):
+        # Locate the interesting lines in a block of complete lines
+        found = [(m.start(), m.lastgroup)
+                 for m in event_r.finditer(b"\n" + data)]
+        pos = data.find(shutdown_s)
+        while pos >= 0:
+            line_start = data.rfind(b'\n', 0, pos) + 1
+            found.append((line_start, 'shutdown'))
+            line_end = data.find(b'\n', pos)
+            pos = data.find(shutdown_s, line_end)
+        found.sort()
+        last_pos = 0
+        for pos, kind in found:
+            if kind == 'stats':
+                self.stats.append(offset + pos)
+                continue
+            line_num += data.count(b'\n', last_pos, pos)
+            last_pos = pos
+            self.events.append((kind, offset + pos, line_num))
+    def update(self):
+        # Scan any lines added to the log since the index was built.
+        # Returns True if the index was updated.
+        with open(self.logname, 'rb') as f:
+            f.seek(self.size)
+            offset = self.size
+            line_num = self.line_count + 1
+            pending = b""
+            while 1:
+                data = f.read(READ_SIZE)
+                if not data:
+                    break
+                data = pending + data
+                end = data.rfind(b'\n') + 1
+                pending = data[end:]
+                if not end:
+                    continue
+                self._scan_block(data[:end], offset, line_num)
+                offset += end
+                line_num += data.count(b'\n', 0, end)
+            if offset == self.size:
+                return False
+            self.size = offset
+            self.line_count = line_num - 1
+            self.fingerprint = self._calc_fingerprint(f, offset)
+        return True
+    def get_events(self, kinds):
+        # Return a list of (kind, offset, line_num) of the given kinds
+        return [e for e in self.events if e[0] in kinds]
+    def get_stats_chunks(self, count):
+        # Split the Stats line offsets into 'count' chunks
+        stats = self.stats
+        if not stats:
+            return []
+        chunk_size = (len(stats) + count - 1) // count
+        return [stats[i:i+chunk_size]
+                for i in range(0, len(stats), chunk_size)]
+
+def load_index(logname, use_cache=True):
+    index = LogIndex(logname)
+    if use_cache:
+        index.load()
+    if index.update() and use_cache:
+        index.save()
+    return index
+
+
+######################################################################
+# Line reading
+######################################################################
+
+# Read lines from a log file opened in binary mode
+class LineReader:
+    def __init__(self, f):
+        self.f = f
+        self.line_num = 0
+    def seek(self, offset, line_num, back_lines=0):
+        # Position the reader at the start of a line (or 'back_lines'
+        # lines before it)
+        data = b""
+        start = offset
+        while back_lines and start > 0 and data.count(b'\n') <= back_lines:
+            new_start = max(0, start - 65536)
+            self.f.seek(new_start)
+            data = self.f.read(start - new_start) + data
+            start = new_start
+        lines = data.split(b'\n')[:-1]
+        if start > 0:
+            # First line is likely incomplete
+            lines = lines[1:]
+        lines = lines[-back_lines:] if back_lines else []
+        offset -= sum([len(l) + 1 for l in lines])
+        self.f.seek(offset)
+        self.line_num = line_num - len(lines) - 1
+    def readline(self):
+        # Return the next (line_num, line) or None at end of file
+        line = self.f.readline()
+        if not line:
+            return None
+        self.line_num += 1
+        return self.line_num, line.decode('utf-8', 'replace')
+
+
+######################################################################
+# Stats parsing
+######################################################################
+
+def _parse_float(val):
+    try:
+        return float(val)
+    except ValueError:
+        return NAN
+
+# Stats values stored in per-key arrays (missing values are NaN)
+class StatsColumns:
+    def __init__(self):
+        self.count = 0
+        self.columns = {}
+    def __len__(self):
+        return self.count
+    def _pad(self, col, count):
+        if len(col) < count:
+            col.extend(array.array('d', [NAN]) * (count - len(col)))
+    def add_rows(self, rows):
+        # Append a list of {name: value} dictionaries.  Consecutive rows
+        # usually have the same names, so they are converted together.
+        for names, group in itertools.groupby(rows, tuple):
+            group = list(group)
+            values = zip(*[row.values() for row in group])
+            for name, vals in zip(names, values):
+                try:
+                    vals = array.array('d', map(float, vals))
+                except ValueError:
+                    vals = array.array('d', [_parse_float(v) for v in vals])
+                col = self.columns.get(name)
+                if col is None:
+                    col = self.columns[name] = array.array('d')
+                self._pad(col, self.count)
+                col.extend(vals)
+            self.count += len(group)
+        for col in self.columns.values():
+            self._pad(col, self.count)
+    def merge(self, other):
+        for name, col in other.columns.items():
+            mycol = self.columns.get(name)
+            if mycol is None:
+                mycol = self.columns[name] = array.array('d')
+            self._pad(mycol, self.count)
+            mycol.extend(col)
+        self.count += other.count
+        for col in self.columns.values():
+            self._pad(col, self.count)
+    def get_keys(self):
+        return list(self.columns.keys())
+    def get(self, name, default=NAN):
+        # Return the values of a key (missing values replaced by default)
+        col = self.columns.get(name)
+        if col is None:
+            return array.array('d', [default]) * self.count
+        if default != default:
+            return col
+        return array.array('d', [default if v != v else v for v in col])
+
+def _parse_stats_chunk(logname, parse_func, offsets):
+    with open(logname, 'rb') as f:
+        f.seek(offsets[0])
+        data = f.read(offsets[-1] - offsets[0]) + f.readline()
+    base = offsets[0]
+    rows = []
+    for offset in offsets:
+        start = offset - base
+        end = data.find(b'\n', start)
+        if end < 0:
+            end = len(data)
+        values = parse_func(data[start:end].decode('utf-8', 'replace'))
+        if values is not None:
+            rows.append(values)
+    out = StatsColumns()
+    out.add_rows(rows)
+    return out
+
+# Parse all the Stats lines in a log.  The parse_func(line) callback
+# returns a dictionary of values for a line (or None to skip the line).
+def parse_stats(index, parse_func, processes=None, min_chunk=5000):
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    count = max(1, min(processes * 4, len(index.stats) // min_chunk))
+    chunks = index.get_stats_chunks(count)
+    func = functools.partial(_parse_stats_chunk, index.logname, parse_func)
+    if processes <= 1 or len(chunks) <= 1:
+        results = [func(c) for c in chunks]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(func, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    out = StatsColumns()
+    for res in results:
+        out.merge(res)
+    return out
@@ -4,7 +4,8 @@
 # Copyright (C) 2020-2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import sys, os, optparse, socket, select, json, errno, time, zlib
+import sys, os, optparse, socket, select, json, errno, time, zlib, struct
+import array
 
 INDEX_UPDATE_TIME = 5.0
 ClientInfo = {'program': 'motan_data_logger', 'version': 'v0.1'}
@@ -52,16 +53,188 @@ class LogWriter:
         self.file = None
         self.comp = None
 
+# Compressed JSON capture ("<prefix>.json.gz" and "<prefix>.index.gz")
+class JsonCaptureWriter:
+    def __init__(self, log_prefix):
+        self.logger = LogWriter(log_prefix + ".json.gz")
+        self.index = LogWriter(log_prefix + ".index.gz")
+    def add_msg(self, msg, raw_msg):
+        self.logger.add_data(raw_msg)
+    def add_index(self, db):
+        db['file_position'] = self.logger.flush()
+        self.index.add_data(json.dumps(db, separators=(',', ':')).encode())
+    def close(self):
+        self.logger.close()
+        self.index.close()
+
+######################################################################
+# Columnar capture format
+######################################################################
+
+# A columnar capture ("<prefix>.motan") stores the rows of each
+# subscription's "data" field in typed arrays so that readers can map
+# the file and only decode the time range they need.  The file is a
+# magic string followed by a series of records.  Each record has a
+# 16 byte header (tag, json header length, binary data length), a
+# json header (padded to 8 bytes), and the binary data.  Record types:
+#   "CHNK" - messages from one subscription (up to INDEX_UPDATE_TIME)
+#   "INDX" - a status index entry (same content as "<prefix>.index.gz")
+#   "TOCR" - table of contents of all CHNK and INDX records
+# The file ends with the offset of the TOCR record and the magic
+# string.  Index entries store the sequence number of the next
+# message in their 'file_position' field.  All binary data is little
+# endian.
+COLUMNAR_MAGIC = b"MOTANC01"
+RECORD_HEADER = struct.Struct("<4sLQ")
+TRAILER = struct.Struct("<Q8s")
+MAX_PENDING_ROWS = 100000
+
+def _is_number(v):
+    return type(v) in (int, float)
+
+# Determine the shape of the data rows in a list of messages.  Returns
+# a list with the length of each row element (0 for a scalar) or None
+# if the rows can't be stored in columns.
+def get_data_layout(msgs):
+    layout = None
+    for seq, params in msgs:
+        data = params.get('data')
+        if type(data) != list:
+            return None
+        for row in data:
+            if type(row) != list:
+                return None
+            row_layout = [len(v) if type(v) == list else 0 for v in row]
+            if layout is None:
+                layout = row_layout
+            elif row_layout != layout:
+                return None
+            for v in row:
+                if type(v) == list:
+                    if not all([_is_number(sv) for sv in v]):
+                        return None
+                elif not _is_number(v):
+                    return None
+    if not layout:
+        return None
+    return layout
+
+def flatten_rows(rows, layout):
+    if not any(layout):
+        return rows
+    out = []
+    for row in rows:
+        frow = []
+        for v, l in zip(row, layout):
+            if l:
+                frow.extend(v)
+            else:
+                frow.append(v)
+        out.append(frow)
+    return out
+
+class ColumnarCaptureWriter:
+    def __init__(self, filename):
+        self.file = open(filename, "wb")
+        self.file.write(COLUMNAR_MAGIC)
+        self.file_pos = len(COLUMNAR_MAGIC)
+        self.msg_seq = 0
+        self.pending = {}
+        self.pending_rows = 0
+        self.chunks = []
+        self.index_offsets = []
+    def _write_record(self, tag, header, data=b""):
+        hdr = json.dumps(header, separators=(',', ':')).encode()
+        hdr += b" " * (-len(hdr) % 8)
+        offset = self.file_pos
+        self.file.write(RECORD_HEADER.pack(tag, len(hdr), len(data)))
+        self.file.write(hdr)
+        self.file.write(data)
+        self.file_pos += RECORD_HEADER.size + len(hdr) + len(data)
+        return offset
+    def _write_chunk(self, sid, msgs):
+        header = {'sid': sid, 'seq': [seq for seq, params in msgs]}
+        layout = get_data_layout(msgs)
+        if layout is None:
+            header['msgs'] = [params for seq, params in msgs]
+            offset = self._write_record(b"CHNK", header)
+            self.chunks.append([sid, msgs[0][0], offset])
+            return
+        # Store message data rows in per-column arrays
+        msg_hdrs = []
+        row_counts = []
+        rows = []
+        for seq, params in msgs:
+            params = dict(params)
+            data = params.pop('data')
+            msg_hdrs.append(params)
+            row_counts.append(len(data))
+            rows.extend(data)
+        columns = []
+        data = []
+        for col in zip(*flatten_rows(rows, layout)):
+            typecode = 'd'
+            if all([type(v) == int for v in col]):
+                typecode = 'q'
+            try:
+                arr = array.array(typecode, col)
+            except OverflowError:
+                arr = array.array('d', col)
+                typecode = 'd'
+            if sys.byteorder != 'little':
+                arr.byteswap()
+            columns.append(typecode)
+            data.append(arr.tobytes())
+        header.update({'msgs': msg_hdrs, 'rows': row_counts,
+                       'layout': layout, 'columns': columns})
+        offset = self._write_record(b"CHNK", header, b"".join(data))
+        self.chunks.append([sid, msgs[0][0], offset])
+    def _flush_chunks(self):
+        for sid, msgs in sorted(self.pending.items()):
+            self._write_chunk(sid, msgs)
+        self.pending.clear()
+        self.pending_rows = 0
+    def add_msg(self, msg, raw_msg):
+        # Only subscription messages are needed by readers
+        sid = msg.get("q")
+        params = msg.get("params")
+        if sid is not None and type(params) == dict:
+            self.pending.setdefault(sid, []).append((self.msg_seq, params))
+            data = params.get('data')
+            if type(data) == list:
+                self.pending_rows += len(data)
+                if self.pending_rows >= MAX_PENDING_ROWS:
+                    self._flush_chunks()
+        self.msg_seq += 1
+    def add_index(self, db):
+        self._flush_chunks()
+        db['file_position'] = self.msg_seq
+        self.index_offsets.append(self._write_record(b"INDX", db))
+        self.file.flush()
+    def close(self):
+        self._flush_chunks()
+        toc = {'chunks': self.chunks, 'index': self.index_offsets}
+        offset = self._write_record(b"TOCR", toc)
+        self.file.write(TRAILER.pack(offset, COLUMNAR_MAGIC))
+        self.file.close()
+        self.file = None
+
+######################################################################
+# Data logging
+######################################################################
+
 class DataLogger:
-    def __init__(self, uds_filename, log_prefix):
+    def __init__(self, uds_filename, log_prefix, columnar=False):
         # IO
         self.webhook_socket = webhook_socket_create(uds_filename)
         self.poll = select.poll()
         self.poll.register(self.webhook_socket, select.POLLIN | select.POLLHUP)
         self.socket_data = b""
         # Data log
-        self.logger = LogWriter(log_prefix + ".json.gz")
-        self.index = LogWriter(log_prefix + ".index.gz")
+        if columnar:
+            self.capture = ColumnarCaptureWriter(log_prefix + ".motan")
+        else:
+            self.capture = JsonCaptureWriter(log_prefix)
         # Handlers
         self.query_handlers = {}
         self.async_handlers = {}
@@ -75,8 +248,7 @@ class DataLogger:
         sys.stderr.write(msg + "\n")
     def finish(self, msg):
         self.error(msg)
-        self.logger.close()
-        self.index.close()
+        self.capture.close()
         sys.exit(0)
     # Unix Domain Socket IO
     def send_query(self, msg_id, method, params, cb):
@@ -97,7 +269,7 @@ class DataLogger:
             except:
                 self.error("ERROR: Unable to parse line")
                 continue
-            self.logger.add_data(part)
+            self.capture.add_msg(msg, part)
             msg_q = msg.get("q")
             if msg_q is not None:
                 hdl = self.async_handlers.get(msg_q)
@@ -174,8 +346,7 @@ class DataLogger:
             return
         self.db.setdefault("subscriptions", {})[msg_id] = msg["result"]
     def flush_index(self):
-        self.db['file_position'] = self.logger.flush()
-        self.index.add_data(json.dumps(self.db, separators=(',', ':')).encode())
+        self.capture.add_index(self.db)
         self.db = {"status": {}}
     def handle_async_db(self, msg, raw_msg):
         params = msg["params"]
@@ -197,12 +368,14 @@ def nice():
 def main():
     usage = "%prog [options] <socket filename> <log name>"
     opts = optparse.OptionParser(usage)
+    opts.add_option("-c", "--columnar", action="store_true",
+                    help="write a seekable columnar capture (<log name>.motan)")
     options, args = opts.parse_args()
     if len(args) != 2:
         opts.error("Incorrect number of arguments")
 
     nice()
-    dl = DataLogger(args[0], args[1])
+    dl = DataLogger(args[0], args[1], options.columnar)
     dl.run()
 
 if __name__ == '__main__':
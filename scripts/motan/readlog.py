@@ -3,7 +3,7 @@
 # Copyright (C) 2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import json, zlib
+import sys, os, json, zlib, struct, mmap, bisect, array
 
 class error(Exception):
     pass
@@ -626,6 +626,153 @@ class JsonDispatcher:
                     self.last_read_time = pt
             for mq in self.queues.get(qid, []):
                 mq.append(json_msg['params'])
+    def seek(self, pos):
+        self.log_reader.seek(pos)
+
+# Read a columnar capture (see ColumnarCaptureWriter in data_logger.py)
+COLUMNAR_MAGIC = b"MOTANC01"
+RECORD_HEADER = struct.Struct("<4sLQ")
+TRAILER = struct.Struct("<Q8s")
+
+class ColumnarLogReader:
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+            raise error("File '%s' is not a motan capture" % (filename,))
+        # Locate the table of contents
+        toc = None
+        if len(self.mm) >= len(COLUMNAR_MAGIC) + TRAILER.size:
+            toc_offset, magic = TRAILER.unpack_from(
+                self.mm, len(self.mm) - TRAILER.size)
+            if magic == COLUMNAR_MAGIC:
+                tag, toc, data_offset = self._read_record(toc_offset)
+        if toc is None:
+            # Capture was not closed - scan the records
+            toc = self._scan_records()
+        self.chunks = {}
+        for sid, first_seq, offset in toc['chunks']:
+            self.chunks.setdefault(sid, []).append((first_seq, offset))
+        self.index_offsets = toc['index']
+    def _read_record(self, offset):
+        tag, hdr_len, data_len = RECORD_HEADER.unpack_from(self.mm, offset)
+        hdr_start = offset + RECORD_HEADER.size
+        header = json.loads(self.mm[hdr_start:hdr_start + hdr_len])
+        return tag, header, hdr_start + hdr_len
+    def _scan_records(self):
+        toc = {'chunks': [], 'index': []}
+        offset = len(COLUMNAR_MAGIC)
+        end = len(self.mm) - RECORD_HEADER.size
+        while offset <= end:
+            tag, hdr_len, data_len = RECORD_HEADER.unpack_from(self.mm, offset)
+            next_offset = offset + RECORD_HEADER.size + hdr_len + data_len
+            if next_offset > len(self.mm):
+                break
+            if tag == b"CHNK":
+                tag, header, data_offset = self._read_record(offset)
+                toc['chunks'].append([header['sid'], header['seq'][0],
+                                      offset])
+            elif tag == b"INDX":
+                toc['index'].append(offset)
+            offset = next_offset
+        return toc
+    def get_index_reader(self):
+        return ColumnarIndexReader(self)
+    def read_index(self, pos):
+        # Return the index entry at the given position (or None)
+        if pos >= len(self.index_offsets):
+            return None
+        tag, header, data_offset = self._read_record(self.index_offsets[pos])
+        return header
+    def find_chunk(self, sid, seq):
+        # Return the position of the chunk containing the given sequence
+        chunks = self.chunks.get(sid, [])
+        pos = bisect.bisect_right(chunks, (seq, float('inf'))) - 1
+        return max(0, pos)
+    def read_chunk(self, sid, pos):
+        # Return a list of (seq, params) for the given chunk (or None)
+        chunks = self.chunks.get(sid, [])
+        if pos >= len(chunks):
+            return None
+        tag, header, data_offset = self._read_record(chunks[pos][1])
+        if header.get('layout') is not None:
+            self._decode_rows(header, data_offset)
+        return list(zip(header['seq'], header['msgs']))
+    def _decode_rows(self, header, data_offset):
+        # Extract the columns and rebuild the original data rows
+        row_count = sum(header['rows'])
+        mv = memoryview(self.mm)
+        cols = []
+        for typecode in header['columns']:
+            size = row_count * 8
+            col = mv[data_offset:data_offset + size].cast(typecode)
+            if sys.byteorder != 'little':
+                col = array.array(typecode, col)
+                col.byteswap()
+            cols.append(col.tolist())
+            data_offset += size
+        parts = []
+        for l in header['layout']:
+            if l:
+                parts.append(list(zip(*cols[:l])))
+            else:
+                parts.append(cols[0])
+            cols = cols[l or 1:]
+        rows = list(zip(*parts))
+        pos = 0
+        for params, count in zip(header['msgs'], header['rows']):
+            params['data'] = rows[pos:pos + count]
+            pos += count
+
+# Provide the index entries of a columnar capture
+class ColumnarIndexReader:
+    def __init__(self, log_reader):
+        self.log_reader = log_reader
+        self.pos = 0
+    def pull_msg(self):
+        msg = self.log_reader.read_index(self.pos)
+        if msg is not None:
+            self.pos += 1
+        return msg
+
+# Provide the messages of each subscription of a columnar capture
+class ColumnarDispatcher:
+    def __init__(self, log_reader):
+        self.log_reader = log_reader
+        self.names = {}
+        self.start_seq = 0
+        self.is_eof = False
+    def check_end_of_data(self):
+        return self.is_eof and all([c['done'] for c in self.names.values()])
+    def add_handler(self, name, subscription_id):
+        self.names[name] = {'sid': subscription_id, 'chunk': None, 'msgs': [],
+                            'done': False}
+    def seek(self, pos):
+        # Only messages with a sequence number of 'pos' or later are
+        # returned to handlers that have not yet read any messages
+        self.start_seq = pos
+    def _next_chunk(self, cursor):
+        sid = cursor['sid']
+        if cursor['chunk'] is None:
+            cursor['chunk'] = self.log_reader.find_chunk(sid, self.start_seq)
+        else:
+            cursor['chunk'] += 1
+        msgs = self.log_reader.read_chunk(sid, cursor['chunk'])
+        if msgs is None:
+            return False
+        msgs = [params for seq, params in msgs if seq >= self.start_seq]
+        msgs.reverse()
+        cursor['msgs'] = msgs
+        return True
+    def pull_msg(self, req_time, name):
+        cursor = self.names[name]
+        msgs = cursor['msgs']
+        while not msgs:
+            if cursor['done'] or not self._next_chunk(cursor):
+                cursor['done'] = self.is_eof = True
+                return None
+            msgs = cursor['msgs']
+        return msgs.pop()
 
 
 ######################################################################
@@ -689,8 +836,13 @@ def list_datasets():
 class LogManager:
     error = error
     def __init__(self, log_prefix):
-        self.index_reader = JsonLogReader(log_prefix + ".index.gz")
-        self.jdispatch = JsonDispatcher(log_prefix)
+        if os.path.exists(log_prefix + ".motan"):
+            log_reader = ColumnarLogReader(log_prefix + ".motan")
+            self.index_reader = log_reader.get_index_reader()
+            self.jdispatch = ColumnarDispatcher(log_reader)
+        else:
+            self.index_reader = JsonLogReader(log_prefix + ".index.gz")
+            self.jdispatch = JsonDispatcher(log_prefix)
         self.initial_start_time = self.start_time = 0.
         self.datasets = {}
         self.initial_status = {}
@@ -727,7 +879,7 @@ class LogManager:
                 start_status.setdefault(k, {}).update(v)
             file_position = fmsg['file_position']
         if file_position:
-            self.jdispatch.log_reader.seek(file_position)
+            self.jdispatch.seek(file_position)
     def get_initial_start_time(self):
         return self.initial_start_time
     def get_start_time(self):